@@ -0,0 +1,54 @@
+import os
+import threading
+from collections import OrderedDict
+
+from transcription_cache import hash_file
+
+# The MailLoader stores every voicemail as audio_<email id>.mp3
+AUDIO_PREFIX = "audio_"
+
+
+def audio_file_name(name: str):
+    """
+    The stored file name for the fileName parameter of /audio, "audio_" and ".mp3" are added if missing.
+
+    Raises:
+        ValueError: If name is empty or could point outside the upload folder
+    """
+    if not name or name in (".", "..") or "/" in name or "\\" in name or "\x00" in name:
+        raise ValueError("invalid fileName")
+    if not name.startswith(AUDIO_PREFIX):
+        name = AUDIO_PREFIX + name
+    if not name.endswith(".mp3"):
+        name += ".mp3"
+    return name
+
+
+class ContentHashes:
+    """
+    SHA-256 of files, remembered as long as their size and mtime don't change.
+    Used as strong ETag, so a voicemail keeps its ETag across restarts and copies of the folder.
+    """
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._hashes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: str):
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            digest = self._hashes.get(key)
+            if digest is not None:
+                self._hashes.move_to_end(key)
+                return digest
+        digest = hash_file(path)
+        with self._lock:
+            self._hashes[key] = digest
+            if len(self._hashes) > self.max_entries:
+                self._hashes.popitem(last=False)
+        return digest
+
+
+content_hashes = ContentHashes()
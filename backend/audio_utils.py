@@ -0,0 +1,116 @@
+import logging
+
+# Bitrates in kbps by (MPEG version, layer) for the bitrate indices 1 to 14
+_BITRATES = {
+    (1, 1): [32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+
+# Sample rates by the version bits of the frame header (0 = MPEG 2.5, 2 = MPEG 2, 3 = MPEG 1)
+_SAMPLE_RATES = {
+    0: [11025, 12000, 8000],
+    2: [22050, 24000, 16000],
+    3: [44100, 48000, 32000],
+}
+
+
+def parse_frame_header(header: bytes):
+    """
+    Parse the 4 byte header of an MPEG audio frame.
+
+    Returns:
+        (frame_length, samples, sample_rate) or None if header isn't a valid frame header
+    """
+    if header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return None
+    version_bits = (header[1] >> 3) & 0x03
+    layer_bits = (header[1] >> 1) & 0x03
+    bitrate_index = header[2] >> 4
+    sample_rate_index = (header[2] >> 2) & 0x03
+    padding = (header[2] >> 1) & 0x01
+    if version_bits == 1 or layer_bits == 0 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    version = 1 if version_bits == 3 else 2
+    layer = 4 - layer_bits
+    bitrate = _BITRATES[(version, layer)][bitrate_index - 1] * 1000
+    sample_rate = _SAMPLE_RATES[version_bits][sample_rate_index]
+
+    if layer == 1:
+        return (12 * bitrate // sample_rate + padding) * 4, 384, sample_rate
+    if layer == 3 and version == 2:
+        return 72 * bitrate // sample_rate + padding, 576, sample_rate
+    return 144 * bitrate // sample_rate + padding, 1152, sample_rate
+
+
+class Mp3DurationScanner:
+    """
+    Computes the duration of an mp3 file from bytes fed in chunks of any size.
+
+    Walks the MPEG frame headers, so no decoder is needed and the audio never has to be in memory at once.
+    A leading ID3v2 tag is skipped, garbage between frames is skipped until the next frame sync.
+    """
+
+    def __init__(self):
+        self.duration = 0.0
+        self.frames = 0
+        self._buffer = b""
+        self._skip = 0
+        self._started = False
+
+    def feed(self, chunk: bytes):
+        """Process the next chunk of the file."""
+        buffer = self._buffer + chunk
+        pos = 0
+        while True:
+            if self._skip:
+                step = min(self._skip, len(buffer) - pos)
+                pos += step
+                self._skip -= step
+                if self._skip:
+                    break
+            if len(buffer) - pos < 10:
+                break
+
+            if not self._started and buffer[pos : pos + 3] == b"ID3":
+                # ID3v2 tag: 10 byte header with a syncsafe size, optionally followed by a footer
+                size = 0
+                for byte in buffer[pos + 6 : pos + 10]:
+                    size = (size << 7) | (byte & 0x7F)
+                footer = 10 if buffer[pos + 5] & 0x10 else 0
+                self._skip = 10 + size + footer
+                self._started = True
+                continue
+            self._started = True
+
+            frame = parse_frame_header(buffer[pos : pos + 4])
+            if frame is None or frame[0] < 4:
+                next_sync = buffer.find(b"\xff", pos + 1)
+                pos = next_sync if next_sync != -1 else len(buffer)
+                continue
+
+            frame_length, samples, sample_rate = frame
+            self.duration += samples / sample_rate
+            self.frames += 1
+            self._skip = frame_length
+        self._buffer = buffer[pos:]
+
+    def result(self):
+        """Return the duration in seconds or None if no mp3 frame was found."""
+        if not self.frames:
+            logging.debug("No MPEG audio frames found.")
+            return None
+        return self.duration
+
+
+def mp3_duration(path: str, chunk_size: int = 64 * 1024):
+    """Return the duration of the mp3 file at path in seconds or None if it isn't an mp3 file."""
+    scanner = Mp3DurationScanner()
+    with open(path, "rb") as fp:
+        for chunk in iter(lambda: fp.read(chunk_size), b""):
+            scanner.feed(chunk)
+    return scanner.result()
@@ -1,23 +1,33 @@
-import database
-import random
+"""
+Fill the database with synthetic voicemails for load tests of the database and the API.
+
+The rows are reproducible for a seed and follow the distributions of the production data:
+most voicemails are done, requests are mostly prescriptions, durations and transcripts are long
+tailed. They are bulk inserted in batches without starting the app, so neither the scheduler nor
+any Whisper model is loaded.
+
+Usage:
+    python dataGenerator.py [--rows 100000] [--seed 42] [--batch-size 5000] [--audio]
+"""
+import argparse
 import datetime
-from datetime import timedelta
-from app import app
+import math
+import os
+import random
+import time
+
+from flask import Flask
+from sqlalchemy import insert
+
+from database import Email, db, existing_email_ids, init_db, next_version
+
+STATUSES = ("bearbeitet", "unbearbeitet", "fehlgeschlagen")
+# Voicemails waiting for processing ("processed", "abfertigung") aren't generated, the workers would pick them up
+STATUS_WEIGHTS = (70, 27, 3)
+ANFRAGETYPEN = ("Rezept", "Überweisung")
+ANFRAGETYP_WEIGHTS = (65, 35)
 
-subject = ("Überweisung", "Rezept")
-satus = ("bearbeitet", "unbearbeitet")
 vorname = (
-    "Schneider",
-    "Müller",
-    "Schmidt",
-    "Anderson",
-    "Becker",
-    "Mustermann",
-    "Schweider",
-    "Obenauf",
-    "Horn",
-)
-nachname = (
     "Alexander",
     "Daniel",
     "Jonas",
@@ -29,52 +39,191 @@ nachname = (
     "Ida",
     "Maria",
 )
-nameMedikament = ("Ibuprophen", "Insulin", "Pennadeln", "Viviane Disk", "Zäpfchen")
-fachrichtung = ("Orthopäde", "HNO", "Diabetologe", "Chirurg", "Dermatologe", "Urologe")
-transkript = "Lorem ipsum dolor sit amet, consetetur sadipscing elitr, sed diam nonumy eirmod tempor invidunt ut labore et dolore magna aliquyam erat, sed diam voluptua. At vero eos et accusam et justo duo dolores et ea rebum. Stet clita kasd gubergren, no sea takimata sanctus est Lorem ipsum dolor sit amet. Lorem ipsum dolor sit amet, consetetur sadipscing elitr, sed diam nonumy eirmod tempor invidunt ut labore et dolore magna aliquyam erat, sed diam voluptua. At vero eos et accusam et justo duo dolores et ea rebum. Stet clita kasd gubergren, no sea takimata sanctus est Lorem ipsum dolor sit amet."
-
-
-def generate_phone_number():
-    country_code = "+49"
-    area_code = random.randint(100, 999)
-    number = random.randint(1000000, 9999999)
-    return f"{country_code} {area_code} {number}"
-
-
-def generateBirthdate():
-    day = str(random.randint(1, 28)).zfill(2)
-    month = str(random.randint(1, 12)).zfill(2)
-    year = random.randint(1970, 2000)
-    return str(datetime.date(year, int(month), int(day)))
-
-
-with app.app_context():
-    for id in range(1, 40):
-        anfragetyp = random.choice(subject)
-
-        database.save_email_by_parameters(
-            id=id,
-            absender="none",
-            subject="subject",
-            status="unbearbeitet",
-            empfangsdatum=datetime.datetime.now()
-            + timedelta(hours=random.randint(1, 10), minutes=random.randint(1, 60)),
-            anfragetyp=anfragetyp,
-            fileName="audioName",
-            dauer=1.0,
-            vorname=random.choice(vorname),
-            nachname=random.choice(nachname),
-            geburtsdatum=generateBirthdate(),
-            extraInformation="None",
-            nameMedikament=random.choice(nameMedikament)
-            if anfragetyp == "Rezept"
-            else "None",
-            dosis="60 mg" if anfragetyp == "Rezept" else "None",
-            fachrichtung=random.choice(fachrichtung)
-            if anfragetyp == "Überweisung"
-            else "None",
-            rating=0,
-            grundUeberweisung="None",
-            telefonnummer=generate_phone_number(),
-            transkript=transkript,
+nachname = (
+    "Schneider",
+    "Müller",
+    "Schmidt",
+    "Anderson",
+    "Becker",
+    "Mustermann",
+    "Schweider",
+    "Obenauf",
+    "Horn",
+)
+nameMedikament = ("Ibuprofen", "Insulin", "Pennadeln", "Viviane Disk", "Zäpfchen", "Metformin", "Ramipril")
+dosis = ("400 mg", "600 mg", "60 mg", "5 mg", "10 Einheiten", "1000 mg")
+fachrichtung = ("Orthopäde", "HNO", "Diabetologe", "Chirurg", "Dermatologe", "Urologe", "Kardiologe")
+grundUeberweisung = ("Rückenschmerzen", "Hörsturz", "Kontrolle", "Hautausschlag", "Nachsorge")
+
+FILLER = (
+    "Ich wollte nur kurz Bescheid geben.",
+    "Bitte rufen Sie mich zurück, falls es Fragen gibt.",
+    "Ich bin heute ab 14 Uhr wieder erreichbar.",
+    "Meine Versichertenkarte haben Sie ja schon.",
+    "Das wäre sehr nett, vielen Dank.",
+    "Ich kann es dann morgen Vormittag abholen.",
+    "Es ist leider etwas dringend.",
+)
+
+# Spoken words per second of a voicemail
+WORDS_PER_SECOND = 2.3
+TRANSKRIPT_LENGTH = Email.__table__.c.transkript.type.length
+
+# MPEG 2 Layer III, 8 kbps, 16 kHz: 36 byte frames of 576 samples, about 1 KB per second
+DUMMY_FRAME = b"\xff\xf3\x18\x00" + bytes(32)
+DUMMY_FRAME_SECONDS = 576 / 16000
+
+
+def generate_phone_number(rng):
+    area_code = rng.randint(100, 999)
+    number = rng.randint(1000000, 9999999)
+    return f"+49 {area_code} {number}"
+
+
+def generate_birthdate(rng):
+    return str(datetime.date(rng.randint(1935, 2005), rng.randint(1, 12), rng.randint(1, 28)))
+
+
+def generate_received(rng, start, days):
+    """A time in the opening hours, weekdays get most of the calls."""
+    while True:
+        day = start + datetime.timedelta(days=rng.randrange(days))
+        if day.weekday() < 5 or rng.random() < 0.15:
+            break
+    hour = min(19, max(7, int(rng.gauss(11, 3))))
+    return day.replace(hour=hour, minute=rng.randrange(60), second=rng.randrange(60))
+
+
+def generate_transkript(rng, anfragetyp, first, last, birthdate, medikament, fach, seconds):
+    """A German transcript of about WORDS_PER_SECOND * seconds words, cut to the column length."""
+    sentences = [f"Guten Tag, hier spricht {first} {last}, geboren am {birthdate}."]
+    if anfragetyp == "Rezept":
+        sentences.append(f"Ich bräuchte bitte ein neues Rezept für {medikament}.")
+    else:
+        sentences.append(f"Ich bräuchte bitte eine Überweisung zum {fach}.")
+    words = int(seconds * WORDS_PER_SECOND)
+    while sum(len(sentence.split()) for sentence in sentences) < words:
+        sentences.append(rng.choice(FILLER))
+    sentences.append("Auf Wiederhören.")
+    return " ".join(sentences)[:TRANSKRIPT_LENGTH]
+
+
+def generate_row(rng, index, seed, start, days):
+    """One Email row as a dict of its columns."""
+    anfragetyp = rng.choices(ANFRAGETYPEN, ANFRAGETYP_WEIGHTS)[0]
+    first, last = rng.choice(vorname), rng.choice(nachname)
+    birthdate = generate_birthdate(rng)
+    medikament = rng.choice(nameMedikament) if anfragetyp == "Rezept" else None
+    fach = rng.choice(fachrichtung) if anfragetyp == "Überweisung" else None
+    # Most voicemails are 10 to 40 seconds long, a few ramble on for minutes
+    seconds = round(min(180.0, max(3.0, rng.lognormvariate(math.log(20), 0.6))), 1)
+    status = rng.choices(STATUSES, STATUS_WEIGHTS)[0]
+    email_id = f"gen-{seed}-{index}@praxis.de"
+    return {
+        "id": email_id,
+        "absender": "Anrufbeantworter <voicemail@praxis.de>",
+        "subject": "Neue Sprachnachricht",
+        "status": status,
+        "empfangsdatum": generate_received(rng, start, days),
+        "anfragetyp": anfragetyp,
+        "fileName": f"audio_{email_id}.mp3",
+        "dauer": seconds,
+        "dauerOriginal": seconds,
+        "dauerGetrimmt": round(seconds * rng.uniform(0.6, 0.95), 1),
+        "vorname": first,
+        "nachname": last,
+        "geburtsdatum": birthdate,
+        "extraInformation": None,
+        "nameMedikament": medikament,
+        "dosis": rng.choice(dosis) if medikament else None,
+        "fachrichtung": fach,
+        "grundUeberweisung": rng.choice(grundUeberweisung) if fach else None,
+        "telefonnummer": generate_phone_number(rng),
+        "transkript": None
+        if status == "fehlgeschlagen"
+        else generate_transkript(rng, anfragetyp, first, last, birthdate, medikament, fach, seconds),
+        "rating": rng.choices((0, 1, 2, 3, 4, 5), (60, 2, 3, 8, 12, 15))[0] if status == "bearbeitet" else 0,
+    }
+
+
+def write_dummy_audio(path, seconds):
+    """A silent mp3 of seconds length, enough for the player and the duration scanner."""
+    with open(path, "wb") as file:
+        file.write(DUMMY_FRAME * max(1, int(seconds / DUMMY_FRAME_SECONDS)))
+
+
+def generate(rows, seed=42, batch_size=5000, audio_dir=None, days=365, start=datetime.datetime(2024, 1, 1)):
+    """
+    Insert rows synthetic emails into the database of the current app context.
+    Every batch is one bulk insert with its own version, ids which already exist (same seed) are skipped.
+
+    Parameters:
+        rows (int): Number of emails
+        seed (int): Seed of the random generator, the same seed gives the same rows
+        batch_size (int): Rows per insert and commit
+        audio_dir (str): Directory for dummy mp3 files, None writes no audio
+        days (int): The emails are spread over this many days from start
+        start (datetime): First day, fixed so the same seed gives the same dates
+
+    Returns:
+        inserted (int): Number of rows inserted
+    """
+    rng = random.Random(seed)
+    if audio_dir:
+        os.makedirs(audio_dir, exist_ok=True)
+    inserted = 0
+    for offset in range(0, rows, batch_size):
+        batch = [generate_row(rng, index, seed, start, days) for index in range(offset, min(rows, offset + batch_size))]
+        existing = existing_email_ids([row["id"] for row in batch])
+        batch = [row for row in batch if row["id"] not in existing]
+        if not batch:
+            continue
+        version = next_version(db.session)
+        for row in batch:
+            row["version"] = version
+        db.session.execute(insert(Email.__table__), batch)
+        db.session.commit()
+        inserted += len(batch)
+        if audio_dir:
+            for row in batch:
+                write_dummy_audio(os.path.join(audio_dir, row["fileName"]), row["dauer"])
+    return inserted
+
+
+def create_app(database_url):
+    """A bare Flask app for the database, without the scheduler and the models of app.py."""
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = database_url
+    init_db(app)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--days", type=int, default=365, help="spread the voicemails over this many days")
+    parser.add_argument("--start", type=datetime.datetime.fromisoformat, default=datetime.datetime(2024, 1, 1))
+    parser.add_argument("--audio", action="store_true", help="write a silent mp3 for every voicemail")
+    parser.add_argument("--audio-dir", default="tmp", help="directory for the mp3 files (default tmp, like the app)")
+    parser.add_argument("--database", default=os.getenv("DATABASE_URL", "sqlite:///site.db"))
+    args = parser.parse_args()
+
+    app = create_app(args.database)
+    started = time.perf_counter()
+    with app.app_context():
+        inserted = generate(
+            args.rows,
+            seed=args.seed,
+            batch_size=args.batch_size,
+            audio_dir=args.audio_dir if args.audio else None,
+            days=args.days,
+            start=args.start,
         )
+    elapsed = time.perf_counter() - started
+    print(f"Inserted {inserted} of {args.rows} emails in {elapsed:.1f}s ({inserted / max(elapsed, 1e-9):.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
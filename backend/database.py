@@ -1,6 +1,15 @@
 import logging
+import os
+import time
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+import base64
+import json
+import re
+from sqlalchemy import Float, String, and_, case, event, func, insert, or_, select, text, update
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects import postgresql, sqlite
+from datetime import datetime, timedelta
+from metrics import DB_COMMIT_SECONDS
 
 db = SQLAlchemy()
 
@@ -19,6 +28,9 @@ class Email(db.Model):
     anfragetyp = db.Column("anfragetyp", db.String(120))
     fileName = db.Column("fileName", db.String(120))
     dauer = db.Column("dauer", db.Float)
+    # Seconds of audio before and after the silence was trimmed for Whisper
+    dauerOriginal = db.Column("dauerOriginal", db.Float)
+    dauerGetrimmt = db.Column("dauerGetrimmt", db.Float)
     vorname = db.Column("vorname", db.String(120))
     nachname = db.Column("nachname", db.String(120))
     geburtsdatum = db.Column("geburtsdatum", db.String(120))
@@ -30,14 +42,268 @@ class Email(db.Model):
     telefonnummer = db.Column("telefonnummer", db.String(20))
     transkript = db.Column("transkript", db.String(2096))
     rating = db.Column("rating", db.Integer)
+    # Value of the ChangeCounter at the last write, see get_changes
+    version = db.Column("version", db.Integer, nullable=False, default=0, index=True)
+
+    # Indexes for the hot queries: emailCheck and unprocessed_emails filter by status,
+    # the dashboard sorts by empfangsdatum (id breaks ties for the keyset pagination)
+    # and get_email_by_filename looks up the fileName
+    __table_args__ = (
+        db.Index("ix_email_status_empfangsdatum", "status", "empfangsdatum"),
+        db.Index("ix_email_empfangsdatum_id", "empfangsdatum", "id"),
+        db.Index("ix_email_fileName", "fileName"),
+    )
+
+
+# Ids of deleted emails, so clients syncing with /changes learn about deletions
+class EmailTombstone(db.Model):
+    '''Marks an Email row as deleted at a version.'''
+    id = db.Column("id", db.String(120), primary_key=True)
+    version = db.Column("version", db.Integer, nullable=False, index=True)
+    deleted_at = db.Column("deleted_at", db.DateTime, default=datetime.utcnow)
+
+
+# Single row holding the latest version handed out to a write
+class ChangeCounter(db.Model):
+    '''Monotonic counter for the version column.'''
+    id = db.Column("id", db.Integer, primary_key=True)
+    value = db.Column("value", db.Integer, nullable=False, default=0)
+
+
+# Messages of the mailbox which were already downloaded, identified by their POP3 UIDL
+class SeenMessage(db.Model):
+    '''
+    POP3 unique ids of the messages the MailLoader already retrieved.
+    Allows the MailLoader to download only new messages.
+    '''
+    uid = db.Column("uid", db.String(120), primary_key=True)
+    email_id = db.Column("email_id", db.String(120))
+    seen_at = db.Column("seen_at", db.DateTime, default=datetime.utcnow)
+
+
+# Durable processing queue, one job per Email
+class ProcessingJob(db.Model):
+    '''
+    Processing job of an Email.
+    A worker claims a job by taking a lease on it (lease_owner, lease_expires_at). If the worker
+    dies the lease runs out and any other worker, also in another process or on another machine,
+    can claim the job again. stage tells what the job is doing, checkpoint which of the
+    CHECKPOINTS it completed, together with their outputs (audio_hash, extracted).
+    '''
+    __tablename__ = "processing_job"
+    email_id = db.Column("email_id", db.String(120), primary_key=True)
+    stage = db.Column("stage", db.String(32), nullable=False, default="queued")
+    priority = db.Column("priority", db.Integer, nullable=False, default=10)
+    attempts = db.Column("attempts", db.Integer, nullable=False, default=0)
+    lease_owner = db.Column("lease_owner", db.String(120))
+    lease_expires_at = db.Column("lease_expires_at", db.DateTime)
+    available_at = db.Column("available_at", db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column("last_error", db.String(500))
+    checkpoint = db.Column("checkpoint", db.String(32))
+    audio_hash = db.Column("audio_hash", db.String(64))
+    extracted = db.Column("extracted", db.Text)
+    created_at = db.Column("created_at", db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column("updated_at", db.DateTime, default=datetime.utcnow)
+
+    # The claim query looks for open jobs in priority order
+    __table_args__ = (
+        db.Index("ix_processing_job_claim", "stage", "priority", "created_at"),
+    )
+
+
+def next_version(session):
+    '''
+    Increment the change counter in the transaction of session and return the new value.
+    The UPDATE locks the counter until the transaction ends, so versions become visible in order.
+    '''
+    counter = ChangeCounter.__table__
+    result = session.execute(
+        update(counter).where(counter.c.id == 1).values(value=counter.c.value + 1)
+    )
+    if result.rowcount == 0:
+        session.execute(insert(counter).values(id=1, value=1))
+        return 1
+    return session.execute(select(counter.c.value).where(counter.c.id == 1)).scalar_one()
+
+
+def current_version():
+    '''Return the version of the latest write.'''
+    counter = ChangeCounter.__table__
+    value = db.session.execute(select(counter.c.value).where(counter.c.id == 1)).scalar()
+    return value or 0
+
+
+@event.listens_for(Session, "before_commit")
+def _start_commit_timer(session):
+    session.info["commit_started"] = time.perf_counter()
+
+
+@event.listens_for(Session, "after_commit")
+def _observe_commit_time(session):
+    started = session.info.pop("commit_started", None)
+    if started is not None:
+        DB_COMMIT_SECONDS.observe(time.perf_counter() - started)
+
+
+@event.listens_for(Session, "before_flush")
+def _bump_versions(session, flush_context, instances):
+    '''Give every added, changed or deleted Email of an ORM flush a new version.'''
+    changed = [
+        obj
+        for obj in list(session.new) + list(session.dirty)
+        if isinstance(obj, Email) and (obj in session.new or session.is_modified(obj))
+    ]
+    deleted = [obj for obj in session.deleted if isinstance(obj, Email)]
+    if not changed and not deleted:
+        return
+    version = next_version(session)
+    for email in changed:
+        email.version = version
+    for email in deleted:
+        session.merge(EmailTombstone(id=email.id, version=version))
+
+
+# Milliseconds a SQLite connection waits for a lock held by another writer
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "30000"))
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    '''
+    Runs for every new SQLite connection.
+    WAL lets readers continue while one thread writes, synchronous=NORMAL is durable enough
+    with WAL and saves an fsync per commit, busy_timeout makes writers wait instead of failing
+    with "database is locked".
+    '''
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+
+def engine_options(uri):
+    '''
+    Engine options for the database at uri.
+
+    The connection pool is sized for the threads which use the database at the same time:
+    the transcription and LLM workers, the scheduler and the request threads.
+    DATABASE_POOL_SIZE overrides the computed size.
+    '''
+    pool_size = int(
+        os.getenv(
+            "DATABASE_POOL_SIZE",
+            int(os.getenv("TRANSCRIPTION_WORKERS", "1"))
+            + int(os.getenv("LLM_WORKERS", "1"))
+            + 1  # scheduler
+            + int(os.getenv("DATABASE_REQUEST_THREADS", "4")),
+        )
+    )
+    if uri.startswith("sqlite") and (":memory:" in uri or uri.rstrip("/") == "sqlite:"):
+        # In-memory databases live in a single connection, there is no pool to size
+        return {}
+    options = {"pool_size": pool_size, "max_overflow": pool_size, "pool_pre_ping": True}
+    if uri.startswith("sqlite"):
+        options["connect_args"] = {"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}
+    return options
+
+
+# Full-text search over the transcript and the extracted fields, an FTS5 index on SQLite
+SEARCH_COLUMNS = ["transkript", "vorname", "nachname", "nameMedikament", "fachrichtung"]
+# bm25 weight of each of SEARCH_COLUMNS, a hit in a name counts more than one in the transcript
+SEARCH_WEIGHTS = [1.0, 4.0, 4.0, 3.0, 2.0]
+SEARCH_TRIGGERS = ["email_fts_insert", "email_fts_delete", "email_fts_update"]
+# Tables and views of the index besides the triggers, dropped and recreated together
+SEARCH_OBJECTS = ["email_fts", "email_search_key", "email_search"]
+# Ranking costs time per hit, words found in almost every transcript only rank the newest hits
+SEARCH_CANDIDATES = int(os.getenv("SEARCH_CANDIDATES", "2000"))
+
+
+def search_index_statements():
+    '''
+    SQL creating the FTS5 table email_fts and the triggers which keep it in sync with email.
+    The index stores no copy of the text, it reads it through the view email_search. Its rows are
+    keyed by email_search_key, an INTEGER PRIMARY KEY per email id: the rowids of email itself
+    aren't stable (its primary key is a string), VACUUM or a restored dump may renumber them.
+    Umlauts and accents are folded, so "muller" finds "Müller".
+    '''
+    columns = ", ".join(f'"{column}"' for column in SEARCH_COLUMNS)
+    email_columns = ", ".join(f'email."{column}"' for column in SEARCH_COLUMNS)
+    new_values = ", ".join(f'new."{column}"' for column in SEARCH_COLUMNS)
+    old_values = ", ".join(f'old."{column}"' for column in SEARCH_COLUMNS)
+    old_key = "(SELECT search_rowid FROM email_search_key WHERE email_id = old.id)"
+    new_key = "(SELECT search_rowid FROM email_search_key WHERE email_id = new.id)"
+    delete_old = (
+        f"INSERT INTO email_fts(email_fts, rowid, {columns}) VALUES ('delete', {old_key}, {old_values});"
+    )
+    insert_new = f"INSERT INTO email_fts(rowid, {columns}) VALUES ({new_key}, {new_values});"
+    return [
+        "CREATE TABLE IF NOT EXISTS email_search_key ("
+        "search_rowid INTEGER PRIMARY KEY, email_id VARCHAR(120) NOT NULL UNIQUE)",
+        f"CREATE VIEW IF NOT EXISTS email_search AS SELECT email_search_key.search_rowid, {email_columns} "
+        "FROM email_search_key JOIN email ON email.id = email_search_key.email_id",
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS email_fts USING fts5({columns}, "
+        "content='email_search', content_rowid='search_rowid', "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        "CREATE TRIGGER IF NOT EXISTS email_fts_insert AFTER INSERT ON email BEGIN "
+        f"INSERT OR IGNORE INTO email_search_key(email_id) VALUES (new.id); {insert_new} END",
+        "CREATE TRIGGER IF NOT EXISTS email_fts_delete AFTER DELETE ON email BEGIN "
+        f"{delete_old} DELETE FROM email_search_key WHERE email_id = old.id; END",
+        f"CREATE TRIGGER IF NOT EXISTS email_fts_update AFTER UPDATE OF {columns} ON email "
+        f"BEGIN {delete_old} {insert_new} END",
+        # ORDER BY rank uses the weighted bm25
+        f"INSERT INTO email_fts(email_fts, rank) VALUES ('rank', 'bm25({', '.join(map(str, SEARCH_WEIGHTS))})')",
+    ]
+
+
+def ensure_search_index(connection):
+    '''
+    Create the search index on SQLite if any part of it is missing and fill it from the email table.
+    Recreating the email table (e.g. batch_alter_table in a migration) drops the triggers, an index
+    built before email_search_key existed lacks the key table, both are rebuilt from scratch.
+    '''
+    if connection.dialect.name != "sqlite":
+        return
+    present = set(
+        connection.execute(
+            text("SELECT name FROM sqlite_master WHERE name LIKE 'email_%'")
+        ).scalars()
+    )
+    if {*SEARCH_OBJECTS, *SEARCH_TRIGGERS} <= present:
+        return
+    for trigger in SEARCH_TRIGGERS:
+        connection.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+    connection.execute(text("DROP TABLE IF EXISTS email_fts"))
+    for statement in search_index_statements():
+        connection.execute(text(statement))
+    # Keys for the emails stored while the triggers were missing, none for deleted ones
+    connection.execute(
+        text("DELETE FROM email_search_key WHERE email_id NOT IN (SELECT id FROM email)")
+    )
+    connection.execute(
+        text("INSERT OR IGNORE INTO email_search_key(email_id) SELECT id FROM email ORDER BY rowid")
+    )
+    connection.execute(text("INSERT INTO email_fts(email_fts) VALUES ('rebuild')"))
+    logging.info("Built the full-text search index.")
 
 
 # Initialize the database with the Flask app
 def init_db(app):
-    '''Initialize the database with the Flask app.'''
+    '''
+    Initialize the database with the Flask app.
+    Any SQLAlchemy URL works, SQLite databases get WAL mode and a busy timeout.
+    '''
+    uri = app.config["SQLALCHEMY_DATABASE_URI"]
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        **engine_options(uri),
+        **app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {}),
+    }
     db.init_app(app)
     with app.app_context():
+        if db.engine.dialect.name == "sqlite":
+            event.listen(db.engine, "connect", _set_sqlite_pragmas)
         db.create_all()
+        with db.engine.begin() as connection:
+            ensure_search_index(connection)
 
 
 # Function to save a new message to the database
@@ -100,34 +366,328 @@ def save_email(email):
         logging.error(f"Failed to save email {email.id}: {e}")
 
 
+def _insert_ignoring_duplicates(model, index_elements):
+    dialect = db.session.get_bind().dialect.name
+    if dialect == "sqlite":
+        return sqlite.insert(model).on_conflict_do_nothing(index_elements=index_elements)
+    if dialect == "postgresql":
+        return postgresql.insert(model).on_conflict_do_nothing(index_elements=index_elements)
+    return insert(model)
+
+
+# Function to save a batch of loaded emails to the database
+def ingest_emails(emails, status=None):
+    '''
+    Insert all emails which aren't stored yet in a single transaction.
+
+    Existing ids are looked up with one IN query, the new rows are inserted with one bulk
+    insert which ignores rows that were inserted concurrently (on conflict do nothing).
+
+    Parameters:
+        emails (list): Email objects, e.g. from MailLoader.load_emails
+        status (str): Status the new emails are stored with, defaults to their own status
+
+    Returns:
+        inserted (list): The emails which weren't in the database before
+    '''
+    batch = {}
+    for email in emails:
+        batch.setdefault(email.id, email)
+    existing = existing_email_ids(list(batch))
+    new_emails = [email for id, email in batch.items() if id not in existing]
+    for id in existing:
+        logging.info(f"Email {id} already exists. Skipping.")
+    if not new_emails:
+        return []
+
+    columns = [column.key for column in Email.__table__.columns]
+    rows = []
+    version = next_version(db.session)
+    for email in new_emails:
+        email.version = version
+        if status is not None:
+            email.status = status
+        if email.empfangsdatum is None:
+            email.empfangsdatum = datetime.utcnow()
+        rows.append({column: getattr(email, column) for column in columns})
+
+    try:
+        db.session.execute(_insert_ignoring_duplicates(Email, ["id"]), rows)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Failed to save {len(rows)} emails: {e}")
+        return []
+    logging.info(f"{len(rows)} emails saved to the database.")
+    return new_emails
+
+
+# Columns returned by the list API if no fields are requested, the transkript is only sent on request
+EMAIL_FIELDS = [column.key for column in Email.__table__.columns]
+DEFAULT_LIST_FIELDS = [field for field in EMAIL_FIELDS if field != "transkript"]
+
+# Columns the list API can sort by, NULL values sort like these defaults.
+# Without a default (keeps the index usable) NULL sorts before every value, like SQLite does
+SORT_COLUMNS = {
+    "empfangsdatum": None,
+    "dauer": 0.0,
+    "rating": 0,
+    "status": "",
+    "anfragetyp": "",
+    "nachname": "",
+}
+
+
+def _serialize_row(row):
+    '''Convert a result row to the dictionary format of the API.'''
+    result = dict(row)
+    if result.get("empfangsdatum") is not None:
+        result["empfangsdatum"] = result["empfangsdatum"].strftime("%Y-%m-%d %H:%M:%S")
+    return result
+
+
 # Function to retrieve all messages
 def get_all_emails():
     '''Function to retrieve all messages.'''
-    emails = Email.query.all()
-    return [
-        {
-            "id": email.id,
-            "absender": email.absender,
-            "subject": email.subject,
-            "status": email.status,
-            "empfangsdatum": email.empfangsdatum.strftime("%Y-%m-%d %H:%M:%S"),
-            "anfragetyp": email.anfragetyp,
-            "fileName": email.fileName,
-            "dauer": email.dauer,
-            "vorname": email.vorname,
-            "nachname": email.nachname,
-            "geburtsdatum": email.geburtsdatum,
-            "extraInformation": email.extraInformation,
-            "nameMedikament": email.nameMedikament,
-            "dosis": email.dosis,
-            "fachrichtung": email.fachrichtung,
-            "grundUeberweisung": email.grundUeberweisung,
-            "telefonnummer": email.telefonnummer,
-            "transkript": email.transkript,
-            "rating": email.rating,
-        }
-        for email in emails
-    ]
+    columns = [getattr(Email, field) for field in EMAIL_FIELDS]
+    rows = db.session.execute(select(*columns)).mappings()
+    return [_serialize_row(row) for row in rows]
+
+
+def _sort_expression(sort_field):
+    column = getattr(Email, sort_field)
+    default = SORT_COLUMNS[sort_field]
+    return column if default is None else func.coalesce(column, default)
+
+
+def _encode_cursor(sort_field, value, id):
+    if sort_field == "empfangsdatum" and value is not None:
+        value = value.isoformat()
+    return base64.urlsafe_b64encode(json.dumps([value, id]).encode()).decode()
+
+
+def _decode_cursor(sort_field, cursor):
+    try:
+        value, id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if sort_field == "empfangsdatum" and value is not None:
+            value = datetime.fromisoformat(value)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return value, id
+
+
+def _parse_date(value, end=False):
+    try:
+        date = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid date: {value}")
+    if end and len(value) == 10:
+        # A plain date includes the whole day
+        date += timedelta(days=1)
+    return date
+
+
+# Function to retrieve one page of messages
+def list_emails(
+    limit=50,
+    cursor=None,
+    sort="-empfangsdatum",
+    fields=None,
+    status=None,
+    anfragetyp=None,
+    date_from=None,
+    date_to=None,
+):
+    '''
+    Function to retrieve one page of messages with keyset pagination.
+
+    Only the requested columns are selected, no ORM objects are built. The page after the
+    returned one is selected with WHERE (sort value, id) beyond the cursor, so deep pages are
+    as cheap as the first one.
+
+    Parameters:
+        limit (int): Page size, at most 500
+        cursor (str): next_cursor of the previous page
+        sort (str): Column to sort by, prefixed with "-" for descending order
+        fields (list): Columns to return, id is always included. Defaults to all columns except transkript
+        status (list): Only return emails with one of these statuses
+        anfragetyp (list): Only return emails with one of these request types
+        date_from (str): ISO date or datetime, only emails received at or after it
+        date_to (str): ISO date or datetime, only emails received before it (plain dates include the day)
+
+    Returns:
+        page (dict): "items" with the rows and "next_cursor" (None on the last page)
+
+    Raises:
+        ValueError: If a parameter is invalid
+    '''
+    limit = int(limit)
+    if not 1 <= limit <= 500:
+        raise ValueError("limit must be between 1 and 500")
+
+    descending = sort.startswith("-")
+    sort_field = sort.lstrip("-")
+    if sort_field not in SORT_COLUMNS:
+        raise ValueError(f"Cannot sort by {sort_field}")
+
+    fields = list(fields or DEFAULT_LIST_FIELDS)
+    unknown = [field for field in fields if field not in EMAIL_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    if "id" not in fields:
+        fields.insert(0, "id")
+
+    sort_expression = _sort_expression(sort_field)
+    query = select(
+        *[getattr(Email, field) for field in fields],
+        sort_expression.label("_sort_value"),
+    )
+
+    if status:
+        query = query.where(Email.status.in_(status))
+    if anfragetyp:
+        query = query.where(Email.anfragetyp.in_(anfragetyp))
+    if date_from:
+        query = query.where(Email.empfangsdatum >= _parse_date(date_from))
+    if date_to:
+        query = query.where(Email.empfangsdatum < _parse_date(date_to, end=True))
+
+    if cursor:
+        value, id = _decode_cursor(sort_field, cursor)
+        if value is None:
+            # The previous page ended in the NULL rows, which come first ascending and last descending
+            if descending:
+                query = query.where(sort_expression.is_(None), Email.id < id)
+            else:
+                query = query.where(
+                    or_(sort_expression.is_not(None), and_(sort_expression.is_(None), Email.id > id))
+                )
+        elif descending:
+            after = [sort_expression < value, and_(sort_expression == value, Email.id < id)]
+            if SORT_COLUMNS[sort_field] is None:
+                after.append(sort_expression.is_(None))
+            query = query.where(or_(*after))
+        else:
+            query = query.where(
+                or_(sort_expression > value, and_(sort_expression == value, Email.id > id))
+            )
+
+    if descending:
+        query = query.order_by(sort_expression.desc().nulls_last(), Email.id.desc())
+    else:
+        query = query.order_by(sort_expression.asc().nulls_first(), Email.id.asc())
+
+    rows = db.session.execute(query.limit(limit + 1)).mappings().all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = _encode_cursor(sort_field, last["_sort_value"], last["id"])
+
+    items = []
+    for row in rows:
+        item = dict(row)
+        del item["_sort_value"]
+        items.append(_serialize_row(item))
+    return {"items": items, "next_cursor": next_cursor}
+
+
+def _match_query(query):
+    '''
+    Turn the text typed by the user into an FTS5 query: every word is a prefix, "quoted words"
+    a phrase, all of them must match. Operators and other syntax of FTS5 are not passed through.
+    '''
+    terms = []
+    for phrase, word in re.findall(r'"([^"]*)"|(\w+)', query):
+        if phrase:
+            words = re.findall(r"\w+", phrase)
+            if words:
+                terms.append('"' + " ".join(words) + '"')
+        else:
+            terms.append(f'"{word}"*')
+    if not terms:
+        raise ValueError("q must contain at least one word")
+    return " ".join(terms)
+
+
+def search_emails(query, limit=20, offset=0, fields=None, highlight=("<mark>", "</mark>")):
+    '''
+    Full-text search over the transkript, vorname, nachname, nameMedikament and fachrichtung.
+
+    On SQLite the hits come from the FTS5 index ranked by bm25, with the best matching passage
+    as snippet. Only the newest SEARCH_CANDIDATES hits are ranked, which are all of them unless
+    the words are in most of the transcripts. Other databases fall back to a case-insensitive LIKE over the same columns,
+    newest first, with the start of the transkript as snippet.
+
+    Parameters:
+        query (str): Words to search for, "quoted words" for a phrase
+        limit (int): Page size, at most 100
+        offset (int): Number of hits to skip, next_offset of the previous page
+        fields (list): Columns to return, id is always included. Defaults to all columns except transkript
+        highlight (tuple): Markers put around the matching words in the snippet
+
+    Returns:
+        page (dict): "items" with the rows, their "snippet" and "score" (higher is better)
+        and "next_offset" (None on the last page)
+
+    Raises:
+        ValueError: If a parameter is invalid
+    '''
+    limit = int(limit)
+    offset = int(offset)
+    if not 1 <= limit <= 100:
+        raise ValueError("limit must be between 1 and 100")
+    if offset < 0:
+        raise ValueError("offset must not be negative")
+    fields = list(fields or DEFAULT_LIST_FIELDS)
+    unknown = [field for field in fields if field not in EMAIL_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    if "id" not in fields:
+        fields.insert(0, "id")
+
+    if db.engine.dialect.name == "sqlite":
+        columns = ", ".join(f'email."{field}"' for field in fields)
+        # The inner query only touches the index, the email rows are read for the page alone.
+        # Its rowid bound keeps the newest SEARCH_CANDIDATES hits (new emails get higher search keys)
+        rows = db.session.execute(
+            text(
+                f"SELECT {columns}, hits.score, hits.snippet FROM ("
+                "SELECT rowid, -rank AS score, snippet(email_fts, -1, :open, :close, '…', 16) AS snippet "
+                "FROM email_fts WHERE email_fts MATCH :match AND rowid >= (SELECT coalesce(min(rowid), 0) FROM ("
+                "SELECT rowid FROM email_fts WHERE email_fts MATCH :match ORDER BY rowid DESC LIMIT :candidates)) "
+                "ORDER BY rank LIMIT :limit OFFSET :offset"
+                ") AS hits JOIN email_search_key ON email_search_key.search_rowid = hits.rowid "
+                "JOIN email ON email.id = email_search_key.email_id ORDER BY hits.score DESC"
+            ).columns(*[Email.__table__.c[field] for field in fields], score=Float, snippet=String),
+            {
+                "match": _match_query(query),
+                "open": highlight[0],
+                "close": highlight[1],
+                "limit": limit + 1,
+                "offset": offset,
+                "candidates": SEARCH_CANDIDATES,
+            },
+        ).mappings().all()
+    else:
+        words = re.findall(r"\w+", query)
+        if not words:
+            raise ValueError("q must contain at least one word")
+        searched = [getattr(Email, column) for column in SEARCH_COLUMNS]
+        statement = (
+            select(
+                *[getattr(Email, field) for field in fields],
+                func.substr(Email.transkript, 1, 200).label("snippet"),
+            )
+            .where(and_(*[or_(*[column.ilike(f"%{word}%") for column in searched]) for word in words]))
+            .order_by(Email.empfangsdatum.desc(), Email.id.desc())
+            .limit(limit + 1)
+            .offset(offset)
+        )
+        rows = [dict(row, score=None) for row in db.session.execute(statement).mappings()]
+
+    next_offset = offset + limit if len(rows) > limit else None
+    return {"items": [_serialize_row(row) for row in rows[:limit]], "next_offset": next_offset}
 
 
 # Function to get a specific message by fileName
@@ -138,8 +698,10 @@ def get_email_by_filename(fileName):
 
 # Delete email by id
 def delete(id):
-    '''Delete email by id.'''
-    Email.query.filter(Email.id == id).delete()
+    '''Delete email by id and leave a tombstone for /changes.'''
+    if Email.query.filter(Email.id == id).delete():
+        db.session.merge(EmailTombstone(id=id, version=next_version(db.session)))
+    ProcessingJob.query.filter(ProcessingJob.email_id == id).delete()
     db.session.commit()
 
 
@@ -152,11 +714,402 @@ def transkript(id):
 # Update a column of an Email row specified by the id
 def update_column(id, column, value):
     '''Update a column of an Email row specified by the id.'''
-    Email.query.filter(Email.id == id).update({column: value})
+    Email.query.filter(Email.id == id).update(
+        {column: value, "version": next_version(db.session)}
+    )
+    db.session.commit()
+
+
+# Return the rows changed and deleted after a version
+def get_changes(since):
+    '''
+    Return the rows changed and deleted after version since.
+
+    Parameters:
+        since (int): The version of the last sync, 0 for everything
+
+    Returns:
+        changes (dict): "version" to pass as since next time, "changed" rows and "deleted" ids
+    '''
+    # Read the version first, rows committed meanwhile are sent again next time
+    version = current_version()
+    columns = [getattr(Email, field) for field in EMAIL_FIELDS]
+    rows = db.session.execute(
+        select(*columns).where(Email.version > since).order_by(Email.version)
+    ).mappings()
+    deleted = db.session.execute(
+        select(EmailTombstone.id)
+        .where(EmailTombstone.version > since)
+        .where(~EmailTombstone.id.in_(select(Email.id)))
+    ).scalars()
+    return {
+        "version": version,
+        "changed": [_serialize_row(row) for row in rows],
+        "deleted": list(deleted),
+    }
+
+
+# Return the seen POP3 uids mapped to their email ids
+def get_seen_messages():
+    '''Return the seen POP3 uids mapped to their email ids.'''
+    return {message.uid: message.email_id for message in SeenMessage.query.all()}
+
+
+# Remember POP3 uids as downloaded
+def save_seen_messages(seen):
+    '''Remember POP3 uids as downloaded, seen maps uid to email id (or None).'''
+    for uid, email_id in seen.items():
+        db.session.merge(SeenMessage(uid=uid, email_id=email_id))
     db.session.commit()
 
 
+# Forget POP3 uids which are no longer in the mailbox
+def delete_seen_messages(uids):
+    '''Forget POP3 uids which are no longer in the mailbox.'''
+    if uids:
+        SeenMessage.query.filter(SeenMessage.uid.in_(list(uids))).delete()
+        db.session.commit()
+
+
+# Statuses of emails whose processing finished
+DONE_STATUSES = ("unbearbeitet", "bearbeitet")
+
+
+def done_file_names(file_names, chunk_size=500):
+    '''Return the subset of file_names which belong to emails whose processing finished.'''
+    file_names = list(file_names)
+    done = set()
+    # Chunked to stay below the bound parameter limit of SQLite
+    for start in range(0, len(file_names), chunk_size):
+        chunk = file_names[start : start + chunk_size]
+        done.update(
+            row[0]
+            for row in db.session.query(Email.fileName)
+            .filter(Email.fileName.in_(chunk), Email.status.in_(DONE_STATUSES))
+            .all()
+        )
+    return done
+
+
+# Return which of the given ids are already stored
+def existing_email_ids(ids):
+    '''Return the subset of ids which already exist in the Email table.'''
+    ids = [id for id in ids if id]
+    if not ids:
+        return set()
+    return {
+        row[0] for row in db.session.query(Email.id).filter(Email.id.in_(ids)).all()
+    }
+
+
 # Return unprocessed Mails to begin processing
 def unprocessed_emails():
     '''Return unprocessed Mails to begin processing.'''
     return Email.query.filter_by(status="unbearbeitet")
+
+
+# Stages of a ProcessingJob, jobs in the open stages still have work to do
+JOB_QUEUED = "queued"
+JOB_TRANSCRIBING = "transcribing"
+JOB_EXTRACTING = "extracting"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+OPEN_JOB_STAGES = (JOB_QUEUED, JOB_TRANSCRIBING, JOB_EXTRACTING)
+
+# Pipeline steps in order, a job records the last one it completed as its checkpoint
+CHECKPOINTS = ("downloaded", "decoded", "transcribed", "extracted", "stored")
+
+
+def checkpoint_reached(checkpoint, step):
+    '''Return True if a job at checkpoint has already completed step.'''
+    if checkpoint is None:
+        return False
+    return CHECKPOINTS.index(checkpoint) >= CHECKPOINTS.index(step)
+
+
+def _claimable(job, now, max_attempts):
+    # Open, due, not exhausted and not leased by a living worker
+    return and_(
+        job.c.stage.in_(OPEN_JOB_STAGES),
+        job.c.available_at <= now,
+        job.c.attempts < max_attempts,
+        or_(job.c.lease_expires_at.is_(None), job.c.lease_expires_at < now),
+    )
+
+
+# Create jobs for the emails waiting for processing
+def enqueue_waiting_emails(priority=10):
+    '''
+    Insert a job for every Email with the status "processed" or "abfertigung" which has none yet.
+    Covers the emails stored by emailCheck as well as rows left behind by a version without the jobs table.
+
+    Returns:
+        ids (list): Ids of the emails which got a job
+    '''
+    ids = db.session.execute(
+        select(Email.id).where(
+            Email.status.in_(["processed", "abfertigung"]),
+            ~select(ProcessingJob.email_id).where(ProcessingJob.email_id == Email.id).exists(),
+        )
+    ).scalars().all()
+    if ids:
+        now = datetime.utcnow()
+        rows = [
+            {
+                "email_id": id,
+                "stage": JOB_QUEUED,
+                "priority": priority,
+                "attempts": 0,
+                "available_at": now,
+                "created_at": now,
+                "updated_at": now,
+            }
+            for id in ids
+        ]
+        db.session.execute(_insert_ignoring_duplicates(ProcessingJob, ["email_id"]), rows)
+    db.session.commit()
+    return ids
+
+
+# Queue an email (again), e.g. for /reprocess
+def requeue_job(email_id, priority=10):
+    '''
+    Reset the job of the email to "queued", or create it.
+    An unfinished job resumes at its first incomplete step. A finished job keeps only the
+    downloaded and decoded audio, so it is transcribed (the transcription cache answers if the
+    model didn't change) and extracted again.
+
+    Returns:
+        queued (bool): False if a worker currently holds a lease on the job
+    '''
+    job = ProcessingJob.__table__
+    now = datetime.utcnow()
+    result = db.session.execute(
+        update(job)
+        .where(
+            job.c.email_id == email_id,
+            or_(job.c.lease_expires_at.is_(None), job.c.lease_expires_at < now),
+        )
+        .values(
+            stage=JOB_QUEUED,
+            priority=priority,
+            attempts=0,
+            lease_owner=None,
+            lease_expires_at=None,
+            available_at=now,
+            last_error=None,
+            updated_at=now,
+            checkpoint=case(
+                (
+                    job.c.stage == JOB_DONE,
+                    case((job.c.audio_hash.is_(None), None), else_="decoded"),
+                ),
+                else_=job.c.checkpoint,
+            ),
+        )
+    )
+    if result.rowcount == 0:
+        if db.session.get(ProcessingJob, email_id) is not None:
+            db.session.rollback()
+            return False
+        db.session.add(ProcessingJob(email_id=email_id, priority=priority, available_at=now))
+    db.session.commit()
+    return True
+
+
+# Atomically take leases on the next jobs
+def claim_jobs(owner, limit, lease_seconds, max_attempts):
+    '''
+    Claim up to limit open jobs for owner, most urgent first.
+
+    A single UPDATE ... WHERE <lease free or expired> ... RETURNING takes the leases, so two
+    workers never claim the same job, also not across processes or machines. Jobs with an
+    expired lease are claimed again, each claim counts as an attempt.
+
+    Returns:
+        jobs (list): (email_id, priority) of the claimed jobs
+    '''
+    if limit <= 0:
+        return []
+    job = ProcessingJob.__table__
+    now = datetime.utcnow()
+    claimable = _claimable(job, now, max_attempts)
+    candidates = (
+        select(job.c.email_id)
+        .where(claimable)
+        .order_by(job.c.priority, job.c.created_at)
+        .limit(limit)
+    )
+    bind = db.session.get_bind()
+    if bind.dialect.name == "postgresql":
+        candidates = candidates.with_for_update(skip_locked=True)
+    values = {
+        "lease_owner": owner,
+        "lease_expires_at": now + timedelta(seconds=lease_seconds),
+        "attempts": job.c.attempts + 1,
+        "updated_at": now,
+    }
+    if bind.dialect.update_returning:
+        claimed = db.session.execute(
+            update(job)
+            .where(job.c.email_id.in_(candidates), claimable)
+            .values(**values)
+            .returning(job.c.email_id, job.c.priority, job.c.created_at)
+        ).all()
+    else:
+        claimed = []
+        for email_id in db.session.execute(candidates).scalars().all():
+            statement = update(job).where(job.c.email_id == email_id, claimable).values(**values)
+            if db.session.execute(statement).rowcount:
+                row = db.session.get(ProcessingJob, email_id)
+                claimed.append((email_id, row.priority, row.created_at))
+    db.session.commit()
+    return [(email_id, priority) for email_id, priority, _ in sorted(claimed, key=lambda row: (row[1], row[2]))]
+
+
+# Extend the lease of a job and record its stage
+def renew_lease(email_id, owner, lease_seconds, stage=None):
+    '''
+    Returns:
+        owned (bool): False if the lease expired and another worker claimed the job in the meantime
+    '''
+    job = ProcessingJob.__table__
+    now = datetime.utcnow()
+    values = {"lease_expires_at": now + timedelta(seconds=lease_seconds), "updated_at": now}
+    if stage is not None:
+        values["stage"] = stage
+    result = db.session.execute(
+        update(job)
+        .where(job.c.email_id == email_id, job.c.lease_owner == owner, job.c.stage.in_(OPEN_JOB_STAGES))
+        .values(**values)
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+
+# Return the job of an email
+def get_job(email_id):
+    '''Return the ProcessingJob of the email or None.'''
+    return db.session.get(ProcessingJob, email_id)
+
+
+# Commit the output of a pipeline step
+def save_checkpoint(email_id, owner, checkpoint, lease_seconds, **outputs):
+    '''
+    Record that the job completed checkpoint and store its outputs (audio_hash, extracted).
+    Changes to the Email which are pending in the session, e.g. the transkript, are committed
+    in the same transaction. Completing a step starts a new round of attempts for the next one.
+
+    Returns:
+        owned (bool): False if the job was claimed by another worker in the meantime
+    '''
+    job = ProcessingJob.__table__
+    now = datetime.utcnow()
+    result = db.session.execute(
+        update(job)
+        .where(job.c.email_id == email_id, job.c.lease_owner == owner)
+        .values(
+            checkpoint=checkpoint,
+            attempts=1,
+            last_error=None,
+            lease_expires_at=now + timedelta(seconds=lease_seconds),
+            updated_at=now,
+            **outputs,
+        )
+    )
+    if result.rowcount == 0:
+        db.session.rollback()
+        return False
+    db.session.commit()
+    return True
+
+
+# Give a claimed job back without finishing it
+def release_job(email_id, owner, error=None, delay=0, count_attempt=False):
+    '''
+    Drop the lease so the job can be claimed again after delay seconds.
+    Unless count_attempt is set the claim doesn't count as an attempt, e.g. when the job never started.
+    '''
+    job = ProcessingJob.__table__
+    now = datetime.utcnow()
+    values = {
+        "stage": JOB_QUEUED,
+        "lease_owner": None,
+        "lease_expires_at": None,
+        "available_at": now + timedelta(seconds=delay),
+        "updated_at": now,
+    }
+    if error is not None:
+        values["last_error"] = str(error)[:500]
+    if not count_attempt:
+        values["attempts"] = job.c.attempts - 1
+    db.session.execute(
+        update(job).where(job.c.email_id == email_id, job.c.lease_owner == owner).values(**values)
+    )
+    db.session.commit()
+
+
+# Mark a job as done or failed
+def finish_job(email_id, owner, stage=JOB_DONE, error=None):
+    '''Close the job of owner with stage "done" or "failed" and drop the lease.'''
+    job = ProcessingJob.__table__
+    values = {
+        "stage": stage,
+        "lease_owner": None,
+        "lease_expires_at": None,
+        "updated_at": datetime.utcnow(),
+    }
+    if stage == JOB_DONE:
+        values["checkpoint"] = CHECKPOINTS[-1]
+    if error is not None:
+        values["last_error"] = str(error)[:500]
+    db.session.execute(
+        update(job).where(job.c.email_id == email_id, job.c.lease_owner == owner).values(**values)
+    )
+    db.session.commit()
+
+
+# Clean up after workers which died while holding a lease
+def reclaim_expired_jobs(max_attempts):
+    '''
+    Release the jobs whose lease expired. Their emails go back to "processed" so they don't
+    stay in "abfertigung", jobs which used up max_attempts fail and their email is marked "fehlgeschlagen".
+
+    Returns:
+        emails (list): The Email rows whose status changed
+    '''
+    now = datetime.utcnow()
+    expired = ProcessingJob.query.filter(
+        ProcessingJob.stage.in_(OPEN_JOB_STAGES),
+        ProcessingJob.lease_expires_at.isnot(None),
+        ProcessingJob.lease_expires_at < now,
+    ).all()
+    changed = []
+    for job in expired:
+        exhausted = job.attempts >= max_attempts
+        logging.warning(
+            f"Lease of {job.lease_owner} on email {job.email_id} expired in stage {job.stage} "
+            f"after {job.attempts} attempts{', giving up' if exhausted else ''}."
+        )
+        job.lease_owner = None
+        job.lease_expires_at = None
+        job.updated_at = now
+        if exhausted:
+            job.stage = JOB_FAILED
+            job.last_error = "lease expired"
+        email = db.session.get(Email, job.email_id)
+        status = "fehlgeschlagen" if exhausted else "processed"
+        if email is not None and email.status != status:
+            email.status = status
+            changed.append(email)
+    db.session.commit()
+    return changed
+
+
+# Number of jobs per stage
+def job_counts():
+    '''Return the number of processing jobs per stage.'''
+    rows = db.session.execute(
+        select(ProcessingJob.stage, func.count()).group_by(ProcessingJob.stage)
+    ).all()
+    return {stage: count for stage, count in rows}
@@ -1,9 +1,20 @@
 import poplib
 import email
+import email.policy
 import os
+from email.parser import BytesHeaderParser
+from email.utils import parseaddr
 from dotenv import load_dotenv
 
-from database import Email
+from mail_stream import StreamingMessageParser, retr_lines
+from metrics import POP3_CONNECT_SECONDS, POP3_RETRIEVE_SECONDS
+from database import (
+    Email,
+    get_seen_messages,
+    save_seen_messages,
+    delete_seen_messages,
+    existing_email_ids,
+)
 from datetime import datetime
 
 load_dotenv(dotenv_path="LogInData.env")
@@ -15,121 +26,269 @@ config = {
     "PASSWORD": os.getenv("PASSWORD"),
 }
 
+# Optional settings, checked separately from the required login data above
+options = {
+    "SSL": os.getenv("MAIL_SSL", "true"),
+    "DELETE_AFTER_INGEST": os.getenv("MAIL_DELETE_AFTER_INGEST", "false"),
+    # Comma separated allow-lists, empty allows everything
+    "ALLOWED_SENDERS": os.getenv("MAIL_ALLOWED_SENDERS", ""),
+    "ALLOWED_SUBJECTS": os.getenv("MAIL_ALLOWED_SUBJECTS", ""),
+}
+
 
 class MailLoader:
     """
     The Class responsible for the Connection and download of Emails from the Email Account which receives the answering machine audiofiles.
     It's necessary to set the mail_server, port, the email-adress and the Passwort in the "/tmp/LogInData.env" file to allow the Programm to work as intended.
+    Set MAIL_SSL=false for a plain POP3 connection and MAIL_DELETE_AFTER_INGEST=true to remove stored messages from the mailbox.
+    MAIL_ALLOWED_SENDERS (addresses or "@domain") and MAIL_ALLOWED_SUBJECTS (parts of the subject) restrict which messages get downloaded.
     """
 
-    def __init__(self):
-        self.savedir = "tmp/"
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        if not all(config.values()):
+    def __init__(self, mail_config=None, savedir="tmp/"):
+        """
+        Parameters:
+            mail_config (dict): Overrides the values loaded from LogInData.env
+            savedir (str): Folder the audio files are saved to
+        """
+        self.savedir = savedir
+        self.mail_config = {**config, **options, **(mail_config or {})}
+        if not all(self.mail_config[key] for key in config):
             raise ValueError("Missing required mail configuration in LogInData.env")
-        self.connection = poplib.POP3_SSL(config["MAIL_SERVER"], int(config["PORT"]))
-        self.connection.user(config["USER_MAIL"])
-        self.connection.pass_(config["PASSWORD"])
+        self.delete_after_ingest = _is_true(
+            self.mail_config.get("DELETE_AFTER_INGEST", "false")
+        )
+        self.allowed_senders = _split_list(self.mail_config.get("ALLOWED_SENDERS"))
+        self.allowed_subjects = _split_list(self.mail_config.get("ALLOWED_SUBJECTS"))
+        self.stats = {}
+        # Hash, size and duration of the saved audio files by email id
+        self.attachments = {}
+        self.uidl_supported = True
+        with POP3_CONNECT_SECONDS.time():
+            if _is_true(self.mail_config.get("SSL", "true")):
+                self.connection = poplib.POP3_SSL(
+                    self.mail_config["MAIL_SERVER"], int(self.mail_config["PORT"])
+                )
+            else:
+                self.connection = poplib.POP3(
+                    self.mail_config["MAIL_SERVER"], int(self.mail_config["PORT"])
+                )
+            self.connection.user(self.mail_config["USER_MAIL"])
+            self.connection.pass_(self.mail_config["PASSWORD"])
 
     def load_emails(self):
         """
-        Loads the emails from the Email Account specified in the "/tmp/LogInData.env" file.
+        Loads the new emails from the Email Account specified in the "/tmp/LogInData.env" file.
         It's necessary to set the mail_server, port, the email-adress and the Passwort to allow the Programm to work as intended.
         The Actual loading is done via the POP3 protocoll by the poplib libarary. This allows the connection and returns a bitstream with all the relevant Emails in that account.
+        Only messages whose UIDL isn't in the SeenMessage table get retrieved, so it has to be called inside an app context.
+        The new UIDs are only remembered by save_seen, after the emails were stored.
+        With delete_after_ingest, messages retrieved in an earlier run whose Email row exists get deleted from the mailbox.
 
         Parameters:
             self: The class MailLoader which gives the function the necessary Log In Data. This has to be set manually once at the first initial setup in the aforementioned "/tmp/LogInData.env" file.
 
         Returns:
             emailList: A list of the Email Objects which make up the SQL-Alchemy Database. At this point only the ID, date_received, subject, sender and the filename of the audio get saved. Other Information gets processed by the LLM_Manager.
+            newly_seen (dict): The retrieved and skipped UIDs mapped to their email id (None if nothing is stored for them), for save_seen
+        """
+        mailbox = self._list_uids()
+        seen = get_seen_messages() if self.uidl_supported else {}
+        new_messages = [(num, uid) for num, uid in mailbox if uid not in seen]
+        self.stats = {
+            "total": len(mailbox),
+            "new": len(new_messages),
+            "retrieved": 0,
+            "skipped": 0,
+            "deleted": 0,
+        }
+        print(
+            "{0} emails in the inbox, {1} new".format(len(mailbox), len(new_messages))
+        )
+
+        emailList = []
+        newly_seen = {}
+        for num, uid in new_messages:
+            if not self._is_allowed(num):
+                # Remembered as seen, so the headers aren't fetched again next time
+                newly_seen[uid] = None
+                self.stats["skipped"] += 1
+                continue
+            mail = self._ingest_message(num)
+            self.stats["retrieved"] += 1
+            newly_seen[uid] = mail.id if mail else None
+            if mail:
+                emailList.append(mail)
 
+        if self.uidl_supported:
+            if self.delete_after_ingest:
+                self._delete_ingested(mailbox, seen)
 
+            # UIDs which vanished from the mailbox don't need to be remembered anymore
+            current_uids = {uid for _, uid in mailbox}
+            delete_seen_messages([uid for uid in seen if uid not in current_uids])
+        else:
+            newly_seen = {}
+
+        self.connection.quit()
+        print(f"Mail sync: {self.stats}")
+        return emailList, newly_seen
+
+    def save_seen(self, newly_seen):
         """
-        emails, total_bytes = self.connection.stat()
-        print("{0} emails in the inbox, {1} bytes total".format(emails, total_bytes))
-        emailList = []
+        Remember the UIDs returned by load_emails once the emails are stored (e.g. by ingest_emails).
+        UIDs whose Email row is missing, because storing it failed, are retrieved again next time.
+        """
+        stored = existing_email_ids([id for id in newly_seen.values() if id])
+        save_seen_messages(
+            {uid: id for uid, id in newly_seen.items() if id is None or id in stored}
+        )
 
-        for i in range(emails):
-            response = self.connection.retr(i + 1)
-            raw_message = response[1]
-            str_message = email.message_from_bytes(b"\n".join(raw_message))
-
-            idraw = str_message["Message-ID"]
-            emailId = idraw.split("<", 1)[1].split(">")[0]
-            senderraw = str_message["From"]
-            # TODO NUR WENN HIER AUCH < contains
-            absender = senderraw
-            if "<" in senderraw:
-                absender = senderraw.split("<", 1)[1].split(">")[0]
-            dateraw = str_message["Date"]
-            try:
-                dateraw = dateraw.replace(" (PST)", "")
-            except ValueError as ve:
-                print(ve)
+    def _list_uids(self):
+        """Return (message number, uid) of every message in the mailbox."""
+        self.uidl_supported = True
+        try:
+            response = self.connection.uidl()
+        except poplib.error_proto as e:
+            # Without UIDL support every message counts as new and no sync state is kept
+            print(f"UIDL not supported, loading all messages: {e}")
+            self.uidl_supported = False
+            count, _ = self.connection.stat()
+            return [(i + 1, str(i + 1)) for i in range(count)]
+        mailbox = []
+        for line in response[1]:
+            num, uid = line.decode().split(" ", 1)
+            mailbox.append((int(num), uid))
+        return mailbox
+
+    def _is_allowed(self, num):
+        """
+        Checks sender and subject against the allow-lists.
+        Only the headers are fetched (TOP num 0), so filtered messages are never downloaded.
+        """
+        if not self.allowed_senders and not self.allowed_subjects:
+            return True
+        response = self.connection.top(num, 0)
+        headers = BytesHeaderParser(policy=email.policy.default).parsebytes(
+            b"\n".join(response[1])
+        )
+        sender = parseaddr(str(headers.get("From", "")))[1].lower()
+        subject = str(headers.get("Subject", "")).lower()
+
+        if self.allowed_senders and not any(
+            sender == allowed or (allowed.startswith("@") and sender.endswith(allowed))
+            for allowed in self.allowed_senders
+        ):
+            print(f"Skipping message {num} from {sender}")
+            return False
+        if self.allowed_subjects and not any(
+            allowed in subject for allowed in self.allowed_subjects
+        ):
+            print(f"Skipping message {num} with subject {subject}")
+            return False
+        return True
+
+    def _delete_ingested(self, mailbox, seen):
+        """Delete messages from an earlier run whose Email row is stored, applied by QUIT."""
+        stored = existing_email_ids(
+            [seen[uid] for _, uid in mailbox if seen.get(uid)]
+        )
+        for num, uid in mailbox:
+            if uid in seen and seen[uid] in stored:
+                self.connection.dele(num)
+                self.stats["deleted"] += 1
+
+    def _ingest_message(self, num):
+        """
+        Streams message num from the server and saves its audio attachment.
+        The attachment is decoded in chunks straight into the file, the message is never held in memory as a whole.
+
+        Returns:
+            mail (Email or None): The Email object or None if the message can't be used
+        """
+        info = {}
+
+        def on_headers(headers):
+            info.update(self._parse_headers(headers) or {})
+            if not info:
+                return None  # drain the message without saving anything
+            # rename the file to "audio_<email_id>.mp3"
+            return os.path.join(self.savedir, f"audio_{info['id']}.mp3")
+
+        parser = StreamingMessageParser(on_headers)
+        with POP3_RETRIEVE_SECONDS.time():
+            parser.parse(retr_lines(self.connection, num))
+        if not info:
+            return None
+
+        emailId = info["id"]
+        audioName = ""
+        phonenumber = "0"
+        dauer = 1.0
+        if parser.attachment:
+            fileName = parser.fileName
             try:
-                print(dateraw)
-                date = datetime.strptime(dateraw, "%a, %d %b %Y %H:%M:%S %z")
-            except ValueError as ve:
-                print(f"Date parsing error for email ID {emailId}: {ve}")
-                continue
-            subject = str_message["Subject"]
-            audioName = ""
-
-            # Saving the audiofile
-            for part in str_message.walk():
-                if part.get_content_maintype() == "multipart":
-                    continue
-                if part.get("Content-Disposition") is None:
-                    continue
-
-                fileName = part.get_filename()
-                phonenumber = "0"
-                try:
-                    phonenumber = fileName.split("-")[0]
-                except:
-                    print("Keine Telefonnummer")
-
-                if not fileName:
-                    continue  # skip if no filename is found
-
-                # rename the file to "audio_<email_id>.mp3"
-                new_file_name = f"audio_{emailId}.mp3"
-                audio_path = os.path.join(self.savedir, new_file_name)
-
-                with open(audio_path, "wb") as fp:
-                    print(f"Saving audio file: {new_file_name}")
-                    fp.write(part.get_payload(decode=1))
-
-                audioName = new_file_name  # update the audioName with the renamed file
-
-            # Creation of Email Object with already known Data and saving in return list
-
-            # TODO: uncomment and type your subject / absender
-            # if subject != "type your subject" or absender != "your absender":
-            #     continue
-
-            mail = Email(
-                id=emailId,
-                absender=absender,
-                subject=subject,
-                status="unbearbeitet",
-                empfangsdatum=date,
-                anfragetyp="None",
-                fileName=audioName,
-                dauer=1.0,
-                vorname="None",
-                nachname="None",
-                geburtsdatum="None",
-                extraInformation="None",
-                nameMedikament="None",
-                dosis="None",
-                fachrichtung="None",
-                grundUeberweisung="None",
-                telefonnummer=phonenumber,
-                transkript="None",
-                rating=0,
-            )
-            emailList.append(mail)
+                phonenumber = fileName.split("-")[0]
+            except:
+                print("Keine Telefonnummer")
+            audioName = f"audio_{emailId}.mp3"
+            self.attachments[emailId] = parser.attachment
+            print(f"Saved audio file: {audioName} {parser.attachment}")
+            if parser.attachment["duration"]:
+                dauer = parser.attachment["duration"]
 
-        self.connection.quit()
-        return emailList
+        # Creation of Email Object with already known Data
+        return Email(
+            id=emailId,
+            absender=info["absender"],
+            subject=info["subject"],
+            status="unbearbeitet",
+            empfangsdatum=info["date"],
+            anfragetyp="None",
+            fileName=audioName,
+            dauer=dauer,
+            vorname="None",
+            nachname="None",
+            geburtsdatum="None",
+            extraInformation="None",
+            nameMedikament="None",
+            dosis="None",
+            fachrichtung="None",
+            grundUeberweisung="None",
+            telefonnummer=phonenumber,
+            transkript="None",
+            rating=0,
+        )
+
+    def _parse_headers(self, str_message):
+        """Returns id, absender, date and subject of a message or None if the date can't be parsed."""
+        idraw = str_message["Message-ID"]
+        emailId = idraw.split("<", 1)[1].split(">")[0]
+        senderraw = str_message["From"]
+        absender = senderraw
+        if "<" in senderraw:
+            absender = senderraw.split("<", 1)[1].split(">")[0]
+        dateraw = str_message["Date"]
+        try:
+            dateraw = dateraw.replace(" (PST)", "")
+        except ValueError as ve:
+            print(ve)
+        try:
+            print(dateraw)
+            date = datetime.strptime(dateraw, "%a, %d %b %Y %H:%M:%S %z")
+        except ValueError as ve:
+            print(f"Date parsing error for email ID {emailId}: {ve}")
+            return None
+        return {
+            "id": emailId,
+            "absender": absender,
+            "date": date,
+            "subject": str_message["Subject"],
+        }
+
+
+def _is_true(value):
+    return str(value).lower() in ("1", "true", "yes")
+
+
+def _split_list(value):
+    return [item.strip().lower() for item in (value or "").split(",") if item.strip()]
@@ -0,0 +1,105 @@
+import itertools
+import json
+import logging
+import queue
+import threading
+from collections import deque
+
+
+class Event:
+    """A server-sent event with an increasing id."""
+
+    def __init__(self, id: int, type: str, data: dict):
+        self.id = id
+        self.type = type
+        self.data = data
+
+    def encode(self):
+        """Format the event for a text/event-stream response."""
+        return f"id: {self.id}\nevent: {self.type}\ndata: {json.dumps(self.data)}\n\n"
+
+
+class Subscription:
+    """Bounded queue of the events for one client."""
+
+    def __init__(self, max_queue_size: int):
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.closed = False
+
+    def get(self, timeout: float = None):
+        """
+        Wait for the next event.
+
+        Returns:
+            event (Event or None): None if no event arrived within timeout or the subscription was closed
+        """
+        if self.closed:
+            return None
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class EventBroker:
+    """
+    In-process publish/subscribe fan-out for status updates.
+
+    Publishing puts the event into the queue of every subscriber, so serving a client only means
+    waiting on its queue instead of polling the database. A subscriber that falls behind so far that
+    its queue is full gets closed, it can reconnect with Last-Event-ID and gets the missed events
+    replayed from the history of the latest events.
+    """
+
+    def __init__(self, max_queue_size: int = 100, history_size: int = 256):
+        self.max_queue_size = max_queue_size
+        self._subscribers = set()
+        self._history = deque(maxlen=history_size)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def publish(self, type: str, data: dict):
+        """Send an event to all subscribers."""
+        with self._lock:
+            event = Event(next(self._ids), type, data)
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(event)
+            except queue.Full:
+                logging.warning("Event subscriber is too slow, closing it.")
+                subscription.closed = True
+                self.unsubscribe(subscription)
+        return event
+
+    def subscribe(self, last_event_id=None):
+        """
+        Register a new subscriber.
+
+        Parameters:
+            last_event_id (int): Id of the last event the client received, newer events from the history are queued again
+
+        Returns:
+            subscription (Subscription)
+        """
+        subscription = Subscription(self.max_queue_size)
+        with self._lock:
+            if last_event_id is not None:
+                for event in self._history:
+                    if event.id > last_event_id and not subscription.queue.full():
+                        subscription.queue.put_nowait(event)
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+
+# Broker shared by the app and the LLM_Manager
+broker = EventBroker()
@@ -1,13 +1,16 @@
-import subprocess
 import logging
 import json
+import time
+from llm_client import LLMClientError, get_default_client
+from metrics import LLM_JSON_PARSE_FAILURES, LLM_REQUEST_SECONDS
 
 
-def run_llm(transcription: str):
+def run_llm(transcription: str, client=None, timeout: float = None):
     """
     Run the LLM model using Ollama to extract structured information from a given transcription.
 
-    This function interacts with a locally running LLM (e.g., Mistral) using the `ollama` command-line interface.
+    This function interacts with a locally running LLM (e.g., Mistral) through an LLM client, by default the
+    pooled Ollama HTTP client with the `ollama` command-line interface as fallback (see llm_client.py).
     It sends a prompt formatted to extract specific information from the transcription and expects the response in JSON format.
 
     Parameters:
@@ -15,6 +18,10 @@ def run_llm(transcription: str):
     transcription : str
         The transcription text from which structured information needs to be extracted.
         This is typically a voicemail transcription or similar free-text input.
+    client : optional
+        Object with a generate(prompt, timeout) method, defaults to llm_client.get_default_client().
+    timeout : float, optional
+        Seconds to wait for the LLM, defaults to the timeout of the client.
 
     Returns:
     -------
@@ -30,7 +37,7 @@ def run_llm(transcription: str):
         - "extraInformation": Any additional information extracted.
         - "geburtsdatum": Date of birth.
 
-        Returns `None` if an error occurs (e.g., JSON parsing fails, the subprocess encounters an error, or the command times out).
+        Returns `None` if an error occurs (e.g., JSON parsing fails, the LLM can't be reached, or the request times out).
     """
     try:
         formatted_prompt = (
@@ -42,25 +49,16 @@ def run_llm(transcription: str):
 
         logging.debug(f"Running LLM with prompt: {formatted_prompt}")
 
-        # TODO: fix, return back LLM or tinyllama
-        cmd = ["ollama", "run", "mistral"]
-        result = subprocess.run(
-            cmd,
-            input=formatted_prompt,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            timeout=360,
-        )
-
-        logging.debug(f"LLM stdout: {result.stdout}")
-        logging.debug(f"LLM stderr: {result.stderr}")
+        if client is None:
+            client = get_default_client()
 
-        if result.returncode != 0:
-            logging.error(f"LLM returned an error: {result.stderr}")
-            return None
-
-        output = result.stdout.strip()
+        start_time = time.perf_counter()
+        try:
+            output = client.generate(formatted_prompt, timeout=timeout).strip()
+        except Exception:
+            LLM_REQUEST_SECONDS.observe(time.perf_counter() - start_time, outcome="error")
+            raise
+        LLM_REQUEST_SECONDS.observe(time.perf_counter() - start_time, outcome="ok")
 
         # attempt to parse the JSON output
         try:
@@ -68,11 +66,12 @@ def run_llm(transcription: str):
             logging.debug(f"Extracted data: {extracted_data}")
             return extracted_data
         except json.JSONDecodeError as e:
+            LLM_JSON_PARSE_FAILURES.inc()
             logging.error(f"Failed to parse JSON output: {e}")
             return None
 
-    except subprocess.TimeoutExpired:
-        logging.error("LLM command timed out")
+    except LLMClientError as e:
+        logging.error(f"LLM request failed: {e}")
         return None
     except Exception as e:
         logging.error(f"An error occurred while running LLM: {str(e)}")
@@ -0,0 +1,182 @@
+import logging
+import os
+import subprocess
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+
+class LLMClientError(Exception):
+    """Raised when a client couldn't get a completion from the LLM."""
+
+
+class LLMUnavailableError(LLMClientError):
+    """Raised when the server refused the connection, so the request never reached the model."""
+
+
+class OllamaHTTPClient:
+    """
+    Client for the Ollama HTTP API.
+
+    All requests share one requests.Session, so TCP connections are pooled and kept alive
+    between calls. keep_alive tells Ollama how long to keep the model loaded after a request.
+    """
+
+    def __init__(
+        self,
+        base_url: str = "http://localhost:11434",
+        model: str = "mistral",
+        keep_alive: str = "30m",
+        timeout: float = 360,
+        pool_size: int = 4,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def generate(self, prompt: str, timeout: float = None):
+        """
+        Send prompt to /api/generate and return the generated text.
+
+        Parameters:
+            prompt (str): The complete prompt
+            timeout (float): Seconds to wait for the answer, defaults to self.timeout
+
+        Returns:
+            response (str): The text generated by the model
+
+        Raises:
+            LLMUnavailableError: If the server refuses the connection
+            LLMClientError: If the server times out or answers with an error
+        """
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": False,
+            "format": "json",
+            "keep_alive": self.keep_alive,
+        }
+        try:
+            response = self.session.post(
+                f"{self.base_url}/api/generate",
+                json=payload,
+                timeout=timeout or self.timeout,
+            )
+            response.raise_for_status()
+            return response.json()["response"]
+        except requests.ConnectionError as e:
+            if isinstance(e, requests.Timeout):
+                raise LLMClientError(f"Ollama HTTP request timed out: {e}") from e
+            raise LLMUnavailableError(f"Ollama HTTP server unavailable: {e}") from e
+        except (requests.RequestException, ValueError, KeyError) as e:
+            raise LLMClientError(f"Ollama HTTP request failed: {e}") from e
+
+    def close(self):
+        self.session.close()
+
+
+class OllamaCLIClient:
+    """Client which runs `ollama run <model>` in a subprocess for every prompt."""
+
+    def __init__(self, model: str = "mistral", timeout: float = 360):
+        self.model = model
+        self.timeout = timeout
+
+    def generate(self, prompt: str, timeout: float = None):
+        """
+        Pipe prompt into the ollama CLI and return its stdout.
+
+        Raises:
+            LLMClientError: If the command fails or times out
+        """
+        cmd = ["ollama", "run", self.model]
+        try:
+            result = subprocess.run(
+                cmd,
+                input=prompt,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                timeout=timeout or self.timeout,
+            )
+        except subprocess.TimeoutExpired as e:
+            raise LLMClientError("LLM command timed out") from e
+        except OSError as e:
+            raise LLMClientError(f"Could not run ollama: {e}") from e
+
+        logging.debug(f"LLM stdout: {result.stdout}")
+        logging.debug(f"LLM stderr: {result.stderr}")
+
+        if result.returncode != 0:
+            raise LLMClientError(f"LLM returned an error: {result.stderr}")
+        return result.stdout
+
+    def close(self):
+        pass
+
+
+class FallbackClient:
+    """
+    Uses the primary client and falls back to the secondary one if the primary can't be reached.
+    Timeouts and errors are not retried with the fallback: the CLI talks to the same Ollama server,
+    which would only get the slow prompt a second time.
+    """
+
+    def __init__(self, primary, fallback):
+        self.primary = primary
+        self.fallback = fallback
+
+    def generate(self, prompt: str, timeout: float = None):
+        try:
+            return self.primary.generate(prompt, timeout=timeout)
+        except LLMUnavailableError as e:
+            logging.warning(f"Primary LLM client unavailable, using fallback: {e}")
+            return self.fallback.generate(prompt, timeout=timeout)
+
+    def close(self):
+        self.primary.close()
+        self.fallback.close()
+
+
+def create_client():
+    """
+    Create the LLM client configured in LogInData.env.
+
+    LLM_BACKEND selects "http" (default, falls back to the CLI) or "cli".
+    OLLAMA_URL, OLLAMA_MODEL and OLLAMA_KEEP_ALIVE configure the HTTP client.
+    """
+    load_dotenv(dotenv_path="LogInData.env")
+    config = {
+        "LLM_BACKEND": os.getenv("LLM_BACKEND", "http"),
+        "OLLAMA_URL": os.getenv("OLLAMA_URL", "http://localhost:11434"),
+        "OLLAMA_MODEL": os.getenv("OLLAMA_MODEL", "mistral"),
+        "OLLAMA_KEEP_ALIVE": os.getenv("OLLAMA_KEEP_ALIVE", "30m"),
+    }
+    cli_client = OllamaCLIClient(model=config["OLLAMA_MODEL"])
+    if config["LLM_BACKEND"] == "cli":
+        return cli_client
+    http_client = OllamaHTTPClient(
+        base_url=config["OLLAMA_URL"],
+        model=config["OLLAMA_MODEL"],
+        keep_alive=config["OLLAMA_KEEP_ALIVE"],
+    )
+    return FallbackClient(http_client, cli_client)
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_default_client():
+    """Return the process-wide client, created on first use."""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = create_client()
+        return _default_client
@@ -1,13 +1,50 @@
+import json
 import logging
 import os
-from llm import run_llm
-from transcribe import transcribe_audio
+import queue
+import socket
 import threading
-from database import Email, db
+import uuid
+from contextlib import contextmanager
+from llm import run_llm
+from llm_client import create_client
+from transcribe import transcribe_audio, DECODE_OPTIONS
+from transcription_cache import TranscriptionCache, hash_file
+from pcm_cache import SAMPLE_RATE, ensure_pcm_cache, load_pcm, remove_pcm_cache
+from vad import trim_silence
+from audio_utils import mp3_duration
+from model_policy import AdaptiveModelSelector
+from metrics import TRANSCRIPTION_RTF, TRANSCRIPTION_SECONDS
+from model_registry import ModelRegistry
+from transcription_pool import TranscriptionProcessPool, set_torch_threads
+from worker_pool import ProcessingPool, PRIORITY_SCHEDULED
+from database import (
+    Email,
+    db,
+    checkpoint_reached,
+    claim_jobs,
+    finish_job,
+    get_job,
+    job_counts,
+    reclaim_expired_jobs,
+    release_job,
+    renew_lease,
+    requeue_job,
+    save_checkpoint,
+    JOB_EXTRACTING,
+    JOB_FAILED,
+    JOB_QUEUED,
+    JOB_TRANSCRIBING,
+)
+from events import broker
 import os
 from dotenv import load_dotenv
 
 
+class LeaseLost(Exception):
+    """Another worker claimed the job after the lease of this one expired."""
+
+
 # Class to manage the LLM and audio processing
 class LLM_Manager:
     """Class to manage the LLM and audio processing."""
@@ -16,12 +53,119 @@ class LLM_Manager:
     def __init__(self, app):
         """Initialize the LLM Manager with the Flask app."""
         load_dotenv(dotenv_path="LogInData.env")
-        config = {"LLM": os.getenv("LLM")}
+        config = {
+            "LLM": os.getenv("LLM"),
+            # Seconds an information extraction may take, slow models on a busy server need minutes
+            "LLM_TIMEOUT": os.getenv("LLM_TIMEOUT", "360"),
+            "WHISPER_MEMORY_BUDGET_MB": os.getenv("WHISPER_MEMORY_BUDGET_MB", "2048"),
+            "WHISPER_MODEL_TTL": os.getenv("WHISPER_MODEL_TTL", "900"),
+            "TRANSCRIPTION_WORKERS": os.getenv("TRANSCRIPTION_WORKERS", "1"),
+            # "thread" runs Whisper in the transcription threads, "process" in a pool of worker processes
+            "TRANSCRIPTION_MODE": os.getenv("TRANSCRIPTION_MODE", "thread"),
+            # Defaults to as many processes as cores / TORCH_THREADS
+            "TRANSCRIPTION_PROCESSES": os.getenv("TRANSCRIPTION_PROCESSES", ""),
+            # torch intra-op threads per transcribing process, empty leaves the torch default in thread mode
+            "TORCH_THREADS": os.getenv("TORCH_THREADS", ""),
+            "LLM_WORKERS": os.getenv("LLM_WORKERS", "1"),
+            "PROCESSING_QUEUE_SIZE": os.getenv("PROCESSING_QUEUE_SIZE", "50"),
+            "TRANSCRIPTION_CACHE_PATH": os.getenv(
+                "TRANSCRIPTION_CACHE_PATH",
+                os.path.join(app.instance_path, "transcription_cache.db"),
+            ),
+            "TRANSCRIPTION_CACHE_MAX_MB": os.getenv("TRANSCRIPTION_CACHE_MAX_MB", "50"),
+            "PCM_CACHE_DTYPE": os.getenv("PCM_CACHE_DTYPE", "int16"),
+            "WHISPER_ADAPTIVE": os.getenv("WHISPER_ADAPTIVE", "true"),
+            "WHISPER_TARGET_LATENCY": os.getenv("WHISPER_TARGET_LATENCY", "120"),
+            "VAD_ENABLED": os.getenv("VAD_ENABLED", "true"),
+            "VAD_MARGIN_DB": os.getenv("VAD_MARGIN_DB", "10"),
+            "VAD_MIN_SILENCE_MS": os.getenv("VAD_MIN_SILENCE_MS", "600"),
+            "VAD_PADDING_MS": os.getenv("VAD_PADDING_MS", "300"),
+            "JOB_LEASE_SECONDS": os.getenv("JOB_LEASE_SECONDS", "900"),
+            "JOB_MAX_ATTEMPTS": os.getenv("JOB_MAX_ATTEMPTS", "3"),
+            "JOB_PREFETCH": os.getenv("JOB_PREFETCH", "1"),
+            # Seconds before the first retry of a failed step, doubled for every further attempt
+            "JOB_BACKOFF_DOWNLOAD": os.getenv("JOB_BACKOFF_DOWNLOAD", "60"),
+            "JOB_BACKOFF_DECODE": os.getenv("JOB_BACKOFF_DECODE", "10"),
+            "JOB_BACKOFF_TRANSCRIBE": os.getenv("JOB_BACKOFF_TRANSCRIBE", "30"),
+            "JOB_BACKOFF_EXTRACT": os.getenv("JOB_BACKOFF_EXTRACT", "30"),
+            "JOB_BACKOFF_STORE": os.getenv("JOB_BACKOFF_STORE", "5"),
+            "JOB_BACKOFF_MAX": os.getenv("JOB_BACKOFF_MAX", "3600"),
+        }
         self.app = app
         self.selected_llm = config["LLM"]
-        self.timeout = 180
+        self.timeout = float(config["LLM_TIMEOUT"])
         self.primary_transcription_model = "small"
         self.fallback_transcription_model = "tiny"
+        transcription_workers = int(config["TRANSCRIPTION_WORKERS"])
+        torch_threads = int(config["TORCH_THREADS"] or 0)
+        # Worker processes with their own models and torch threads, None transcribes in the threads
+        self.transcription_processes = None
+        if config["TRANSCRIPTION_MODE"].strip().lower() == "process":
+            torch_threads = torch_threads or 4
+            processes = int(
+                config["TRANSCRIPTION_PROCESSES"] or max(1, (os.cpu_count() or 1) // torch_threads)
+            )
+            self.transcription_processes = TranscriptionProcessPool(
+                processes,
+                torch_threads,
+                preload=[self.primary_transcription_model, self.fallback_transcription_model],
+                memory_budget_mb=float(config["WHISPER_MEMORY_BUDGET_MB"]),
+            )
+            # One transcription thread per process waits for its result, so no process idles
+            transcription_workers = processes
+        elif torch_threads:
+            set_torch_threads(torch_threads)
+        # Loaded Whisper models, shared by all processing threads
+        self.model_registry = ModelRegistry(
+            memory_budget_mb=float(config["WHISPER_MEMORY_BUDGET_MB"]),
+            idle_ttl=float(config["WHISPER_MODEL_TTL"]),
+        )
+        # Picks a faster model than the primary one while the backlog is too long, None disables it
+        self.model_selector = None
+        if config["WHISPER_ADAPTIVE"].strip().lower() in ("1", "true", "yes", "on"):
+            self.model_selector = AdaptiveModelSelector(
+                self.primary_transcription_model,
+                target_latency=float(config["WHISPER_TARGET_LATENCY"]),
+                workers=transcription_workers,
+            )
+        # Jobs waiting in the database at the last dispatch, part of the backlog the selector sees
+        self.waiting_jobs = 0
+        # Transcriptions by audio hash, so reprocessing doesn't run Whisper again
+        self.transcription_cache = TranscriptionCache(
+            config["TRANSCRIPTION_CACHE_PATH"],
+            max_bytes=int(float(config["TRANSCRIPTION_CACHE_MAX_MB"]) * 1024 * 1024),
+        )
+        # Sample format of the decoded audio stored next to every voicemail, int16, float16 or float32
+        self.pcm_dtype = config["PCM_CACHE_DTYPE"]
+        # Silence is cut from the decoded audio before Whisper sees it, None disables it
+        self.vad_options = None
+        if config["VAD_ENABLED"].strip().lower() in ("1", "true", "yes", "on"):
+            self.vad_options = {
+                "margin_db": float(config["VAD_MARGIN_DB"]),
+                "min_silence_ms": int(config["VAD_MIN_SILENCE_MS"]),
+                "padding_ms": int(config["VAD_PADDING_MS"]),
+            }
+        # Pooled Ollama client shared by the LLM workers
+        self.llm_client = create_client()
+        # Fixed number of transcription and LLM workers behind bounded queues
+        self.processing_pool = ProcessingPool(
+            self._transcribe_email,
+            self._extract_email,
+            transcription_workers=transcription_workers,
+            llm_workers=int(config["LLM_WORKERS"]),
+            max_queue_size=int(config["PROCESSING_QUEUE_SIZE"]),
+        )
+        # Jobs come from the processing_job table, leases identify this process
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.lease_seconds = float(config["JOB_LEASE_SECONDS"])
+        self.max_attempts = int(config["JOB_MAX_ATTEMPTS"])
+        # Jobs claimed per transcription worker beyond the one it is working on
+        self.prefetch = int(config["JOB_PREFETCH"])
+        self.backoff = {
+            step: float(config[f"JOB_BACKOFF_{step.upper()}"])
+            for step in ["download", "decode", "transcribe", "extract", "store"]
+        }
+        self.backoff_max = float(config["JOB_BACKOFF_MAX"])
 
     # Function to set the LLM
     def set_llm(self, llm_name: str):
@@ -47,42 +191,161 @@ class LLM_Manager:
         return self.primary_transcription_model
 
     # Function to set the transcription models
-    def set_transcription_models(self, primary_model: str, fallback_model: str):  #
+    def set_transcription_models(
+        self, primary_model: str, fallback_model: str, warm: bool = True
+    ):
+        """
+        Set the primary and fallback transcription models.
+        The primary model is loaded in the background unless warm is False, so the next voicemail doesn't wait for it.
+        """
         self.primary_transcription_model = primary_model
         self.fallback_transcription_model = fallback_model
+        if self.model_selector is not None:
+            self.model_selector.primary = primary_model
         logging.info(
             f"Primary transcription model: {primary_model}, Fallback model: {fallback_model}"
         )
+        if self.transcription_processes is not None:
+            if warm and self.transcription_processes.preload != [primary_model, fallback_model]:
+                # New workers preload the models, the old ones finish their transcriptions
+                self.transcription_processes.restart([primary_model, fallback_model])
+        elif warm:
+            self.model_registry.warm(primary_model)
 
     # Function to transcribe the audio
-    def transcribe_audio(self, audio_file_path: str):
+    def transcribe_audio(self, audio_file_path: str, audio_hash: str = None):
         """
         Transcribe audio using the configured transcription models.
+        Audio that was already transcribed with the same model and options is answered from the transcription cache.
+        Otherwise Whisper gets the samples from the PCM cache next to the audio file instead of decoding the mp3 again,
+        cut down to the speech segments found by the voice activity detection. The model is picked by the
+        model_selector from the length of the speech and the backlog, see choose_model.
 
         Parameters:
         ----------
         audio_file_path : str
             Path to the audio file.
+        audio_hash : str
+            SHA-256 of the audio file if it is already known.
 
         Returns:
         -------
         dict or None
             Transcription result dictionary or None if transcription fails.
+            Contains dauerOriginal and dauerGetrimmt (seconds of audio before and after trimming) if the silence was trimmed.
         """
 
         logging.info(f"Transcribing audio file: {audio_file_path}")
-        logging.info(f"Using Whisper model: {self.primary_transcription_model}")
-        result = transcribe_audio(
-            audio_file_path,
-            self.primary_transcription_model,
-            self.fallback_transcription_model,
-        )
+        if audio_hash is None:
+            try:
+                audio_hash = hash_file(audio_file_path)
+            except OSError as e:
+                logging.error(f"Could not hash audio file {audio_file_path}: {e}")
+
+        if audio_hash:
+            cached = self.transcription_cache.get(
+                TranscriptionCache.make_key(
+                    audio_hash, self.primary_transcription_model, self._cache_options()
+                )
+            )
+            if cached is not None:
+                logging.info(f"Using cached transcription: {cached['transcription']}")
+                return {**cached, "success": True, "error": None, "cached": True}
+
+        try:
+            audio = load_pcm(audio_file_path, self.pcm_dtype)
+        except Exception as e:
+            logging.warning(f"Could not decode {audio_file_path}, Whisper decodes it itself: {e}")
+            audio = None
+
+        durations = {}
+        if audio is not None and self.vad_options is not None:
+            original = len(audio) / SAMPLE_RATE
+            audio, segments = trim_silence(audio, **self.vad_options)
+            durations = {"dauerOriginal": original, "dauerGetrimmt": len(audio) / SAMPLE_RATE}
+            logging.info(
+                f"Voice activity detection kept {durations['dauerGetrimmt']:.1f}s of {original:.1f}s in {len(segments)} segments."
+            )
+
+        if audio is not None and len(audio) == 0:
+            # Nothing but silence, Whisper would only hallucinate
+            logging.info("No speech found, skipping Whisper.")
+            result = {
+                "transcription": "",
+                "dauer": 0.0,
+                "model_used": self.primary_transcription_model,
+                "success": True,
+                "error": None,
+            }
+        else:
+            if audio is not None:
+                duration = len(audio) / SAMPLE_RATE
+            else:
+                duration = mp3_duration(audio_file_path) or 0.0
+            model = self.choose_model(duration)
+            logging.info(f"Using Whisper model: {model}")
+            if self.transcription_processes is not None:
+                # This thread only waits for the worker process, the GIL stays free for the others
+                future = self.transcription_processes.submit(
+                    audio_file_path, model, self.fallback_transcription_model, audio=audio
+                )
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {"transcription": None, "dauer": None, "model_used": model, "success": False, "error": str(e)}
+            else:
+                result = transcribe_audio(
+                    audio_file_path,
+                    model,
+                    self.fallback_transcription_model,
+                    use_model=self.model_registry.use,
+                    audio=audio,
+                )
+            if result["success"]:
+                TRANSCRIPTION_SECONDS.observe(result["dauer"], model=result["model_used"])
+                if duration > 0:
+                    rtf = result["dauer"] / duration
+                    TRANSCRIPTION_RTF.observe(rtf, model=result["model_used"])
+                    logging.info(
+                        f"Whisper {result['model_used']} transcribed {duration:.1f}s in {result['dauer']:.1f}s, real-time factor {rtf:.2f}."
+                    )
+                if self.model_selector is not None:
+                    self.model_selector.observe(result["model_used"], duration, result["dauer"])
         if not result["success"]:
             logging.error(f"Transcription failed: {result['error']}")
             return None
+        result.update(durations)
         logging.info(f"Transcription completed: {result['transcription']}")
+        if audio_hash:
+            # Stored under the model that produced it, a fallback result doesn't answer for the primary model
+            self.transcription_cache.put(
+                TranscriptionCache.make_key(audio_hash, result["model_used"], self._cache_options()),
+                result["transcription"],
+                result["dauer"],
+                result["model_used"],
+            )
         return result
 
+    def choose_model(self, duration: float):
+        """
+        Pick the Whisper model for duration seconds of audio.
+        The primary model unless the backlog (jobs still waiting in the database and in the transcription
+        queue, this voicemail already left it) can't be worked off within the target latency, then a faster one.
+        """
+        if self.model_selector is None:
+            return self.primary_transcription_model
+        queue_depth = self.waiting_jobs + self.processing_pool.stats()["transcription"]["queued"]
+        model, reason = self.model_selector.choose(duration, queue_depth)
+        rtf = self.model_selector.real_time_factor(model)
+        logging.info(f"Chose Whisper model {model} (real-time factor {rtf:.2f}): {reason}")
+        return model
+
+    def _cache_options(self):
+        """Options which change the transcription of an audio file, part of the transcription cache key."""
+        if self.vad_options is None:
+            return DECODE_OPTIONS
+        return {**DECODE_OPTIONS, "vad": self.vad_options}
+
     # Function to extract information
     def extract_information(self, transcription: str):
         """
@@ -99,7 +362,7 @@ class LLM_Manager:
             Extracted data dictionary or None if extraction fails.
         """
         if self.selected_llm == "llama2":
-            return run_llm(transcription)
+            return run_llm(transcription, client=self.llm_client, timeout=self.timeout)
         else:
             raise RuntimeError("No valid LLM selected.")
 
@@ -141,89 +404,285 @@ class LLM_Manager:
         return email_data
 
     # Function to process the email
-    def process_email(self, email):
+    def process_email(self, email, priority=PRIORITY_SCHEDULED):
         """
-        Process an email, including transcription and information extraction.
+        Queue an email for processing, including transcription and information extraction.
+        The job is stored in the database and handed to a worker by dispatch_jobs.
 
         Parameters:
         ----------
         email : Email
             Email object from the database to process.
+        priority : int
+            Lower values are processed first, see worker_pool.PRIORITY_MANUAL.
+
+        Returns:
+        -------
+        bool
+            False if a worker is processing the email right now.
         """
+        if not requeue_job(email.id, priority=priority):
+            return False
+        self.dispatch_jobs()
+        return True
 
-        def run():
-            """Function to run the processing in a new thread."""
-            with self.app.app_context():
+    def dispatch_jobs(self):
+        """
+        Claim jobs from the database and hand them to the processing pool.
+        Only as many jobs as the transcription workers can start soon are claimed, the rest stay
+        in the table for the other worker processes. Called by the scheduler.
+
+        Returns:
+        -------
+        int
+            Number of jobs handed to the pool.
+        """
+        with self.app.app_context():
+            for email in reclaim_expired_jobs(self.max_attempts):
+                broker.publish(
+                    "status", {"id": email.id, "status": email.status, "version": email.version}
+                )
+            self.waiting_jobs = job_counts().get(JOB_QUEUED, 0)
+            stage = self.processing_pool.stats()["transcription"]
+            free = stage["workers"] * (1 + self.prefetch) - stage["queued"] - stage["in_flight"]
+            dispatched = 0
+            for email_id, priority in claim_jobs(
+                self.worker_id, free, self.lease_seconds, self.max_attempts
+            ):
                 try:
-                    email_in_thread = Email.query.filter_by(id=email.id).first()
-                    if email_in_thread is None:
-                        logging.error(f"Email {email.id} not found in the database.")
-                        return
+                    # False means this process still works on it from an expired lease, the lease is ours again
+                    if self.processing_pool.submit(email_id, priority=priority, block=False):
+                        dispatched += 1
+                except queue.Full:
+                    release_job(email_id, self.worker_id)
+            return dispatched
+
+    def processing_stats(self):
+        """Return queue depth and in-flight counts of the processing pool, the number of jobs per stage, the real-time factors of the model selection and the size of the transcription process pool."""
+        stats = self.processing_pool.stats()
+        with self.app.app_context():
+            stats["jobs"] = job_counts()
+        if self.model_selector is not None:
+            stats["model_selection"] = self.model_selector.stats()
+        if self.transcription_processes is not None:
+            stats["transcription"]["processes"] = self.transcription_processes.processes
+            stats["transcription"]["torch_threads"] = self.transcription_processes.torch_threads
+        return stats
+
+    def _commit_status(self, email, status):
+        """Commit the email with the new status and publish the transition to the event subscribers."""
+        email.status = status
+        db.session.commit()
+        broker.publish(
+            "status", {"id": email.id, "status": status, "version": email.version}
+        )
 
-                    email_in_thread.status = "abfertigung"
-                    db.session.commit()
+    def _mark_failed(self, email_id, error=None):
+        """Set the status of the email to "fehlgeschlagen" and close its job."""
+        db.session.rollback()
+        finish_job(email_id, self.worker_id, JOB_FAILED, error)
+        email_in_thread = Email.query.filter_by(id=email_id).first()
+        if email_in_thread:
+            self._commit_status(email_in_thread, "fehlgeschlagen")
+            self._remove_pcm_cache(email_in_thread)
 
-                    audio_file_path = os.path.join(
-                        self.app.config["UPLOAD_FOLDER"], email_in_thread.fileName
-                    )
-                    transcription_result = self.transcribe_audio(audio_file_path)
-                    if not transcription_result:
-                        logging.error("Transcription failed.")
-                        email_in_thread.status = "fehlgeschlagen"
-                        db.session.commit()
-                        return
+    def _remove_pcm_cache(self, email):
+        """
+        Delete the PCM cache of a finished job, it is only kept while the job runs and for its retries.
+        A later /reprocess decodes the original again.
+        """
+        if email.fileName:
+            remove_pcm_cache(os.path.join(self.app.config["UPLOAD_FOLDER"], email.fileName))
 
-                    transcription_text = transcription_result["transcription"]
-                    email_in_thread.transkript = (
-                        transcription_text  # save the transcription
-                    )
+    def retry_delay(self, step, attempt):
+        """Seconds to wait before retrying step after attempt failed, doubling per attempt up to JOB_BACKOFF_MAX."""
+        return min(self.backoff_max, self.backoff[step] * 2 ** (attempt - 1))
+
+    def _retry_or_fail(self, email_id, step, error):
+        """
+        Give the job of a failed step back for a later attempt, or fail it if it used up its attempts.
+        Completed steps stay committed, the next attempt resumes with step.
+        """
+        db.session.rollback()
+        job = get_job(email_id)
+        if job is None or job.attempts >= self.max_attempts:
+            logging.error(f"Step {step} of email {email_id} failed for good: {error}")
+            self._mark_failed(email_id, error)
+            return
+        delay = self.retry_delay(step, job.attempts)
+        logging.warning(
+            f"Step {step} of email {email_id} failed (attempt {job.attempts}): {error}, retrying in {delay:.0f}s."
+        )
+        release_job(email_id, self.worker_id, error=error, delay=delay, count_attempt=True)
+        email_in_thread = Email.query.filter_by(id=email_id).first()
+        if email_in_thread:
+            self._commit_status(email_in_thread, "processed")
 
+    def _transcribe_email(self, email_id):
+        """
+        First pipeline stage, runs in a transcription worker: the steps downloaded, decoded and transcribed.
+        Steps the job already completed are skipped. Returns the transcription result or None.
+        """
+        with self.app.app_context():
+            step = "download"
+            try:
+                if not renew_lease(email_id, self.worker_id, self.lease_seconds, JOB_TRANSCRIBING):
+                    logging.warning(f"Lease on email {email_id} was lost, skipping it.")
+                    return None
+                email_in_thread = Email.query.filter_by(id=email_id).first()
+                if email_in_thread is None:
+                    logging.error(f"Email {email_id} not found in the database.")
+                    finish_job(email_id, self.worker_id, JOB_FAILED, "email not found")
+                    return None
+                job = get_job(email_id)
+
+                self._commit_status(email_in_thread, "abfertigung")
+
+                if checkpoint_reached(job.checkpoint, "transcribed"):
+                    logging.info(f"Email {email_id} is already transcribed, resuming with the extraction.")
+                    return {"transcription": email_in_thread.transkript, "resumed": True}
+
+                # The MailLoader saved the attachment
+                audio_file_path = os.path.join(
+                    self.app.config["UPLOAD_FOLDER"], email_in_thread.fileName
+                )
+                if not os.path.exists(audio_file_path):
+                    self._retry_or_fail(email_id, step, f"audio file {audio_file_path} is missing")
+                    return None
+                if not checkpoint_reached(job.checkpoint, "downloaded"):
+                    self._save_checkpoint(email_id, "downloaded")
+
+                step = "decode"
+                audio_hash = job.audio_hash
+                if not checkpoint_reached(job.checkpoint, "decoded") or audio_hash is None:
+                    audio_hash = hash_file(audio_file_path)
+                    ensure_pcm_cache(audio_file_path, self.pcm_dtype)
+                    self._save_checkpoint(email_id, "decoded", audio_hash=audio_hash)
+
+                step = "transcribe"
+                with self._heartbeat(email_id):
+                    transcription_result = self.transcribe_audio(audio_file_path, audio_hash=audio_hash)
+                if not transcription_result:
+                    self._retry_or_fail(email_id, step, "transcription failed")
+                    return None
+                email_in_thread.transkript = transcription_result["transcription"]
+                for key in ["dauerOriginal", "dauerGetrimmt"]:
+                    if key in transcription_result:
+                        setattr(email_in_thread, key, transcription_result[key])
+                self._save_checkpoint(email_id, "transcribed")
+                return transcription_result
+
+            except LeaseLost:
+                logging.warning(f"Lease on email {email_id} was lost in step {step}, leaving it to the new owner.")
+                db.session.rollback()
+                return None
+            except Exception as e:
+                logging.error(f"Error processing email {email_id} in step {step}: {e}")
+                self._retry_or_fail(email_id, step, e)
+                return None
+
+    def _extract_email(self, email_id, transcription_result):
+        """
+        Second pipeline stage, runs in an LLM worker: the steps extracted and stored.
+        An extraction which was committed before is not sent to the LLM again.
+        """
+        with self.app.app_context():
+            step = "extract"
+            try:
+                if not renew_lease(email_id, self.worker_id, self.lease_seconds, JOB_EXTRACTING):
+                    logging.warning(f"Lease on email {email_id} was lost, skipping it.")
+                    return
+                email_in_thread = Email.query.filter_by(id=email_id).first()
+                if email_in_thread is None:
+                    logging.error(f"Email {email_id} not found in the database.")
+                    finish_job(email_id, self.worker_id, JOB_FAILED, "email not found")
+                    return
+                job = get_job(email_id)
+
+                if checkpoint_reached(job.checkpoint, "extracted") and job.extracted:
+                    extracted_data = json.loads(job.extracted)
+                else:
                     logging.info("Starting information extraction with Llama2.")
-                    extracted_data = run_llm(transcription_text)
+                    with self._heartbeat(email_id):
+                        extracted_data = run_llm(
+                            transcription_result["transcription"],
+                            client=self.llm_client,
+                            timeout=self.timeout,
+                        )
                     if extracted_data is None:
-                        logging.error("Information extraction failed.")
-                        email_in_thread.status = "fehlgeschlagen"
-                        db.session.commit()
+                        self._retry_or_fail(email_id, step, "information extraction failed")
                         return
-
                     logging.info("Information extraction completed.")
-                    logging.info(f"LLM output: {extracted_data}")
-
-                    # Update the email with the extracted data
-                    for key in [
-                        "vorname",
-                        "nachname",
-                        "anfragetyp",
-                        "nameMedikament",
-                        "dosis",
-                        "fachrichtung",
-                        "grundUeberweisung",
-                        "extraInformation",
-                        "geburtsdatum",
-                    ]:
-                        value = extracted_data.get(key)
-                        if hasattr(email_in_thread, key):
-                            setattr(email_in_thread, key, value or None)
-                        else:
-                            logging.warning(
-                                f"Attribute {key} does not exist on Email model."
-                            )
-
-                    # Update status to "unbearbeitet"
-                    email_in_thread.status = "unbearbeitet"
-                    # Update rating to 0
-                    email_in_thread.rating = 0
-                    db.session.commit()
-                    logging.info(f"Email {email_in_thread.id} bearbeitet successfully.")
+                    self._save_checkpoint(email_id, "extracted", extracted=json.dumps(extracted_data))
+
+                logging.info(f"LLM output: {extracted_data}")
+
+                step = "store"
+                # Update the email with the extracted data
+                for key in [
+                    "vorname",
+                    "nachname",
+                    "anfragetyp",
+                    "nameMedikament",
+                    "dosis",
+                    "fachrichtung",
+                    "grundUeberweisung",
+                    "extraInformation",
+                    "geburtsdatum",
+                ]:
+                    value = extracted_data.get(key)
+                    if hasattr(email_in_thread, key):
+                        setattr(email_in_thread, key, value or None)
+                    else:
+                        logging.warning(f"Attribute {key} does not exist on Email model.")
+
+                # Update rating to 0
+                email_in_thread.rating = 0
+                # Update status to "unbearbeitet"
+                self._commit_status(email_in_thread, "unbearbeitet")
+                finish_job(email_id, self.worker_id)
+                self._remove_pcm_cache(email_in_thread)
+                logging.info(f"Email {email_in_thread.id} bearbeitet successfully.")
+
+            except LeaseLost:
+                logging.warning(f"Lease on email {email_id} was lost in step {step}, leaving it to the new owner.")
+                db.session.rollback()
+            except Exception as e:
+                logging.error(f"Error processing email {email_id} in step {step}: {e}")
+                self._retry_or_fail(email_id, step, e)
+
+    def _save_checkpoint(self, email_id, checkpoint, **outputs):
+        """Commit a completed step, raises if another worker took over the job."""
+        if not save_checkpoint(email_id, self.worker_id, checkpoint, self.lease_seconds, **outputs):
+            raise LeaseLost(email_id)
+
+    @contextmanager
+    def _heartbeat(self, email_id):
+        """
+        Renew the lease on the job every third of JOB_LEASE_SECONDS while the block runs, so a
+        transcription or LLM call longer than the lease isn't reclaimed and handed to another worker.
+        Raises LeaseLost after the block if another worker took over the job in the meantime.
+        """
+        stopped = threading.Event()
+        lost = threading.Event()
 
-                except Exception as e:
-                    logging.error(f"Error processing email {email.id}: {e}")
-                    # Ensure email status is updated in case of exceptions
-                    email_in_thread = Email.query.filter_by(id=email.id).first()
-                    if email_in_thread:
-                        email_in_thread.status = "fehlgeschlagen"
-                        db.session.commit()
-
-        # start the processing in a new thread
-        thread = threading.Thread(target=run)
+        def beat():
+            with self.app.app_context():
+                while not stopped.wait(self.lease_seconds / 3):
+                    try:
+                        if not renew_lease(email_id, self.worker_id, self.lease_seconds):
+                            lost.set()
+                            return
+                    except Exception as e:
+                        db.session.rollback()
+                        logging.warning(f"Renewing the lease on email {email_id} failed: {e}")
+
+        thread = threading.Thread(target=beat, name=f"lease-{email_id}", daemon=True)
         thread.start()
+        try:
+            yield
+        finally:
+            stopped.set()
+            thread.join()
+        if lost.is_set():
+            raise LeaseLost(email_id)
@@ -0,0 +1,197 @@
+import binascii
+import hashlib
+import os
+import quopri
+import time
+from email.parser import BytesHeaderParser
+from audio_utils import Mp3DurationScanner
+from metrics import ATTACHMENT_DECODE_SECONDS
+
+# Base64 text collected before it is decoded and written, a multiple of 4
+_DECODE_CHUNK = 64 * 1024
+
+
+def retr_lines(connection, num):
+    """
+    Yields the lines of message num like poplib's retr, but one at a time instead of as a list.
+    The generator has to be consumed completely before the next command is sent.
+    """
+    connection._putcmd(f"RETR {num}")
+    connection._getresp()
+    while True:
+        line, _ = connection._getline()
+        if line == b".":
+            return
+        if line.startswith(b".."):
+            line = line[1:]  # undo the POP3 byte-stuffing
+        yield line
+
+
+class AttachmentWriter:
+    """
+    Decodes an attachment while it streams in and writes it to path.
+
+    The data goes to a temporary file which replaces path when the attachment is complete.
+    The SHA-256 and the mp3 duration are computed on the decoded bytes during the same pass.
+    """
+
+    def __init__(self, path: str, encoding: str):
+        self.path = path
+        self.encoding = encoding
+        self.size = 0
+        self._sha256 = hashlib.sha256()
+        self._scanner = Mp3DurationScanner()
+        self._pending = bytearray()
+        # Seconds spent decoding, hashing and writing, without waiting for the network
+        self.decode_seconds = 0.0
+        self._file = open(path + ".part", "wb")
+
+    def write_line(self, line: bytes):
+        start = time.perf_counter()
+        if self.encoding == "base64":
+            self._pending += line.strip()
+            if len(self._pending) >= _DECODE_CHUNK:
+                cut = len(self._pending) - len(self._pending) % 4
+                self._write(binascii.a2b_base64(bytes(self._pending[:cut])))
+                del self._pending[:cut]
+        elif self.encoding == "quoted-printable":
+            self._write(quopri.decodestring(line + b"\n"))
+        else:
+            self._write(line + b"\n")
+        self.decode_seconds += time.perf_counter() - start
+
+    def close(self):
+        """Flush the remaining data and move the file into place."""
+        start = time.perf_counter()
+        if self._pending:
+            self._write(binascii.a2b_base64(bytes(self._pending)))
+            self._pending.clear()
+        self._file.close()
+        os.replace(self.path + ".part", self.path)
+        self.decode_seconds += time.perf_counter() - start
+        ATTACHMENT_DECODE_SECONDS.observe(self.decode_seconds)
+
+    def abort(self):
+        self._file.close()
+        os.remove(self.path + ".part")
+
+    def info(self):
+        return {
+            "sha256": self._sha256.hexdigest(),
+            "size": self.size,
+            "duration": self._scanner.result(),
+        }
+
+    def _write(self, data: bytes):
+        self._file.write(data)
+        self._sha256.update(data)
+        self._scanner.feed(data)
+        self.size += len(data)
+
+
+class StreamingMessageParser:
+    """
+    Parses an email line by line without keeping it in memory.
+
+    The top level headers are parsed first and passed to on_headers, which returns the path
+    attachments are saved to, or None to only drain the message. Every part with a filename is
+    decoded straight into that path, the body of every other part is discarded.
+    """
+
+    def __init__(self, on_headers):
+        self.on_headers = on_headers
+        self.headers = None
+        self.attachment = None
+        self.fileName = None
+
+    def parse(self, lines):
+        """
+        Consume lines (an iterable of bytes without line endings).
+
+        Returns:
+            headers (email.message.Message): The top level headers
+        """
+        lines = iter(lines)
+        self.headers = self._read_headers(lines)
+        target = self.on_headers(self.headers)
+
+        boundaries = []
+        part_headers = self.headers
+        boundary = part_headers.get_boundary()
+        if boundary:
+            boundaries.append(boundary.encode())
+            part_headers = None  # the preamble isn't a part
+        writer = self._start_part(part_headers, target)
+
+        try:
+            for line in lines:
+                closing = self._match_boundary(line, boundaries)
+                if closing is None:
+                    if writer:
+                        writer.write_line(line)
+                    continue
+
+                # A boundary ends the current part
+                writer = self._finish(writer)
+                index, is_end = closing
+                del boundaries[index + 1 :]
+                if is_end:
+                    boundaries.pop()
+                    continue
+                part_headers = self._read_headers(lines)
+                while part_headers.get_content_type() == "message/rfc822":
+                    # A forwarded message, its own headers follow the part headers
+                    part_headers = self._read_headers(lines)
+                nested = part_headers.get_boundary()
+                if nested:
+                    boundaries.append(nested.encode())
+                    continue
+                writer = self._start_part(part_headers, target)
+        except Exception:
+            if writer:
+                writer.abort()
+            raise
+
+        self._finish(writer)
+        return self.headers
+
+    def _start_part(self, headers, target):
+        if headers is None or target is None:
+            return None
+        if headers.get("Content-Disposition") is None:
+            return None
+        fileName = headers.get_filename()
+        if not fileName:
+            return None
+        self.fileName = fileName
+        encoding = str(headers.get("Content-Transfer-Encoding", "")).strip().lower()
+        return AttachmentWriter(target, encoding)
+
+    def _finish(self, writer):
+        if writer:
+            writer.close()
+            self.attachment = writer.info()
+        return None
+
+    @staticmethod
+    def _match_boundary(line, boundaries):
+        # Returns (index in boundaries, is closing boundary) or None, innermost boundary first
+        if not line.startswith(b"--"):
+            return None
+        stripped = line.rstrip()
+        for index in range(len(boundaries) - 1, -1, -1):
+            marker = b"--" + boundaries[index]
+            if stripped == marker:
+                return index, False
+            if stripped == marker + b"--":
+                return index, True
+        return None
+
+    @staticmethod
+    def _read_headers(lines):
+        header_lines = []
+        for line in lines:
+            if not line.strip():
+                break
+            header_lines.append(line)
+        return BytesHeaderParser().parsebytes(b"\n".join(header_lines) + b"\n\n")
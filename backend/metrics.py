@@ -0,0 +1,193 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds, from quick requests to long transcriptions
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SLOW_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+RTF_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 3, 5)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects the labels {self.labelnames}, got {tuple(labels)}")
+        return tuple((name, labels[name]) for name in self.labelnames)
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            items = sorted(self._values.items())
+            lines += [line for key, value in items for line in self._lines(key, value)]
+        return lines
+
+
+class Counter(_Metric):
+    """A value which only goes up, e.g. the number of failures."""
+
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _lines(self, key, value):
+        yield f"{self.name}{_format_labels(key)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    """Counts observations, e.g. latencies, in cumulative buckets and keeps their sum."""
+
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0}
+            entry["counts"][bisect.bisect_left(self.buckets, value)] += 1
+            entry["sum"] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the seconds the with block takes."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+            return sum(entry["counts"]) if entry else 0
+
+    def _lines(self, key, entry):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), entry["counts"]):
+            cumulative += count
+            labels = _format_labels(key + (("le", _format_value(float(bound))),))
+            yield f"{self.name}_bucket{labels} {cumulative}"
+        yield f"{self.name}_sum{_format_labels(key)} {_format_value(entry['sum'])}"
+        yield f"{self.name}_count{_format_labels(key)} {cumulative}"
+
+
+class Registry:
+    """The metrics of the process, rendered in the Prometheus text format by expose."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def expose(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.expose()) + "\n"
+
+
+REGISTRY = Registry()
+
+POP3_CONNECT_SECONDS = REGISTRY.register(
+    Histogram("praxis_pop3_connect_seconds", "Time to connect and log in to the POP3 server.")
+)
+POP3_RETRIEVE_SECONDS = REGISTRY.register(
+    Histogram(
+        "praxis_pop3_retrieve_seconds",
+        "Time to retrieve and parse one message.",
+        buckets=SLOW_BUCKETS,
+    )
+)
+ATTACHMENT_DECODE_SECONDS = REGISTRY.register(
+    Histogram(
+        "praxis_attachment_decode_seconds",
+        "Time spent decoding and writing one attachment while it streams in.",
+    )
+)
+MODEL_LOAD_SECONDS = REGISTRY.register(
+    Histogram(
+        "praxis_whisper_model_load_seconds",
+        "Time to load a Whisper model.",
+        ["model"],
+        buckets=SLOW_BUCKETS,
+    )
+)
+TRANSCRIPTION_SECONDS = REGISTRY.register(
+    Histogram(
+        "praxis_transcription_seconds",
+        "Time Whisper needs for one voicemail.",
+        ["model"],
+        buckets=SLOW_BUCKETS,
+    )
+)
+TRANSCRIPTION_RTF = REGISTRY.register(
+    Histogram(
+        "praxis_transcription_real_time_factor",
+        "Transcription time divided by the seconds of audio.",
+        ["model"],
+        buckets=RTF_BUCKETS,
+    )
+)
+LLM_REQUEST_SECONDS = REGISTRY.register(
+    Histogram(
+        "praxis_llm_request_seconds",
+        "Time of one information extraction request to the LLM.",
+        ["outcome"],
+        buckets=SLOW_BUCKETS,
+    )
+)
+LLM_JSON_PARSE_FAILURES = REGISTRY.register(
+    Counter("praxis_llm_json_parse_failures_total", "LLM answers which weren't valid JSON.")
+)
+DB_COMMIT_SECONDS = REGISTRY.register(
+    Histogram("praxis_db_commit_seconds", "Time to flush and commit a database session.")
+)
+HTTP_REQUEST_SECONDS = REGISTRY.register(
+    Histogram(
+        "praxis_http_request_seconds",
+        "Time to handle an HTTP request, by endpoint.",
+        ["endpoint", "method", "status"],
+    )
+)
@@ -0,0 +1,58 @@
+"""initial schema
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 09:45:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases created by db.create_all() before migrations existed already have these tables
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('email'):
+        op.create_table(
+            'email',
+            sa.Column('id', sa.String(length=120), nullable=False),
+            sa.Column('absender', sa.String(length=120), nullable=True),
+            sa.Column('subject', sa.String(length=120), nullable=True),
+            sa.Column('status', sa.String(length=120), nullable=True),
+            sa.Column('empfangsdatum', sa.DateTime(), nullable=True),
+            sa.Column('anfragetyp', sa.String(length=120), nullable=True),
+            sa.Column('fileName', sa.String(length=120), nullable=True),
+            sa.Column('dauer', sa.Float(), nullable=True),
+            sa.Column('vorname', sa.String(length=120), nullable=True),
+            sa.Column('nachname', sa.String(length=120), nullable=True),
+            sa.Column('geburtsdatum', sa.String(length=120), nullable=True),
+            sa.Column('extraInformation', sa.String(length=120), nullable=True),
+            sa.Column('nameMedikament', sa.String(length=120), nullable=True),
+            sa.Column('dosis', sa.String(length=120), nullable=True),
+            sa.Column('fachrichtung', sa.String(length=120), nullable=True),
+            sa.Column('grundUeberweisung', sa.String(length=120), nullable=True),
+            sa.Column('telefonnummer', sa.String(length=20), nullable=True),
+            sa.Column('transkript', sa.String(length=2096), nullable=True),
+            sa.Column('rating', sa.Integer(), nullable=True),
+            sa.PrimaryKeyConstraint('id')
+        )
+    if not inspector.has_table('seen_message'):
+        op.create_table(
+            'seen_message',
+            sa.Column('uid', sa.String(length=120), nullable=False),
+            sa.Column('email_id', sa.String(length=120), nullable=True),
+            sa.Column('seen_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('uid')
+        )
+
+
+def downgrade():
+    op.drop_table('seen_message')
+    op.drop_table('email')
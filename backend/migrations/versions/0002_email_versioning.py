@@ -0,0 +1,52 @@
+"""email row versioning and tombstones
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 09:50:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    columns = [column['name'] for column in inspector.get_columns('email')]
+    if 'version' not in columns:
+        with op.batch_alter_table('email') as batch_op:
+            batch_op.add_column(
+                sa.Column('version', sa.Integer(), nullable=False, server_default='0')
+            )
+            batch_op.create_index('ix_email_version', ['version'])
+    if not inspector.has_table('email_tombstone'):
+        op.create_table(
+            'email_tombstone',
+            sa.Column('id', sa.String(length=120), nullable=False),
+            sa.Column('version', sa.Integer(), nullable=False),
+            sa.Column('deleted_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_email_tombstone_version', 'email_tombstone', ['version'])
+    if not inspector.has_table('change_counter'):
+        op.create_table(
+            'change_counter',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('value', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('id')
+        )
+
+
+def downgrade():
+    op.drop_table('change_counter')
+    op.drop_index('ix_email_tombstone_version', table_name='email_tombstone')
+    op.drop_table('email_tombstone')
+    with op.batch_alter_table('email') as batch_op:
+        batch_op.drop_index('ix_email_version')
+        batch_op.drop_column('version')
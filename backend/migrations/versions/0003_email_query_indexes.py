@@ -0,0 +1,35 @@
+"""indexes for the hot email queries
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 10:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+INDEXES = {
+    'ix_email_status_empfangsdatum': ['status', 'empfangsdatum'],
+    'ix_email_empfangsdatum_id': ['empfangsdatum', 'id'],
+    'ix_email_fileName': ['fileName'],
+}
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    existing = {index['name'] for index in inspector.get_indexes('email')}
+    for name, columns in INDEXES.items():
+        if name not in existing:
+            op.create_index(name, 'email', columns)
+
+
+def downgrade():
+    for name in INDEXES:
+        op.drop_index(name, table_name='email')
@@ -0,0 +1,44 @@
+"""durable processing jobs with leases
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 11:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'processing_job' not in inspector.get_table_names():
+        op.create_table(
+            'processing_job',
+            sa.Column('email_id', sa.String(length=120), nullable=False),
+            sa.Column('stage', sa.String(length=32), nullable=False),
+            sa.Column('priority', sa.Integer(), nullable=False),
+            sa.Column('attempts', sa.Integer(), nullable=False),
+            sa.Column('lease_owner', sa.String(length=120), nullable=True),
+            sa.Column('lease_expires_at', sa.DateTime(), nullable=True),
+            sa.Column('available_at', sa.DateTime(), nullable=False),
+            sa.Column('last_error', sa.String(length=500), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('email_id'),
+        )
+        op.create_index(
+            'ix_processing_job_claim', 'processing_job', ['stage', 'priority', 'created_at']
+        )
+    # Emails waiting in "processed" or stuck in "abfertigung" get their job from emailCheck
+
+
+def downgrade():
+    op.drop_index('ix_processing_job_claim', table_name='processing_job')
+    op.drop_table('processing_job')
@@ -0,0 +1,37 @@
+"""checkpoints of the processing steps
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 12:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+COLUMNS = [
+    sa.Column('checkpoint', sa.String(length=32), nullable=True),
+    sa.Column('audio_hash', sa.String(length=64), nullable=True),
+    sa.Column('extracted', sa.Text(), nullable=True),
+]
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    existing = {column['name'] for column in inspector.get_columns('processing_job')}
+    with op.batch_alter_table('processing_job') as batch_op:
+        for column in COLUMNS:
+            if column.name not in existing:
+                batch_op.add_column(column)
+
+
+def downgrade():
+    with op.batch_alter_table('processing_job') as batch_op:
+        for column in reversed(COLUMNS):
+            batch_op.drop_column(column.name)
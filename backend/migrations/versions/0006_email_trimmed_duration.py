@@ -0,0 +1,36 @@
+"""audio durations before and after silence trimming
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+COLUMNS = [
+    sa.Column('dauerOriginal', sa.Float(), nullable=True),
+    sa.Column('dauerGetrimmt', sa.Float(), nullable=True),
+]
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    existing = {column['name'] for column in inspector.get_columns('email')}
+    with op.batch_alter_table('email') as batch_op:
+        for column in COLUMNS:
+            if column.name not in existing:
+                batch_op.add_column(column)
+
+
+def downgrade():
+    with op.batch_alter_table('email') as batch_op:
+        for column in reversed(COLUMNS):
+            batch_op.drop_column(column.name)
@@ -0,0 +1,69 @@
+"""full-text search index over the transcripts and extracted fields
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+COLUMNS = '"transkript", "vorname", "nachname", "nameMedikament", "fachrichtung"'
+EMAIL_COLUMNS = 'email."transkript", email."vorname", email."nachname", email."nameMedikament", email."fachrichtung"'
+NEW_VALUES = 'new."transkript", new."vorname", new."nachname", new."nameMedikament", new."fachrichtung"'
+OLD_VALUES = 'old."transkript", old."vorname", old."nachname", old."nameMedikament", old."fachrichtung"'
+OLD_KEY = '(SELECT search_rowid FROM email_search_key WHERE email_id = old.id)'
+NEW_KEY = '(SELECT search_rowid FROM email_search_key WHERE email_id = new.id)'
+DELETE_OLD = f"INSERT INTO email_fts(email_fts, rowid, {COLUMNS}) VALUES ('delete', {OLD_KEY}, {OLD_VALUES});"
+INSERT_NEW = f"INSERT INTO email_fts(rowid, {COLUMNS}) VALUES ({NEW_KEY}, {NEW_VALUES});"
+TRIGGERS = ['email_fts_insert', 'email_fts_delete', 'email_fts_update']
+
+
+def upgrade():
+    # FTS5 is SQLite only, other databases search with LIKE
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    # The rowids of email can change (string primary key, VACUUM), the keys of this table can't
+    op.execute(
+        "CREATE TABLE IF NOT EXISTS email_search_key ("
+        "search_rowid INTEGER PRIMARY KEY, email_id VARCHAR(120) NOT NULL UNIQUE)"
+    )
+    op.execute("INSERT OR IGNORE INTO email_search_key(email_id) SELECT id FROM email ORDER BY rowid")
+    op.execute(
+        f"CREATE VIEW IF NOT EXISTS email_search AS SELECT email_search_key.search_rowid, {EMAIL_COLUMNS} "
+        "FROM email_search_key JOIN email ON email.id = email_search_key.email_id"
+    )
+    op.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS email_fts USING fts5({COLUMNS}, "
+        "content='email_search', content_rowid='search_rowid', tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+    op.execute(
+        "CREATE TRIGGER IF NOT EXISTS email_fts_insert AFTER INSERT ON email BEGIN "
+        f"INSERT OR IGNORE INTO email_search_key(email_id) VALUES (new.id); {INSERT_NEW} END"
+    )
+    op.execute(
+        "CREATE TRIGGER IF NOT EXISTS email_fts_delete AFTER DELETE ON email BEGIN "
+        f"{DELETE_OLD} DELETE FROM email_search_key WHERE email_id = old.id; END"
+    )
+    op.execute(
+        f"CREATE TRIGGER IF NOT EXISTS email_fts_update AFTER UPDATE OF {COLUMNS} ON email "
+        f"BEGIN {DELETE_OLD} {INSERT_NEW} END"
+    )
+    op.execute("INSERT INTO email_fts(email_fts, rank) VALUES ('rank', 'bm25(1.0, 4.0, 4.0, 3.0, 2.0)')")
+    op.execute("INSERT INTO email_fts(email_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for trigger in TRIGGERS:
+        op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    op.execute("DROP TABLE IF EXISTS email_fts")
+    op.execute("DROP VIEW IF EXISTS email_search")
+    op.execute("DROP TABLE IF EXISTS email_search_key")
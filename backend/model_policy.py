@@ -0,0 +1,115 @@
+import threading
+
+# Whisper models from the fastest to the most accurate
+MODEL_LADDER = ["tiny", "base", "small", "medium", "large"]
+
+# Seconds of CPU transcription per second of audio until real measurements come in
+DEFAULT_RTF = {"tiny": 0.1, "base": 0.2, "small": 0.6, "medium": 1.8, "large": 4.0}
+
+
+def _rank(model: str):
+    # "large-v3" ranks like "large", unknown models like the largest
+    for index, name in enumerate(MODEL_LADDER):
+        if model == name or model.startswith(name + "-") or model.startswith(name + "."):
+            return index
+    return len(MODEL_LADDER) - 1
+
+
+class AdaptiveModelSelector:
+    """
+    Picks the Whisper model for each voicemail from its duration, the backlog and a target latency.
+
+    The model is chosen when a worker starts on the voicemail, so the backlog is the jobs still
+    waiting behind it. This is a load heuristic, not a prediction of the voicemail's own latency:
+    the drain time is the time to transcribe the voicemail and the waiting audio (spread over the
+    workers) with a model, roughly the wait of the last job in the queue. The most accurate model
+    up to the primary one which drains the backlog within target_latency is chosen, when none
+    does the fastest. The real-time factors are moving averages of the observed transcriptions,
+    so the choice follows the actual speed of the machine.
+    """
+
+    def __init__(self, primary: str, target_latency: float = 120.0, workers: int = 1, smoothing: float = 0.3):
+        """
+        Parameters:
+            primary (str): Model used whenever there is time for it
+            target_latency (float): Seconds within which the backlog should be transcribed
+            workers (int): Number of transcription workers sharing the backlog
+            smoothing (float): Weight of a new observation in the moving averages
+        """
+        self.primary = primary
+        self.target_latency = target_latency
+        self.workers = max(1, workers)
+        self.smoothing = smoothing
+        self.rtf = {}
+        self.average_duration = None
+        self._lock = threading.Lock()
+
+    def candidates(self):
+        """The primary model and the faster models of the ladder, most accurate first."""
+        faster = MODEL_LADDER[: _rank(self.primary)]
+        return [self.primary] + [model for model in reversed(faster) if model != self.primary]
+
+    def real_time_factor(self, model: str):
+        with self._lock:
+            if model in self.rtf:
+                return self.rtf[model]
+        return DEFAULT_RTF[MODEL_LADDER[_rank(model)]]
+
+    def drain_time(self, model: str, duration: float, queue_depth: int):
+        """Seconds to transcribe a voicemail of duration seconds and the queue_depth waiting ones with model."""
+        with self._lock:
+            average = self.average_duration if self.average_duration is not None else duration
+        backlog = queue_depth * average / self.workers
+        return (backlog + duration) * self.real_time_factor(model)
+
+    def choose(self, duration: float, queue_depth: int):
+        """
+        Parameters:
+            duration (float): Seconds of audio of the voicemail a worker is starting on
+            queue_depth (int): Jobs still waiting for a transcription worker
+
+        Returns:
+            (model, reason): The model for the job and a description of the decision for the log
+        """
+        candidates = self.candidates()
+        for model in candidates:
+            drain = self.drain_time(model, duration, queue_depth)
+            if drain <= self.target_latency:
+                return model, (
+                    f"drains in {drain:.0f}s <= target {self.target_latency:.0f}s "
+                    f"for {duration:.1f}s audio with {queue_depth} waiting"
+                )
+        fastest = candidates[-1]
+        drain = self.drain_time(fastest, duration, queue_depth)
+        return fastest, (
+            f"behind: even {fastest} needs {drain:.0f}s > target {self.target_latency:.0f}s "
+            f"for {duration:.1f}s audio with {queue_depth} waiting"
+        )
+
+    def observe(self, model: str, duration: float, elapsed: float):
+        """
+        Record a finished transcription.
+
+        Returns:
+            rtf (float or None): The real-time factor of this transcription
+        """
+        if not duration or duration <= 0:
+            return None
+        rtf = elapsed / duration
+        with self._lock:
+            previous = self.rtf.get(model)
+            self.rtf[model] = rtf if previous is None else previous + self.smoothing * (rtf - previous)
+            if self.average_duration is None:
+                self.average_duration = duration
+            else:
+                self.average_duration += self.smoothing * (duration - self.average_duration)
+        return rtf
+
+    def stats(self):
+        with self._lock:
+            return {
+                "primary": self.primary,
+                "target_latency": self.target_latency,
+                "real_time_factors": dict(self.rtf),
+                "average_duration": self.average_duration,
+            }
@@ -0,0 +1,209 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from metrics import MODEL_LOAD_SECONDS
+
+# Approximate memory footprint of the Whisper checkpoints in MB, used when the
+# size of a loaded model can't be measured from its parameters
+MODEL_SIZES_MB = {
+    "tiny": 75,
+    "base": 142,
+    "small": 466,
+    "medium": 1500,
+    "large": 2900,
+    "turbo": 1600,
+}
+
+
+def load_whisper_model(model_size: str):
+    """Default loader, imports whisper lazily so the registry stays cheap to import."""
+    import whisper
+
+    return whisper.load_model(model_size)
+
+
+def estimate_model_size_mb(model, model_size: str):
+    """
+    Estimate the memory used by a loaded model.
+
+    Parameters:
+        model: The loaded model object
+        model_size (str): The name the model was loaded with
+
+    Returns:
+        size (float): Size in MB, taken from the torch parameters if possible and from MODEL_SIZES_MB otherwise
+    """
+    try:
+        return (
+            sum(p.numel() * p.element_size() for p in model.parameters())
+            / 1024
+            / 1024
+        )
+    except Exception:
+        return float(MODEL_SIZES_MB.get(model_size.split(".")[0], 0))
+
+
+class _Entry:
+    """A loaded model together with its bookkeeping data."""
+
+    def __init__(self, model, size_mb: float):
+        self.model = model
+        self.size_mb = size_mb
+        self.last_used = time.monotonic()
+        # Held for a whole transcription, see ModelRegistry.use
+        self.in_use = threading.Lock()
+
+
+class ModelRegistry:
+    """
+    Thread-safe cache of loaded Whisper models shared by all worker threads.
+
+    Every model size is loaded at most once, concurrent requests for a model that is
+    currently loading wait for that load instead of starting their own.
+    Models are evicted in least-recently-used order when a new model would exceed the
+    memory budget and after they have not been used for idle_ttl seconds.
+
+    A Whisper model can't transcribe two files at once: model.transcribe installs kv-cache hooks
+    on the decoder of the shared instance, concurrent calls overwrite each other's cache.
+    Transcriptions take the model with use(), which holds it for one thread at a time.
+    """
+
+    def __init__(self, loader=None, memory_budget_mb: float = 2048, idle_ttl: float = 900):
+        """
+        Parameters:
+            loader (callable): Function that loads a model by name, defaults to whisper.load_model
+            memory_budget_mb (float): Maximum combined size of all cached models in MB
+            idle_ttl (float): Seconds after which an unused model is evicted, 0 disables the TTL
+        """
+        self.loader = loader or load_whisper_model
+        self.memory_budget_mb = memory_budget_mb
+        self.idle_ttl = idle_ttl
+        self._models = OrderedDict()
+        self._load_locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, model_size: str):
+        """
+        Return the model for model_size, loading it if it is not cached yet.
+
+        Parameters:
+            model_size (str): The Whisper model name (e.g. "tiny", "small")
+
+        Returns:
+            model: The loaded model
+        """
+        return self._get_entry(model_size).model
+
+    @contextmanager
+    def use(self, model_size: str):
+        """
+        Context manager holding the model for model_size for one transcription, other threads
+        using the same model wait until it is released. Loads the model like get.
+        """
+        entry = self._get_entry(model_size)
+        with entry.in_use:
+            entry.last_used = time.monotonic()
+            yield entry.model
+
+    def _get_entry(self, model_size: str):
+        self.evict_idle()
+        with self._lock:
+            entry = self._lookup(model_size)
+            if entry is not None:
+                return entry
+            load_lock = self._load_locks.setdefault(model_size, threading.Lock())
+
+        with load_lock:
+            # Another thread may have finished loading while we were waiting
+            with self._lock:
+                entry = self._lookup(model_size)
+                if entry is not None:
+                    return entry
+
+            logging.info(f"Loading Whisper model: {model_size}")
+            start_time = time.time()
+            model = self.loader(model_size)
+            size_mb = estimate_model_size_mb(model, model_size)
+            load_seconds = time.time() - start_time
+            MODEL_LOAD_SECONDS.observe(load_seconds, model=model_size)
+            logging.info(
+                f"Loaded Whisper model {model_size} ({size_mb:.0f} MB) in {load_seconds:.2f} seconds."
+            )
+
+            entry = _Entry(model, size_mb)
+            with self._lock:
+                self._make_room(size_mb)
+                self._models[model_size] = entry
+            return entry
+
+    def warm(self, model_size: str):
+        """
+        Load model_size in a background thread so the next transcription doesn't pay the load cost.
+
+        Returns:
+            thread (threading.Thread): The started loader thread
+        """
+
+        def run():
+            try:
+                self.get(model_size)
+            except Exception as e:
+                logging.error(f"Failed to warm Whisper model '{model_size}': {e}")
+
+        thread = threading.Thread(target=run, name=f"warm-{model_size}", daemon=True)
+        thread.start()
+        return thread
+
+    def evict_idle(self):
+        """Evict every model which hasn't been used for idle_ttl seconds."""
+        if not self.idle_ttl:
+            return
+        now = time.monotonic()
+        with self._lock:
+            for name, entry in list(self._models.items()):
+                if now - entry.last_used > self.idle_ttl:
+                    self._evict(name, "idle")
+
+    def evict(self, model_size: str):
+        """Remove model_size from the registry if it is loaded."""
+        with self._lock:
+            if model_size in self._models:
+                self._evict(model_size, "manual")
+
+    def loaded_models(self):
+        """Return the names of the cached models, least recently used first."""
+        with self._lock:
+            return list(self._models.keys())
+
+    def memory_usage_mb(self):
+        """Return the combined estimated size of all cached models in MB."""
+        with self._lock:
+            return sum(entry.size_mb for entry in self._models.values())
+
+    def _lookup(self, model_size: str):
+        # Caller must hold self._lock
+        entry = self._models.get(model_size)
+        if entry is None:
+            return None
+        entry.last_used = time.monotonic()
+        self._models.move_to_end(model_size)
+        return entry
+
+    def _make_room(self, size_mb: float):
+        # Caller must hold self._lock
+        used = sum(entry.size_mb for entry in self._models.values())
+        while self._models and used + size_mb > self.memory_budget_mb:
+            name, entry = next(iter(self._models.items()))
+            used -= entry.size_mb
+            self._evict(name, "memory budget")
+        if size_mb > self.memory_budget_mb:
+            logging.warning(
+                f"Whisper model of {size_mb:.0f} MB exceeds the memory budget of {self.memory_budget_mb} MB."
+            )
+
+    def _evict(self, model_size: str, reason: str):
+        # Caller must hold self._lock, threads still using the model keep their reference
+        del self._models[model_size]
+        logging.info(f"Evicted Whisper model {model_size} ({reason}).")
@@ -0,0 +1,108 @@
+import logging
+import os
+import subprocess
+
+from database import done_file_names
+from pcm_cache import pcm_cache_path, remove_pcm_cache
+
+# The compact copy is stored next to the mp3, audio_<id>.mp3 -> audio_<id>.opus
+OPUS_SUFFIX = ".opus"
+OPUS_MIMETYPE = "audio/ogg"
+
+
+def opus_path(audio_path: str):
+    return os.path.splitext(audio_path)[0] + OPUS_SUFFIX
+
+
+def transcode_to_opus(audio_path: str, target_path: str, bitrate: str = "16k"):
+    """Transcode audio_path to mono speech Opus in an Ogg container with ffmpeg."""
+    temp_path = f"{target_path}.{os.getpid()}.part"
+    subprocess.run(
+        [
+            "ffmpeg", "-nostdin", "-y", "-loglevel", "error",
+            "-i", audio_path,
+            "-ac", "1", "-c:a", "libopus", "-b:a", bitrate, "-application", "voip",
+            "-f", "ogg", temp_path,
+        ],
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    # Renamed when complete, so /audio never serves half a file
+    os.replace(temp_path, target_path)
+
+
+class OpusStorage:
+    """
+    Storage tier which keeps a low-bitrate Opus copy of every processed voicemail.
+
+    /audio serves the Opus copy to clients which play it, at 16 kbit/s an eighth of a 128 kbit/s mp3.
+    The original mp3 is always kept, it is the source of every transcription, also of a later /reprocess,
+    never the lossy Opus copy. The PCM decode cache of a finished voicemail is removed, it takes about
+    five times the space of the mp3 and a /reprocess decodes the original again.
+    """
+
+    def __init__(self, folder: str, bitrate: str = "16k", batch_size: int = 100, transcode=None):
+        """
+        Parameters:
+            folder (str): The upload folder with the mp3 files
+            bitrate (str): Opus bitrate for ffmpeg, 12k to 24k suits speech
+            batch_size (int): Voicemails transcoded per compact run
+            transcode (callable): transcode(audio_path, target_path, bitrate), defaults to transcode_to_opus
+        """
+        self.folder = folder
+        self.bitrate = bitrate
+        self.batch_size = batch_size
+        self.transcode = transcode or transcode_to_opus
+
+    def has_fresh_copy(self, audio_path: str):
+        try:
+            return os.stat(opus_path(audio_path)).st_mtime_ns >= os.stat(audio_path).st_mtime_ns
+        except FileNotFoundError:
+            return False
+
+    def compact(self):
+        """
+        Transcode up to batch_size processed voicemails without a current Opus copy and remove the
+        PCM caches left of processed voicemails. Runs in an app context.
+
+        Returns:
+            stats (dict): Number of files "transcoded", "failed" and PCM caches "uncached"
+        """
+        stats = {"transcoded": 0, "uncached": 0, "failed": 0}
+        pending = []
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".mp3") or not entry.is_file():
+                    continue
+                if not self.has_fresh_copy(entry.path) or os.path.exists(pcm_cache_path(entry.path)):
+                    pending.append(entry.name)
+        # Failed and waiting voicemails are transcribed again, only finished ones are compacted
+        done = done_file_names(pending)
+
+        for name in pending:
+            if name not in done:
+                continue
+            audio_path = os.path.join(self.folder, name)
+            if os.path.exists(pcm_cache_path(audio_path)):
+                remove_pcm_cache(audio_path)
+                stats["uncached"] += 1
+            if self.has_fresh_copy(audio_path) or stats["transcoded"] >= self.batch_size:
+                continue
+            try:
+                self.transcode(audio_path, opus_path(audio_path), self.bitrate)
+                stats["transcoded"] += 1
+            except Exception as e:
+                logging.error(f"Failed to transcode {audio_path} to Opus: {e}")
+                stats["failed"] += 1
+        if any(stats.values()):
+            logging.info(f"Opus storage: {stats}")
+        return stats
+
+
+def remove_opus_copy(audio_path: str):
+    """Delete the Opus copy of audio_path if there is one."""
+    try:
+        os.remove(opus_path(audio_path))
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,90 @@
+import logging
+import os
+import numpy as np
+
+# Whisper works on 16 kHz mono audio
+SAMPLE_RATE = 16000
+# The decoded audio is stored next to the source file under this suffix
+PCM_SUFFIX = ".pcm.npy"
+PCM_DTYPES = {"int16": np.int16, "float16": np.float16, "float32": np.float32}
+
+
+def pcm_cache_path(audio_path: str):
+    return audio_path + PCM_SUFFIX
+
+
+def decode_audio(audio_path: str):
+    """Decode an audio file to 16 kHz mono float32 samples with ffmpeg, like whisper.load_audio."""
+    from whisper.audio import load_audio
+
+    return load_audio(audio_path, sr=SAMPLE_RATE)
+
+
+def is_fresh(audio_path: str):
+    """Return True if the PCM cache of audio_path exists and was written after the source file last changed."""
+    try:
+        return os.stat(pcm_cache_path(audio_path)).st_mtime_ns >= os.stat(audio_path).st_mtime_ns
+    except FileNotFoundError:
+        return False
+
+
+def ensure_pcm_cache(audio_path: str, dtype: str = "int16", decode=None):
+    """
+    Decode audio_path once and store the samples next to it.
+
+    The cache is rebuilt when the source file is newer than the cache, e.g. after the mail was
+    downloaded again. int16 keeps the PCM exactly at half the size of float32 audio, float16
+    keeps the float samples of the decoder at half the size. float32 takes twice the disk space,
+    but load_pcm hands out the memory map itself without converting the samples.
+
+    Parameters:
+        audio_path (str): Path of the mp3 (or any format ffmpeg reads)
+        dtype (str): "int16", "float16" or "float32"
+        decode (callable): decode(path) -> float32 samples, defaults to decode_audio
+
+    Returns:
+        cache_path (str)
+    """
+    cache_path = pcm_cache_path(audio_path)
+    if is_fresh(audio_path):
+        return cache_path
+    if decode is None:
+        decode = decode_audio
+
+    samples = np.asarray(decode(audio_path), dtype=np.float32)
+    if dtype == "int16":
+        samples = np.clip(np.round(samples * 32768), -32768, 32767)
+    samples = samples.astype(PCM_DTYPES[dtype])
+
+    # Written to a temporary file first, so a concurrent reader never sees half a cache
+    temp_path = f"{cache_path}.{os.getpid()}.part"
+    with open(temp_path, "wb") as file:
+        np.save(file, samples)
+    os.replace(temp_path, cache_path)
+    logging.info(
+        f"Decoded {audio_path} to {cache_path} ({len(samples) / SAMPLE_RATE:.1f}s, {dtype})"
+    )
+    return cache_path
+
+
+def load_pcm(audio_path: str, dtype: str = "int16", decode=None):
+    """
+    Return the 16 kHz mono samples of audio_path as float32, as whisper expects them.
+    The cache file is memory-mapped, so the samples come from the page cache instead of ffmpeg.
+    A float32 cache is returned as the read-only memory map, int16 and float16 caches are
+    converted into one float32 array.
+    """
+    samples = np.load(ensure_pcm_cache(audio_path, dtype, decode), mmap_mode="r")
+    if samples.dtype == np.float32:
+        return samples
+    if samples.dtype == np.int16:
+        return np.multiply(samples, 1 / 32768, dtype=np.float32)
+    return samples.astype(np.float32)
+
+
+def remove_pcm_cache(audio_path: str):
+    """Delete the PCM cache of audio_path if there is one."""
+    try:
+        os.remove(pcm_cache_path(audio_path))
+    except FileNotFoundError:
+        pass
@@ -1,5 +1,6 @@
 import logging
 import time
+from contextlib import nullcontext
 import whisper
 import warnings
 
@@ -9,14 +10,24 @@ warnings.filterwarnings(
     message="You are using `torch.load` with `weights_only=False`.*",
     category=FutureWarning,
 )
+# The float32 PCM cache is a read-only memory map, whisper only reads it
+warnings.filterwarnings(
+    "ignore",
+    message="The given NumPy array is not writable.*",
+    category=UserWarning,
+)
 
 # Configure logging
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
+# Options passed to model.transcribe, also part of the transcription cache key
+DECODE_OPTIONS = {"language": "de", "fp16": False}
+
+
 # Function to transcribe audio file
-def transcribe_audio(audio_file: str, model_size: str, retry_model: str):
+def transcribe_audio(audio_file: str, model_size: str, retry_model: str, load_model=None, audio=None, use_model=None):
     '''
     Function to transcribe an audio file using the Whisper model.
     
@@ -24,6 +35,9 @@ def transcribe_audio(audio_file: str, model_size: str, retry_model: str):
         audio_file (str): The path to the audio file to be transcribed
         model_size (str): The size of the primary Whisper model to be used
         retry_model (str): The size of the fallback Whisper model to be used if the primary model fails
+        load_model (callable): Returns a loaded Whisper model for a model size, e.g. ModelRegistry.get. Defaults to whisper.load_model
+        audio (numpy.ndarray): The already decoded 16 kHz mono samples of audio_file, see pcm_cache.load_pcm. Whisper decodes audio_file itself if None
+        use_model (callable): Returns a context manager holding a loaded model for this transcription alone, e.g. ModelRegistry.use. Replaces load_model
         
     Returns:
         result (dict): A dictionary containing the transcription result, duration, model used, success status, and error message
@@ -36,16 +50,21 @@ def transcribe_audio(audio_file: str, model_size: str, retry_model: str):
         "error": None,
     }
 
+    if use_model is None:
+        if load_model is None:
+            load_model = whisper.load_model
+        use_model = lambda size: nullcontext(load_model(size))
+    source = audio_file if audio is None else audio
+
     try:
         logging.info(f"Loading Whisper model: {model_size}")
-        model = whisper.load_model(model_size)  # use primary model
-
-        start_time = time.time()  # start tracking time for transcription
-        logging.info(f"Starting transcription for file: {audio_file}")
-        transcription_result = model.transcribe(
-            audio_file, language="de", fp16=False
-        )  # specify language
-        end_time = time.time()
+        with use_model(model_size) as model:  # use primary model
+            start_time = time.time()  # start tracking time for transcription
+            logging.info(f"Starting transcription for file: {audio_file}")
+            transcription_result = model.transcribe(
+                source, **DECODE_OPTIONS
+            )  # specify language
+            end_time = time.time()
 
         result.update(
             {  # update dictionary
@@ -65,12 +84,10 @@ def transcribe_audio(audio_file: str, model_size: str, retry_model: str):
         if retry_model:
             logging.info(f"Retrying transcription with fallback model: {retry_model}")
             try:
-                model = whisper.load_model(retry_model)  # now use the backup model
-                start_time = time.time()
-                transcription_result = model.transcribe(
-                    audio_file, language="de", fp16=False
-                )
-                end_time = time.time()
+                with use_model(retry_model) as model:  # now use the backup model
+                    start_time = time.time()
+                    transcription_result = model.transcribe(source, **DECODE_OPTIONS)
+                    end_time = time.time()
 
                 result.update(
                     {
@@ -0,0 +1,147 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+
+def hash_file(path: str, chunk_size: int = 1024 * 1024):
+    """Return the SHA-256 hex digest of the file at path, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as fp:
+        for chunk in iter(lambda: fp.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class TranscriptionCache:
+    """
+    Persistent cache of Whisper transcriptions stored in a separate SQLite file.
+
+    Entries are keyed by the SHA-256 of the audio bytes, the model name and the decode options,
+    so the same audio is never transcribed twice with the same settings. When the stored
+    transcriptions exceed max_bytes the least recently used entries are deleted.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 50 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS transcriptions (
+                    key TEXT PRIMARY KEY,
+                    transcription TEXT NOT NULL,
+                    dauer REAL,
+                    model_used TEXT,
+                    size INTEGER NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_transcriptions_last_access ON transcriptions (last_access)"
+            )
+
+    @staticmethod
+    def make_key(audio_hash: str, model: str, options: dict):
+        """Build the cache key from the audio hash, model name and decode options."""
+        return f"{audio_hash}:{model}:{json.dumps(options, sort_keys=True)}"
+
+    def get(self, key: str):
+        """
+        Look up a transcription.
+
+        Returns:
+            result (dict or None): transcription, dauer and model_used of the cached entry
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT transcription, dauer, model_used FROM transcriptions WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE transcriptions SET last_access = ? WHERE key = ?",
+                    (time.time(), key),
+                )
+
+        with self._lock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.saved_seconds += row[1] or 0.0
+            hits, misses, saved = self.hits, self.misses, self.saved_seconds
+        logging.info(
+            f"Transcription cache {'miss' if row is None else 'hit'} "
+            f"(hits={hits}, misses={misses}, saved {saved:.1f} seconds of transcription)"
+        )
+        if row is None:
+            return None
+        return {"transcription": row[0], "dauer": row[1], "model_used": row[2]}
+
+    def put(self, key: str, transcription: str, dauer: float, model_used: str):
+        """Store a transcription and evict old entries if the cache is over its size limit."""
+        size = len(transcription.encode("utf-8")) + len(key)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO transcriptions VALUES (?, ?, ?, ?, ?, ?)",
+                (key, transcription, dauer, model_used, size, time.time()),
+            )
+            self._evict(conn)
+
+    def stats(self):
+        """Return the hit and miss counters."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "saved_seconds": self.saved_seconds,
+            }
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM transcriptions").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = []
+        for key, size in conn.execute(
+            "SELECT key, size FROM transcriptions ORDER BY last_access"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM transcriptions WHERE key = ?", evicted)
+        logging.info(f"Evicted {len(evicted)} entries from the transcription cache.")
+
+    def _connect(self):
+        # One short-lived connection per call, so worker threads never share a connection
+        return _Connection(self.path)
+
+
+class _Connection:
+    """sqlite3 connection which commits and closes when the with block ends."""
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, timeout=30)
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.conn.commit()
+            else:
+                self.conn.rollback()
+        finally:
+            self.conn.close()
@@ -0,0 +1,126 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Loaded Whisper models of a worker process, created by _init_worker
+_registry = None
+
+
+def set_torch_threads(threads: int):
+    """Limit the intra-op threads of torch (and the OpenMP/MKL pools under it) to threads."""
+    # Read by OpenMP and MKL when torch is imported, so they have to be set before
+    for variable in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[variable] = str(threads)
+    import torch
+
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Only possible before torch ran its first parallel operation
+        pass
+
+
+def _init_worker(torch_threads, preload, loader, memory_budget_mb, idle_ttl):
+    """Runs once in every worker process: set the thread budget and load the models."""
+    global _registry
+    set_torch_threads(torch_threads)
+    from model_registry import ModelRegistry
+
+    _registry = ModelRegistry(loader=loader, memory_budget_mb=memory_budget_mb, idle_ttl=idle_ttl)
+    for model_size in preload:
+        try:
+            _registry.get(model_size)
+        except Exception as e:
+            logging.error(f"Worker {os.getpid()} failed to preload Whisper model '{model_size}': {e}")
+
+
+def _transcribe_in_worker(audio_file, model_size, retry_model, audio):
+    from transcribe import transcribe_audio
+
+    return transcribe_audio(audio_file, model_size, retry_model, use_model=_registry.use, audio=audio)
+
+
+class TranscriptionProcessPool:
+    """
+    Runs Whisper in worker processes instead of threads of the Flask process.
+
+    Every process transcribes one voicemail at a time with torch_threads intra-op threads, so
+    processes * torch_threads should match the cores of the machine. Threads in one process
+    contend on the GIL for the Python side of the decoding and oversubscribe the torch thread
+    pool, separate processes don't. The workers are started with spawn (forking a process with
+    running threads and torch is unsafe) and load the preload models before their first job.
+    """
+
+    def __init__(
+        self,
+        processes: int,
+        torch_threads: int,
+        preload=(),
+        loader=None,
+        memory_budget_mb: float = 2048,
+        idle_ttl: float = 0,
+    ):
+        """
+        Parameters:
+            processes (int): Number of worker processes
+            torch_threads (int): torch threads per worker process
+            preload (list): Whisper models every worker loads at start
+            loader (callable): Picklable function loading a model by name, defaults to whisper.load_model
+            memory_budget_mb (float): Memory budget of the model registry of each worker
+            idle_ttl (float): Seconds after which a worker evicts an unused model, 0 keeps them
+        """
+        self.processes = processes
+        self.torch_threads = torch_threads
+        self.preload = list(preload)
+        self.loader = loader
+        self.memory_budget_mb = memory_budget_mb
+        self.idle_ttl = idle_ttl
+        self._lock = threading.Lock()
+        self._executor = self._start()
+
+    def _start(self):
+        logging.info(
+            f"Starting {self.processes} transcription processes with {self.torch_threads} torch threads each, "
+            f"preloading {', '.join(self.preload) or 'no models'}."
+        )
+        return ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.torch_threads, self.preload, self.loader, self.memory_budget_mb, self.idle_ttl),
+        )
+
+    def submit(self, audio_file: str, model_size: str, retry_model: str, audio=None):
+        """
+        Transcribe in a worker process, see transcribe.transcribe_audio for the parameters.
+
+        Returns:
+            future (concurrent.futures.Future): Resolves to the result dict of transcribe_audio
+        """
+        with self._lock:
+            try:
+                return self._executor.submit(_transcribe_in_worker, audio_file, model_size, retry_model, audio)
+            except BrokenProcessPool:
+                # A worker died (e.g. killed for memory), the pool can't be used anymore
+                logging.error("Transcription process pool is broken, restarting it.")
+                self._executor = self._start()
+                return self._executor.submit(_transcribe_in_worker, audio_file, model_size, retry_model, audio)
+
+    def restart(self, preload=None):
+        """
+        Replace the workers, e.g. to preload other models. Running transcriptions finish in the old workers.
+        """
+        with self._lock:
+            if preload is not None:
+                self.preload = list(preload)
+            old = self._executor
+            self._executor = self._start()
+        old.shutdown(wait=False)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            self._executor.shutdown(wait=wait)
@@ -0,0 +1,93 @@
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+
+def frame_energies(samples, frame_length: int):
+    """Return the RMS level of every frame of samples in dBFS."""
+    count = len(samples) // frame_length
+    if count == 0:
+        return np.zeros(0)
+    frames = np.asarray(samples[: count * frame_length], dtype=np.float32).reshape(count, frame_length)
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    return 20 * np.log10(np.maximum(rms, 1e-10))
+
+
+def speech_segments(
+    samples,
+    sample_rate: int = SAMPLE_RATE,
+    frame_ms: int = 30,
+    floor_db: float = -45.0,
+    margin_db: float = 10.0,
+    min_speech_ms: int = 150,
+    min_silence_ms: int = 600,
+    padding_ms: int = 300,
+):
+    """
+    Find the regions of samples which contain speech, by frame energy.
+
+    A frame counts as speech if it is louder than the noise floor of the recording (its 10th
+    percentile frame level) by margin_db and louder than floor_db. Pauses shorter than
+    min_silence_ms don't split a segment, bursts shorter than min_speech_ms (clicks) are dropped
+    and every segment is widened by padding_ms so word onsets and endings are kept.
+
+    Returns:
+        segments (list): (start, end) sample indices, sorted and not overlapping
+    """
+    frame_length = max(1, sample_rate * frame_ms // 1000)
+    levels = frame_energies(samples, frame_length)
+    if len(levels) == 0:
+        return []
+
+    noise = np.percentile(levels, 10)
+    peak = np.percentile(levels, 95)
+    # Recordings without pauses have little dynamic range, don't let the margin exceed half of it
+    threshold = max(floor_db, noise + min(margin_db, (peak - noise) / 2))
+    active = levels > threshold
+
+    min_speech = max(1, min_speech_ms // frame_ms)
+    min_silence = max(1, min_silence_ms // frame_ms)
+    padding = padding_ms * sample_rate // 1000
+
+    segments = []
+    start = None
+    for index, is_speech in enumerate(np.append(active, False)):
+        if is_speech and start is None:
+            start = index
+        elif not is_speech and start is not None:
+            if index - start >= min_speech:
+                if segments and start - segments[-1][1] < min_silence:
+                    segments[-1][1] = index
+                else:
+                    segments.append([start, index])
+            start = None
+
+    result = []
+    for start, end in segments:
+        start = max(0, start * frame_length - padding)
+        end = min(len(samples), end * frame_length + padding)
+        if result and start <= result[-1][1]:
+            result[-1] = (result[-1][0], end)
+        else:
+            result.append((start, end))
+    return result
+
+
+def trim_silence(samples, sample_rate: int = SAMPLE_RATE, gap_ms: int = 200, **options):
+    """
+    Cut samples down to their speech segments, see speech_segments for the options.
+    The segments are joined with gap_ms of silence so Whisper still hears the pause between them.
+
+    Returns:
+        (trimmed samples, segments)
+    """
+    segments = speech_segments(samples, sample_rate, **options)
+    if not segments:
+        return np.zeros(0, dtype=np.float32), segments
+    gap = np.zeros(gap_ms * sample_rate // 1000, dtype=np.float32)
+    parts = []
+    for start, end in segments:
+        if parts:
+            parts.append(gap)
+        parts.append(np.asarray(samples[start:end], dtype=np.float32))
+    return np.concatenate(parts), segments
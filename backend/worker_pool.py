@@ -0,0 +1,172 @@
+import itertools
+import logging
+import queue
+import threading
+
+# Lower numbers are processed first
+PRIORITY_MANUAL = 0
+PRIORITY_SCHEDULED = 10
+
+_STOP = object()
+
+
+class _Stage:
+    """A bounded priority queue served by a fixed number of worker threads."""
+
+    def __init__(self, name: str, worker_count: int, max_queue_size: int, handler):
+        self.name = name
+        self.worker_count = worker_count
+        self.handler = handler
+        self.queue = queue.PriorityQueue(maxsize=max_queue_size)
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._threads = [
+            threading.Thread(target=self._work, name=f"{name}-{i}", daemon=True)
+            for i in range(worker_count)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def put(self, item, block=True, timeout=None):
+        self.queue.put(item, block=block, timeout=timeout)
+
+    def stop(self, wait=True):
+        # Stop markers sort behind every real job, so queued work is drained first
+        for i in range(len(self._threads)):
+            self.queue.put((float("inf"), i, _STOP, None))
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def stats(self):
+        with self._lock:
+            in_flight = self.in_flight
+        return {
+            "workers": self.worker_count,
+            "queued": self.queue.qsize(),
+            "in_flight": in_flight,
+        }
+
+    def _work(self):
+        while True:
+            priority, seq, key, payload = self.queue.get()
+            if key is _STOP:
+                self.queue.task_done()
+                return
+            with self._lock:
+                self.in_flight += 1
+            try:
+                self.handler(priority, key, payload)
+            except Exception as e:
+                logging.error(f"Unhandled error in {self.name} worker for {key}: {e}")
+            finally:
+                with self._lock:
+                    self.in_flight -= 1
+                self.queue.task_done()
+
+
+class ProcessingPool:
+    """
+    Two stage executor for the voicemail pipeline.
+
+    Jobs first run through a fixed number of transcription workers and are then handed to
+    a fixed number of LLM workers. Both stages use bounded priority queues, a full queue
+    blocks the producer (or raises queue.Full) instead of starting more work.
+    A key which is already queued or in flight is never accepted twice.
+    """
+
+    def __init__(
+        self,
+        transcribe,
+        extract,
+        transcription_workers: int = 1,
+        llm_workers: int = 1,
+        max_queue_size: int = 50,
+    ):
+        """
+        Parameters:
+            transcribe (callable): transcribe(key) -> result, returning None ends the job
+            extract (callable): extract(key, result), the second stage of the job
+            transcription_workers (int): Number of threads running transcribe
+            llm_workers (int): Number of threads running extract
+            max_queue_size (int): Maximum number of waiting jobs per stage
+        """
+        self._transcribe = transcribe
+        self._extract = extract
+        self._active = set()
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self.llm_stage = _Stage("llm", llm_workers, max_queue_size, self._run_extract)
+        self.transcription_stage = _Stage(
+            "transcription", transcription_workers, max_queue_size, self._run_transcribe
+        )
+
+    def submit(self, key, priority: int = PRIORITY_SCHEDULED, block=True, timeout=None):
+        """
+        Queue a job for key.
+
+        Parameters:
+            key: Identifier of the job, e.g. the email id
+            priority (int): Lower values are processed first
+            block (bool), timeout (float): Passed on to queue.put when the queue is full
+
+        Returns:
+            queued (bool): False if key is already queued or in flight
+
+        Raises:
+            queue.Full: If the transcription queue stays full
+        """
+        with self._lock:
+            if key in self._active:
+                return False
+            self._active.add(key)
+        try:
+            self.transcription_stage.put(
+                (priority, next(self._seq), key, None), block=block, timeout=timeout
+            )
+        except queue.Full:
+            self._release(key)
+            raise
+        return True
+
+    def is_active(self, key):
+        """Return True if key is queued or in flight."""
+        with self._lock:
+            return key in self._active
+
+    def stats(self):
+        """Queue depth and in-flight counts of both stages."""
+        with self._lock:
+            active = len(self._active)
+        return {
+            "active": active,
+            "transcription": self.transcription_stage.stats(),
+            "llm": self.llm_stage.stats(),
+        }
+
+    def shutdown(self, wait=True):
+        """Finish the queued jobs and stop all workers."""
+        self.transcription_stage.stop(wait)
+        self.llm_stage.stop(wait)
+
+    def _run_transcribe(self, priority, key, payload):
+        handed_over = False
+        try:
+            result = self._transcribe(key)
+            if result is not None:
+                # Blocks while the LLM stage is saturated, which throttles transcription
+                self.llm_stage.put((priority, next(self._seq), key, result))
+                handed_over = True
+        finally:
+            if not handed_over:
+                self._release(key)
+
+    def _run_extract(self, priority, key, payload):
+        try:
+            self._extract(key, payload)
+        finally:
+            self._release(key)
+
+    def _release(self, key):
+        with self._lock:
+            self._active.discard(key)
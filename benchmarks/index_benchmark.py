@@ -0,0 +1,125 @@
+"""
+Query plans and latencies of the hot Email queries without and with the indexes of migration 0003.
+
+Usage:
+    python benchmarks/index_benchmark.py [--rows 100000] [--repeat 20]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from sqlalchemy import create_engine, insert, text  # noqa: E402
+from database import Email  # noqa: E402
+
+NEW_INDEXES = ["ix_email_status_empfangsdatum", "ix_email_empfangsdatum_id", "ix_email_fileName"]
+
+QUERIES = {
+    "emailCheck status=processed": (
+        'SELECT id FROM email WHERE status = :status',
+        {"status": "processed"},
+    ),
+    "unprocessed_emails": (
+        'SELECT * FROM email WHERE status = :status',
+        {"status": "unbearbeitet"},
+    ),
+    "get_email_by_filename": (
+        'SELECT * FROM email WHERE "fileName" = :fileName LIMIT 1',
+        {"fileName": "audio_mail-54321.mp3"},
+    ),
+    "dashboard first page": (
+        "SELECT id, status, empfangsdatum FROM email ORDER BY empfangsdatum DESC, id DESC LIMIT 50",
+        {},
+    ),
+    "dashboard status page": (
+        "SELECT id, status, empfangsdatum FROM email WHERE status = :status "
+        "ORDER BY empfangsdatum DESC LIMIT 50",
+        {"status": "fehlgeschlagen"},
+    ),
+}
+
+STATUSES = ["bearbeitet"] * 70 + ["unbearbeitet"] * 25 + ["fehlgeschlagen"] * 3 + ["processed"] * 2
+
+
+def fill(engine, rows):
+    rng = random.Random(42)
+    start = datetime(2023, 1, 1)
+    batch = []
+    with engine.begin() as conn:
+        for i in range(rows):
+            batch.append(
+                {
+                    "id": f"mail-{i}",
+                    "absender": "voicemail@praxis.de",
+                    "subject": "Neue Sprachnachricht",
+                    "status": rng.choice(STATUSES),
+                    "empfangsdatum": start + timedelta(minutes=rng.randrange(1_000_000)),
+                    "anfragetyp": rng.choice(["Rezept", "Überweisung"]),
+                    "fileName": f"audio_mail-{i}.mp3",
+                    "dauer": rng.uniform(5, 120),
+                    "transkript": "Lorem ipsum " * rng.randrange(10, 150),
+                    "rating": 0,
+                    "version": i,
+                }
+            )
+            if len(batch) == 10_000:
+                conn.execute(insert(Email.__table__), batch)
+                batch = []
+        if batch:
+            conn.execute(insert(Email.__table__), batch)
+
+
+def measure(engine, repeat):
+    results = {}
+    with engine.connect() as conn:
+        for name, (sql, params) in QUERIES.items():
+            plan = conn.execute(text("EXPLAIN QUERY PLAN " + sql), params).all()
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                conn.execute(text(sql), params).all()
+                timings.append((time.perf_counter() - start) * 1000)
+            results[name] = {
+                "plan": " | ".join(row[-1] for row in plan),
+                "median_ms": statistics.median(timings),
+            }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+        Email.__table__.create(engine)
+        with engine.begin() as conn:
+            for name in NEW_INDEXES:
+                conn.execute(text(f'DROP INDEX "{name}"'))
+        print(f"Inserting {args.rows} rows ...")
+        fill(engine, args.rows)
+
+        before = measure(engine, args.repeat)
+        with engine.begin() as conn:
+            for index in Email.__table__.indexes:
+                if index.name in NEW_INDEXES:
+                    index.create(conn)
+            conn.execute(text("ANALYZE"))
+        after = measure(engine, args.repeat)
+
+    for name in QUERIES:
+        print(f"\n{name}")
+        print(f"  before: {before[name]['median_ms']:8.2f} ms  {before[name]['plan']}")
+        print(f"  after:  {after[name]['median_ms']:8.2f} ms  {after[name]['plan']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+"""
+End-to-end throughput of the voicemail pipeline with local stand-ins for the mailbox, Whisper and Ollama.
+
+A synthetic corpus of voicemails is served by a local POP3 server, emailCheck ingests them and the
+LLM_Manager decodes, trims, transcribes and extracts them against a fake Ollama server. The
+transcription is either a fake which takes real-time-factor * audio seconds or the real Whisper
+(--transcription real, needs ffmpeg, the models and --corpus with real recordings).
+
+Reports the throughput, p50/p95/p99 latency per stage and the peak RSS and writes them as JSON,
+so runs of different commits can be compared with --baseline.
+
+Usage:
+    python benchmarks/pipeline_benchmark.py [--voicemails 50] [--arrival-rate 0] [--llm-latency 0.5]
+        [--transcription fake|real] [--rtf 0.3] [--output results.json] [--baseline older.json]
+"""
+import argparse
+import datetime
+import functools
+import glob
+import json
+import math
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+sys.path.insert(0, os.path.join(ROOT, "tests"))
+
+import numpy as np  # noqa: E402
+from fake_ollama import FakeOllamaServer  # noqa: E402
+from fake_pop3 import FakePOP3Server, build_voicemail  # noqa: E402
+
+# MPEG 1 Layer III, 128 kbps, 44.1 kHz: 417 byte frames of 1152 samples
+FRAME_HEADER = b"\xff\xfb\x90\x00"
+FRAME_SECONDS = 1152 / 44100
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of values."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+class StageTimings:
+    """Collects the seconds every stage took, per call."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.samples[stage].append(seconds)
+
+    def wrap(self, stage, function):
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - start)
+
+        return timed
+
+    def summary(self):
+        with self._lock:
+            samples = {stage: list(values) for stage, values in self.samples.items()}
+        return {
+            stage: {
+                "count": len(values),
+                "mean": sum(values) / len(values),
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "p99": percentile(values, 99),
+                "max": max(values),
+            }
+            for stage, values in sorted(samples.items())
+            if values
+        }
+
+
+def synthetic_corpus(count, rng):
+    """Voicemails of 3 to 180 seconds, most around 20 seconds, as (message id, mp3 bytes, seconds)."""
+    corpus = []
+    for i in range(count):
+        seconds = min(180.0, max(3.0, rng.lognormvariate(math.log(20), 0.6)))
+        frames = int(seconds / FRAME_SECONDS)
+        audio = b"".join(FRAME_HEADER + rng.randbytes(413) for _ in range(frames))
+        corpus.append((f"vm-{i:05d}", audio, frames * FRAME_SECONDS))
+    return corpus
+
+
+def recorded_corpus(count, directory):
+    """Cycle through the mp3 files in directory."""
+    from audio_utils import mp3_duration
+
+    paths = sorted(glob.glob(os.path.join(directory, "*.mp3")))
+    if not paths:
+        raise SystemExit(f"No mp3 files in {directory}")
+    corpus = []
+    for i in range(count):
+        path = paths[i % len(paths)]
+        with open(path, "rb") as file:
+            corpus.append((f"vm-{i:05d}", file.read(), mp3_duration(path) or 0.0))
+    return corpus
+
+
+def fake_decoder(path):
+    """16 kHz samples for a synthetic mp3: leading and trailing silence around speech-like noise."""
+    from audio_utils import mp3_duration
+    from pcm_cache import SAMPLE_RATE
+
+    seconds = mp3_duration(path) or 1.0
+    rng = np.random.default_rng(abs(hash(os.path.basename(path))) % 2**32)
+    total = int(seconds * SAMPLE_RATE)
+    lead, tail = int(total * 0.15), int(total * 0.2)
+    samples = rng.normal(0, 0.001, total).astype(np.float32)
+    t = np.arange(total - lead - tail) / SAMPLE_RATE
+    samples[lead : total - tail] += rng.normal(0, 0.2, len(t)) * (0.6 + 0.4 * np.sin(2 * np.pi * 4 * t))
+    return samples
+
+
+def make_fake_transcribe(rtf_small):
+    """transcribe.transcribe_audio stand-in which sleeps like a model with the default RTF ratios."""
+    from model_policy import DEFAULT_RTF, MODEL_LADDER, _rank
+    from pcm_cache import SAMPLE_RATE
+
+    def transcribe(audio_file, model_size, retry_model, load_model=None, audio=None, use_model=None):
+        seconds = len(audio) / SAMPLE_RATE if audio is not None else 20.0
+        rtf = rtf_small * DEFAULT_RTF[MODEL_LADDER[_rank(model_size)]] / DEFAULT_RTF["small"]
+        start = time.time()
+        time.sleep(seconds * rtf)
+        return {
+            "transcription": f"Guten Tag, hier spricht Josef Müller, ich brauche ein Rezept ({seconds:.0f}s).",
+            "dauer": time.time() - start,
+            "model_used": model_size,
+            "success": True,
+            "error": None,
+        }
+
+    return transcribe
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    if args.transcription == "real" and not args.corpus:
+        raise SystemExit("--transcription real needs --corpus with real recordings")
+    corpus = recorded_corpus(args.voicemails, args.corpus) if args.corpus else synthetic_corpus(args.voicemails, rng)
+    messages = {
+        message_id: (message_id, build_voicemail(message_id, audio=audio, filename=f"0177{i:07d}-voicemail.mp3"))
+        for i, (message_id, audio, _) in enumerate(corpus)
+    }
+    workdir = tempfile.mkdtemp(prefix="pipeline-benchmark-")
+    os.makedirs(os.path.join(workdir, "tmp"))
+    os.chdir(workdir)
+
+    timings = StageTimings()
+    arrivals, finished = {}, {}
+
+    with FakePOP3Server() as pop3, FakeOllamaServer(latency=args.llm_latency) as ollama:
+        os.environ.update(
+            {
+                "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+                "MAIL_SERVER": "127.0.0.1",
+                "PORT": str(pop3.port),
+                "USER_MAIL": "praxis@praxis.de",
+                "PASSWORD": "secret",
+                "MAIL_SSL": "false",
+                "LLM_BACKEND": "http",
+                "OLLAMA_URL": ollama.url,
+                "TRANSCRIPTION_WORKERS": str(args.transcription_workers),
+                "LLM_WORKERS": str(args.llm_workers),
+                "TRANSCRIPTION_CACHE_PATH": os.path.join(workdir, "transcription_cache.db"),
+            }
+        )
+        import app as app_module
+        import emailLoader
+        import llm_manager
+        import pcm_cache
+        from sqlalchemy import event
+        from sqlalchemy.orm import Session
+
+        # The benchmark drives emailCheck and the dispatching itself
+        app_module.scheduler.pause()
+        manager = app_module.llm_manager
+
+        emailLoader.MailLoader._ingest_message = timings.wrap("pop3_retrieve", emailLoader.MailLoader._ingest_message)
+        llm_manager.ensure_pcm_cache = timings.wrap("decode", llm_manager.ensure_pcm_cache)
+        llm_manager.run_llm = timings.wrap("llm", llm_manager.run_llm)
+        if args.transcription == "fake":
+            pcm_cache.decode_audio = fake_decoder
+            llm_manager.transcribe_audio = make_fake_transcribe(args.rtf)
+        llm_manager.transcribe_audio = timings.wrap("transcription", llm_manager.transcribe_audio)
+
+        @event.listens_for(Session, "before_commit")
+        def commit_started(session):
+            session.info["benchmark_commit"] = time.perf_counter()
+
+        @event.listens_for(Session, "after_commit")
+        def commit_finished(session):
+            started = session.info.pop("benchmark_commit", None)
+            if started is not None:
+                timings.add("db_commit", time.perf_counter() - started)
+
+        started_processing = {}
+        commit_status = llm_manager.LLM_Manager._commit_status
+
+        # Every status transition of the workers goes through _commit_status
+        def track_status(self, email, status):
+            commit_status(self, email, status)
+            email_id = email.id.split("@")[0]
+            now = time.perf_counter()
+            if status == "abfertigung" and email_id not in started_processing:
+                started_processing[email_id] = now
+                timings.add("queue_wait", now - arrivals[email_id])
+            elif status in ("unbearbeitet", "fehlgeschlagen") and email_id not in finished:
+                finished[email_id] = (now, status)
+                timings.add("end_to_end", now - arrivals[email_id])
+
+        llm_manager.LLM_Manager._commit_status = track_status
+
+        pending = list(messages)
+        start = time.perf_counter()
+        deadline = start + args.timeout
+        next_check = start
+        while len(finished) < len(messages) and time.perf_counter() < deadline:
+            now = time.perf_counter()
+            # Voicemails arrive in a burst or at arrival-rate per second
+            due = len(pending) if args.arrival_rate <= 0 else int((now - start) * args.arrival_rate) + 1
+            with pop3.lock:
+                while pending and due > len(messages) - len(pending):
+                    message_id = pending.pop(0)
+                    pop3.messages.append(messages[message_id])
+                    arrivals[message_id] = time.perf_counter()
+            if now >= next_check:
+                check_start = time.perf_counter()
+                app_module.emailCheck()
+                timings.add("email_check", time.perf_counter() - check_start)
+                next_check = now + args.check_interval
+            manager.dispatch_jobs()
+            time.sleep(args.poll_interval)
+        wall = time.perf_counter() - start
+        manager.processing_pool.shutdown(wait=False)
+
+    completed = sum(1 for _, status in finished.values() if status == "unbearbeitet")
+    failed = len(finished) - completed
+    audio_seconds = sum(seconds for _, _, seconds in corpus)
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "voicemails": len(messages),
+        "audio_seconds": audio_seconds,
+        "completed": completed,
+        "failed": failed,
+        "timed_out": len(messages) - len(finished),
+        "wall_seconds": wall,
+        "throughput_per_hour": completed / wall * 3600 if wall else 0.0,
+        "stages": timings.summary(),
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "model_selection": manager.model_selector.stats() if manager.model_selector else None,
+    }
+
+
+def print_report(results, baseline=None):
+    print(
+        f"\n{results['completed']}/{results['voicemails']} voicemails in {results['wall_seconds']:.1f}s "
+        f"({results['failed']} failed, {results['timed_out']} timed out)"
+    )
+    print(f"throughput: {results['throughput_per_hour']:.0f} voicemails/hour, peak RSS {results['peak_rss_mb']:.0f} MB")
+    if baseline:
+        change = results["throughput_per_hour"] / baseline["throughput_per_hour"] - 1 if baseline["throughput_per_hour"] else 0
+        print(f"baseline ({baseline.get('commit')}): {baseline['throughput_per_hour']:.0f}/hour ({change:+.1%})")
+    print(f"\n{'stage':<16}{'count':>7}{'p50 s':>10}{'p95 s':>10}{'p99 s':>10}{'max s':>10}")
+    for stage, stats in results["stages"].items():
+        line = f"{stage:<16}{stats['count']:>7}{stats['p50']:>10.3f}{stats['p95']:>10.3f}{stats['p99']:>10.3f}{stats['max']:>10.3f}"
+        old = (baseline or {}).get("stages", {}).get(stage)
+        if old and old["p95"]:
+            line += f"   p95 {stats['p95'] / old['p95'] - 1:+.1%}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--voicemails", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--arrival-rate", type=float, default=0.0, help="voicemails per second, 0 delivers all at once")
+    parser.add_argument("--check-interval", type=float, default=1.0, help="seconds between emailCheck runs")
+    parser.add_argument("--poll-interval", type=float, default=0.1, help="seconds between job dispatches")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="seconds the fake Ollama takes per request")
+    parser.add_argument("--transcription", choices=["fake", "real"], default="fake")
+    parser.add_argument("--rtf", type=float, default=0.3, help="real-time factor of the fake 'small' model")
+    parser.add_argument("--corpus", help="directory with mp3 recordings instead of the synthetic corpus")
+    parser.add_argument("--transcription-workers", type=int, default=1)
+    parser.add_argument("--llm-workers", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=600.0)
+    parser.add_argument("--output", help="JSON file for the results, default benchmarks/results/pipeline-<commit>.json")
+    parser.add_argument("--baseline", help="earlier results to compare with")
+    args = parser.parse_args()
+
+    output = os.path.abspath(
+        args.output or os.path.join(ROOT, "benchmarks", "results", f"pipeline-{git_commit() or 'unknown'}.json")
+    )
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+
+    results = run(args)
+    print_report(results, baseline)
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"\nResults written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -50,10 +50,16 @@ const Card: React.FC<CardProps> = ({
               <span className="fw-bold">Audio:</span>
             </div>
             <div className="col-md-10">
-              <audio
-                controls
-                src={`http://127.0.0.1:5000/audio?fileName=${id}`}
-              >
+              <audio controls>
+                {/* The small Opus copy if the browser plays it and the storage tier made one (404 otherwise), else the mp3 */}
+                <source
+                  src={`http://127.0.0.1:5000/audio?fileName=${id}&format=opus`}
+                  type="audio/ogg; codecs=opus"
+                />
+                <source
+                  src={`http://127.0.0.1:5000/audio?fileName=${id}&format=mp3`}
+                  type="audio/mpeg"
+                />
                 Ihr Browser unterstützt das Audio-Element nicht.
               </audio>
             </div>
@@ -2,6 +2,13 @@ import datetime
 import pytest
 import glob
 import os, shutil
+import sys
+import backend
+import database
+
+# The app imports its modules from backend/ directly, backend.database has to be the same module,
+# otherwise the tests would get a second db and second models
+sys.modules["backend.database"] = backend.database = database
 from backend.app import return_app, set_database
 from backend.database import Email
 
@@ -0,0 +1,74 @@
+# Local stand-in for the Ollama HTTP API, answers /api/generate without a real model
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_RESPONSE = {
+    "vorname": "Josef",
+    "nachname": "Müller",
+    "anfragetyp": "Rezept",
+    "nameMedikament": "Ibuprofen",
+    "dosis": "400mg",
+    "fachrichtung": None,
+    "grundUeberweisung": None,
+    "extraInformation": None,
+    "geburtsdatum": "01.01.1970",
+}
+
+
+class FakeOllamaServer:
+    """
+    Serves /api/generate on a free local port.
+
+    Parameters:
+        response (dict or str): What the model "generates", dicts are sent as JSON text
+        latency (float): Seconds to wait before answering
+    """
+
+    def __init__(self, response=None, latency=0.0):
+        self.response = DEFAULT_RESPONSE if response is None else response
+        self.latency = latency
+        self.requests = []
+        self.client_ports = set()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length))
+                server.requests.append(body)
+                server.client_ports.add(self.client_address[1])
+                if self.path != "/api/generate":
+                    self.send_error(404)
+                    return
+                time.sleep(server.latency)
+                text = server.response
+                if not isinstance(text, str):
+                    text = json.dumps(text)
+                data = json.dumps(
+                    {"model": body.get("model"), "response": text, "done": True}
+                ).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
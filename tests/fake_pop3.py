@@ -0,0 +1,133 @@
+# Local in-process stand-in for a POP3 mailbox, supports the commands used by the MailLoader
+import socketserver
+import threading
+from email import encoders
+from email.mime.base import MIMEBase
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.utils import formatdate
+
+
+def build_voicemail(
+    message_id,
+    subject="Neue Sprachnachricht",
+    sender="Anrufbeantworter <voicemail@praxis.de>",
+    audio=b"ID3" + bytes(range(256)) * 64,
+    filename="01771234567-voicemail.mp3",
+):
+    """Build the raw bytes of a voicemail email with an mp3 attachment."""
+    message = MIMEMultipart()
+    message["From"] = sender
+    message["To"] = "praxis@praxis.de"
+    message["Subject"] = subject
+    message["Date"] = formatdate(localtime=False)
+    message["Message-ID"] = f"<{message_id}@praxis.de>"
+    message.attach(MIMEText("Sie haben eine neue Sprachnachricht."))
+    payload = MIMEBase("audio", "mpeg")
+    payload.set_payload(audio)
+    encoders.encode_base64(payload)
+    payload.add_header("Content-Disposition", f"attachment; filename={filename}")
+    message.attach(payload)
+    return message.as_bytes()
+
+
+class FakePOP3Server:
+    """
+    Serves a list of messages over plain POP3 on a free local port.
+
+    Messages are (uid, raw bytes) tuples. Every received command is recorded in commands,
+    messages marked with DELE are removed on QUIT.
+    """
+
+    def __init__(self, messages=None, support_uidl=True):
+        self.messages = list(messages or [])
+        self.support_uidl = support_uidl
+        self.commands = []
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def send(self, line):
+                self.wfile.write(line + b"\r\n")
+
+            def send_multiline(self, first, lines):
+                self.send(first)
+                for line in lines:
+                    # byte-stuff lines starting with a dot
+                    if line.startswith(b"."):
+                        line = b"." + line
+                    self.send(line)
+                self.send(b".")
+
+            def handle(self):
+                with server.lock:
+                    messages = list(server.messages)
+                deleted = set()
+                self.send(b"+OK fake POP3 ready")
+                for raw in self.rfile:
+                    parts = raw.decode().strip().split(" ")
+                    command, args = parts[0].upper(), parts[1:]
+                    server.commands.append(" ".join([command] + args))
+                    if command in ("USER", "PASS", "NOOP", "RSET"):
+                        self.send(b"+OK")
+                    elif command == "STAT":
+                        size = sum(len(m) for _, m in messages)
+                        self.send(f"+OK {len(messages)} {size}".encode())
+                    elif command == "LIST":
+                        lines = [
+                            f"{i + 1} {len(m)}".encode() for i, (_, m) in enumerate(messages)
+                        ]
+                        self.send_multiline(b"+OK", lines)
+                    elif command == "UIDL" and server.support_uidl:
+                        lines = [
+                            f"{i + 1} {uid}".encode() for i, (uid, _) in enumerate(messages)
+                        ]
+                        self.send_multiline(b"+OK", lines)
+                    elif command == "RETR":
+                        _, message = messages[int(args[0]) - 1]
+                        self.send_multiline(b"+OK", message.splitlines())
+                    elif command == "TOP":
+                        _, message = messages[int(args[0]) - 1]
+                        header, _, body = message.partition(b"\n\n")
+                        body_lines = body.splitlines()[: int(args[1])]
+                        lines = header.splitlines() + [b""] + body_lines
+                        self.send_multiline(b"+OK", lines)
+                    elif command == "DELE":
+                        deleted.add(int(args[0]) - 1)
+                        self.send(b"+OK")
+                    elif command == "QUIT":
+                        with server.lock:
+                            server.messages = [
+                                m for i, m in enumerate(messages) if i not in deleted
+                            ]
+                        self.send(b"+OK bye")
+                        return
+                    else:
+                        self.send(b"-ERR unknown command")
+
+        self.tcp = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self.tcp.daemon_threads = True
+        self.port = self.tcp.server_address[1]
+        self.thread = threading.Thread(target=self.tcp.serve_forever, daemon=True)
+
+    def mail_config(self):
+        """Settings for MailLoader(mail_config=...) to connect to this server."""
+        return {
+            "MAIL_SERVER": "127.0.0.1",
+            "PORT": str(self.port),
+            "USER_MAIL": "praxis@praxis.de",
+            "PASSWORD": "secret",
+            "SSL": "false",
+        }
+
+    def count(self, command):
+        """Number of received commands starting with command."""
+        return sum(1 for c in self.commands if c.startswith(command))
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.tcp.shutdown()
+        self.tcp.server_close()
@@ -0,0 +1,20 @@
+"""Stand-in for Whisper models which can be loaded in worker processes (it has to be picklable)."""
+import os
+
+
+class FakeModel:
+    def __init__(self, model_size):
+        self.model_size = model_size
+
+    def transcribe(self, source, **options):
+        import torch
+
+        if self.model_size == "broken":
+            raise RuntimeError("model is broken")
+        return {
+            "text": f"{self.model_size}:{len(source)}:{os.getpid()}:{torch.get_num_threads()}",
+        }
+
+
+def load_fake_model(model_size):
+    return FakeModel(model_size)
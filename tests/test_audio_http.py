@@ -0,0 +1,61 @@
+import hashlib
+import os
+import shutil
+import pytest
+from backend.app import app as flask_app
+
+
+@pytest.fixture()
+def audio(app, database):
+    # database switches the upload folder to tests/tmp
+    with open("tmp/audio_test.mp3", "rb") as file:
+        return file.read()
+
+
+def test_range_request(client, audio):
+    response = client.get("/audio", query_string={"fileName": "test"}, headers={"Range": "bytes=100-199"})
+    assert response.status_code == 206
+    assert response.data == audio[100:200]
+    assert response.headers["Content-Range"] == f"bytes 100-199/{len(audio)}"
+
+
+# The ETag is the SHA-256 of the content, a matching If-None-Match gets 304
+def test_strong_etag(client, audio):
+    response = client.get("/audio", query_string={"fileName": "test"})
+    etag, weak = response.get_etag()
+    assert etag == hashlib.sha256(audio).hexdigest() and not weak
+    cached = client.get("/audio", query_string={"fileName": "test"}, headers={"If-None-Match": f'"{etag}"'})
+    assert cached.status_code == 304 and cached.data == b""
+
+
+# Only the browser may keep the patient's voicemail
+def test_cache_control(client, audio):
+    cache_control = client.get("/audio", query_string={"fileName": "test"}).cache_control
+    assert cache_control.private and not cache_control.public
+    assert cache_control.immutable and cache_control.max_age > 0
+
+
+@pytest.mark.parametrize("name", ["../../backend/app.py", "..", "x/../../secret", "..\\secret", ""])
+def test_path_traversal_is_rejected(client, audio, name):
+    assert client.get("/audio", query_string={"fileName": name}).status_code == 400
+
+
+def test_x_accel_redirect(client, audio, monkeypatch):
+    monkeypatch.setitem(flask_app.config, "AUDIO_OFFLOAD", "x-accel-redirect")
+    response = client.get("/audio", query_string={"fileName": "test"})
+    assert response.headers["X-Accel-Redirect"] == "/protected-audio/audio_test.mp3"
+    assert response.data == b""
+    assert response.get_etag()[0] == hashlib.sha256(audio).hexdigest()
+
+
+# Names of stored voicemails contain the "@" of the Message-ID, the filename is quoted like send_file does it
+def test_x_accel_redirect_quotes_filename(client, audio, monkeypatch):
+    shutil.copy("tmp/audio_test.mp3", "tmp/audio_m1@praxis.de.mp3")
+    try:
+        direct = client.get("/audio", query_string={"fileName": "m1@praxis.de"})
+        monkeypatch.setitem(flask_app.config, "AUDIO_OFFLOAD", "x-accel-redirect")
+        offloaded = client.get("/audio", query_string={"fileName": "m1@praxis.de"})
+    finally:
+        os.remove("tmp/audio_m1@praxis.de.mp3")
+    assert offloaded.headers["Content-Disposition"] == 'inline; filename="audio_m1@praxis.de.mp3"'
+    assert offloaded.headers["Content-Disposition"] == direct.headers["Content-Disposition"]
@@ -0,0 +1,88 @@
+import datetime
+import pytest
+from backend.database import Email
+
+
+@pytest.fixture()
+def versioned_emails(app, database):
+    db = database
+    with app.app_context():
+        for id in ("1", "2"):
+            db.session.add(
+                Email(
+                    id=id,
+                    absender="voicemail@praxis.de",
+                    subject="subject",
+                    status="unbearbeitet",
+                    empfangsdatum=datetime.datetime.now(),
+                    fileName=f"audio_{id}.mp3",
+                    transkript=f"transkript {id}",
+                    rating=0,
+                )
+            )
+        db.session.commit()
+    yield
+    with app.app_context():
+        db.session.query(Email).delete()
+        db.session.commit()
+
+
+def changes(client, since):
+    return client.get("/changes", query_string={"since": since}).get_json()
+
+
+# Only rows written after the given version are returned
+def test_changes_since_version(client, versioned_emails):
+    full = changes(client, 0)
+    assert {row["id"] for row in full["changed"]} >= {"1", "2"}
+
+    assert changes(client, full["version"])["changed"] == []
+
+    client.post("/update", query_string={"id": "2", "column": "rating", "value": "4"})
+    delta = changes(client, full["version"])
+    assert [row["id"] for row in delta["changed"]] == ["2"]
+    assert delta["changed"][0]["rating"] == 4
+    assert delta["version"] > full["version"]
+
+
+# Deleted rows are reported as tombstones
+def test_changes_reports_deletes(client, versioned_emails):
+    version = changes(client, 0)["version"]
+    client.post("/delete", query_string={"id": "1"})
+    delta = changes(client, version)
+    assert delta["deleted"] == ["1"]
+    assert delta["changed"] == []
+
+
+# ORM writes, like the ones of the LLM_Manager, bump the version as well
+def test_orm_write_bumps_version(app, client, database, versioned_emails):
+    version = changes(client, 0)["version"]
+    with app.app_context():
+        email = database.session.query(Email).filter(Email.id == "1").first()
+        email.status = "abfertigung"
+        database.session.commit()
+    delta = changes(client, version)
+    assert [(row["id"], row["status"]) for row in delta["changed"]] == [("1", "abfertigung")]
+
+
+# An unchanged table answers If-None-Match with 304
+def test_all_etag(client, versioned_emails):
+    response = client.get("/all")
+    etag = response.headers["ETag"]
+    assert response.status_code == 200
+
+    response = client.get("/all", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+
+    # Other parameters, other ETag
+    response = client.get("/all", query_string={"limit": 1}, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+
+    client.post("/update", query_string={"id": "1", "column": "rating", "value": "3"})
+    response = client.get("/all", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+
+
+def test_changes_invalid_since(client):
+    assert client.get("/changes", query_string={"since": "gestern"}).status_code == 400
@@ -0,0 +1,159 @@
+import datetime
+import os
+import time
+import pytest
+from backend.app import app as flask_app, llm_manager
+from pcm_cache import pcm_cache_path
+
+from backend.database import (
+    Email,
+    ProcessingJob,
+    claim_jobs,
+    db,
+    enqueue_waiting_emails,
+    reclaim_expired_jobs,
+    requeue_job,
+)
+
+EXTRACTED = {"vorname": "Max", "nachname": "Mustermann", "anfragetyp": "Rezept"}
+
+
+@pytest.fixture()
+def queued_email(app, database, monkeypatch):
+    db = database
+    with app.app_context():
+        db.session.add(
+            Email(
+                id="cp",
+                absender="voicemail@praxis.de",
+                subject="subject",
+                status="processed",
+                empfangsdatum=datetime.datetime.now(),
+                fileName="test.mp3",
+                rating=0,
+            )
+        )
+        db.session.commit()
+        enqueue_waiting_emails()
+    calls = {"transcribe": 0, "llm": []}
+
+    def transcribe(path, audio_hash=None):
+        calls["transcribe"] += 1
+        return {"transcription": "Ich brauche ein Rezept", "dauer": 1.0, "model_used": "tiny"}
+
+    monkeypatch.setattr(llm_manager, "transcribe_audio", transcribe)
+    monkeypatch.setattr("llm_manager.ensure_pcm_cache", lambda path, dtype: path + ".pcm.npy")
+    monkeypatch.setattr(llm_manager, "max_attempts", 3)
+    yield calls
+    with app.app_context():
+        db.session.query(ProcessingJob).delete()
+        db.session.query(Email).delete()
+        db.session.commit()
+
+
+def run_job(app, monkeypatch, calls, llm_result):
+    def fake_llm(text, client=None, timeout=None):
+        calls["llm"].append(text)
+        return llm_result
+
+    monkeypatch.setattr("llm_manager.run_llm", fake_llm)
+    with app.app_context():
+        ProcessingJob.query.update({"available_at": datetime.datetime.utcnow()})
+        db.session.commit()
+        assert claim_jobs(llm_manager.worker_id, 1, 60, 3) == [("cp", 10)]
+    result = llm_manager._transcribe_email("cp")
+    if result is not None:
+        llm_manager._extract_email("cp", result)
+
+
+def job_and_email(app):
+    with app.app_context():
+        job = ProcessingJob.query.filter_by(email_id="cp").first()
+        email = Email.query.filter_by(id="cp").first()
+        return job.stage, job.checkpoint, job.available_at, email.status, email.transkript
+
+
+# A failed LLM step keeps the committed transcription and retries after a backoff
+def test_llm_failure_resumes_without_transcribing(app, queued_email, monkeypatch):
+    calls = queued_email
+    run_job(app, monkeypatch, calls, None)
+    stage, checkpoint, available_at, status, transkript = job_and_email(app)
+    assert (stage, checkpoint, status) == ("queued", "transcribed", "processed")
+    assert transkript == "Ich brauche ein Rezept"
+    assert available_at > datetime.datetime.utcnow()
+
+    run_job(app, monkeypatch, calls, EXTRACTED)
+    stage, checkpoint, _, status, _ = job_and_email(app)
+    assert (stage, checkpoint, status) == ("done", "stored", "unbearbeitet")
+    assert calls["transcribe"] == 1
+    assert calls["llm"] == ["Ich brauche ein Rezept"] * 2
+    with app.app_context():
+        assert Email.query.filter_by(id="cp").first().vorname == "Max"
+
+
+# The job fails once the step used up its attempts
+def test_step_fails_after_max_attempts(app, queued_email, monkeypatch):
+    calls = queued_email
+    for _ in range(3):
+        run_job(app, monkeypatch, calls, None)
+    stage, checkpoint, _, status, _ = job_and_email(app)
+    assert (stage, checkpoint, status) == ("failed", "transcribed", "fehlgeschlagen")
+    assert calls["transcribe"] == 1
+
+
+# Reprocessing a finished email keeps the decoded audio and runs the transcription and extraction again
+def test_reprocess_restarts_after_decode(app, queued_email, monkeypatch):
+    calls = queued_email
+    run_job(app, monkeypatch, calls, EXTRACTED)
+    with app.app_context():
+        assert requeue_job("cp", priority=10)
+    assert job_and_email(app)[1] == "decoded"
+    run_job(app, monkeypatch, calls, EXTRACTED)
+    assert calls["transcribe"] == 2
+    assert job_and_email(app)[:2] == ("done", "stored")
+
+
+# The PCM cache is kept for the retries of the job and deleted when it finishes
+def test_pcm_cache_lives_until_the_job_finishes(app, queued_email, monkeypatch, tmp_path):
+    calls = queued_email
+    audio = tmp_path / "test.mp3"
+    audio.write_bytes(b"ID3 mp3")
+    cache = pcm_cache_path(str(audio))
+
+    def write_cache(path, dtype):
+        with open(pcm_cache_path(path), "wb") as file:
+            file.write(b"pcm")
+        return pcm_cache_path(path)
+
+    monkeypatch.setitem(flask_app.config, "UPLOAD_FOLDER", str(tmp_path))
+    monkeypatch.setattr("llm_manager.ensure_pcm_cache", write_cache)
+    run_job(app, monkeypatch, calls, None)
+    assert os.path.exists(cache)
+    run_job(app, monkeypatch, calls, EXTRACTED)
+    assert job_and_email(app)[0] == "done"
+    assert not os.path.exists(cache) and audio.exists()
+
+
+# A transcription longer than the lease keeps its job, the heartbeat renews the lease
+def test_lease_is_renewed_during_long_transcription(app, queued_email, monkeypatch):
+    calls = queued_email
+    seen = {}
+
+    def slow_transcribe(path, audio_hash=None):
+        time.sleep(1.0)
+        seen["reclaimed"] = reclaim_expired_jobs(3)
+        seen["claimed"] = claim_jobs("other-worker", 1, 60, 3)
+        return {"transcription": "Ich brauche ein Rezept", "dauer": 1.0, "model_used": "tiny"}
+
+    monkeypatch.setattr(llm_manager, "transcribe_audio", slow_transcribe)
+    monkeypatch.setattr(llm_manager, "lease_seconds", 0.3)
+    run_job(app, monkeypatch, calls, EXTRACTED)
+    assert seen == {"reclaimed": [], "claimed": []}
+    assert job_and_email(app)[:2] == ("done", "stored")
+
+
+# The backoff doubles per attempt up to the maximum
+def test_retry_delay():
+    assert llm_manager.retry_delay("extract", 1) == llm_manager.backoff["extract"]
+    assert llm_manager.retry_delay("extract", 3) == 4 * llm_manager.backoff["extract"]
+    assert llm_manager.retry_delay("extract", 50) == llm_manager.backoff_max
@@ -0,0 +1,48 @@
+import datetime
+import random
+import pytest
+from dataGenerator import generate, generate_row
+from audio_utils import mp3_duration
+
+from backend.database import Email
+
+
+@pytest.fixture()
+def cleanup(app, database):
+    yield
+    with app.app_context():
+        database.session.query(Email).delete()
+        database.session.commit()
+
+
+def rows(seed, count):
+    rng = random.Random(seed)
+    return [generate_row(rng, index, seed, datetime.datetime(2024, 1, 1), 365) for index in range(count)]
+
+
+# The same seed gives the same rows, another seed other rows
+def test_rows_are_reproducible():
+    assert rows(1, 50) == rows(1, 50)
+    assert rows(1, 50) != rows(2, 50)
+
+
+# Statuses and request types follow their weights, transcripts fit the column
+def test_distributions():
+    generated = rows(7, 2000)
+    done = sum(row["status"] == "bearbeitet" for row in generated) / len(generated)
+    rezept = sum(row["anfragetyp"] == "Rezept" for row in generated) / len(generated)
+    assert 0.6 < done < 0.8 and 0.55 < rezept < 0.75
+    assert {row["status"] for row in generated} <= {"bearbeitet", "unbearbeitet", "fehlgeschlagen"}
+    assert all(len(row["transkript"] or "") <= 2096 for row in generated)
+    assert all(3 <= row["dauer"] <= 180 for row in generated)
+
+
+# Rows are inserted in batches, a second run with the same seed only adds the missing ones
+def test_generate_inserts_batches(app, cleanup, tmp_path):
+    with app.app_context():
+        assert generate(25, seed=3, batch_size=10) == 25
+        assert generate(30, seed=3, batch_size=10, audio_dir=str(tmp_path)) == 5
+        assert Email.query.count() == 30
+        assert len({email.version for email in Email.query}) == 4
+        email = Email.query.filter_by(id="gen-3-29@praxis.de").first()
+    assert mp3_duration(str(tmp_path / email.fileName)) == pytest.approx(email.dauer, abs=0.1)
@@ -0,0 +1,49 @@
+from backend.app import broker as app_broker
+from backend.events import EventBroker
+
+
+# Every subscriber receives every event
+def test_fan_out():
+    broker = EventBroker()
+    first, second = broker.subscribe(), broker.subscribe()
+    broker.publish("status", {"id": "1", "status": "abfertigung"})
+    for subscription in (first, second):
+        event = subscription.get(timeout=1)
+        assert event.type == "status" and event.data["status"] == "abfertigung"
+    broker.unsubscribe(first)
+    assert broker.subscriber_count() == 1
+
+
+def test_encode():
+    event = EventBroker().publish("new", {"id": "1"})
+    assert event.encode() == 'id: 1\nevent: new\ndata: {"id": "1"}\n\n'
+
+
+# Reconnecting clients get the events after their Last-Event-ID
+def test_replay_after_last_event_id():
+    broker = EventBroker()
+    events = [broker.publish("status", {"n": n}) for n in range(5)]
+    subscription = broker.subscribe(last_event_id=events[2].id)
+    assert [subscription.get(timeout=1).data["n"] for _ in range(2)] == [3, 4]
+    assert subscription.get(timeout=0.01) is None
+
+
+# A subscriber that doesn't keep up is closed instead of blocking the publisher
+def test_slow_subscriber_is_closed():
+    broker = EventBroker(max_queue_size=2)
+    subscription = broker.subscribe()
+    for n in range(3):
+        broker.publish("status", {"n": n})
+    assert subscription.closed
+    assert broker.subscriber_count() == 0
+
+
+def test_events_route(client):
+    response = client.get("/events")
+    assert response.mimetype == "text/event-stream"
+    stream = iter(response.response)
+    assert next(stream).startswith(b"retry:")
+    app_broker.publish("status", {"id": "42", "status": "unbearbeitet"})
+    chunk = next(stream)
+    assert b"event: status" in chunk and b'"id": "42"' in chunk
+    response.close()
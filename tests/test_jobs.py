@@ -0,0 +1,134 @@
+import datetime
+import threading
+import pytest
+
+from backend.database import (
+    Email,
+    ProcessingJob,
+    claim_jobs,
+    enqueue_waiting_emails,
+    finish_job,
+    reclaim_expired_jobs,
+    release_job,
+    renew_lease,
+    requeue_job,
+    JOB_DONE,
+    JOB_FAILED,
+    JOB_QUEUED,
+    JOB_TRANSCRIBING,
+)
+
+
+@pytest.fixture()
+def waiting_emails(app, database):
+    db = database
+    with app.app_context():
+        for id, status in (("1", "processed"), ("2", "processed"), ("3", "unbearbeitet")):
+            db.session.add(
+                Email(
+                    id=id,
+                    absender="voicemail@praxis.de",
+                    subject="subject",
+                    status=status,
+                    empfangsdatum=datetime.datetime.now(),
+                    fileName=f"audio_{id}.mp3",
+                    rating=0,
+                )
+            )
+        db.session.commit()
+    yield
+    with app.app_context():
+        db.session.query(ProcessingJob).delete()
+        db.session.query(Email).delete()
+        db.session.commit()
+
+
+def expire_leases(db):
+    past = datetime.datetime.utcnow() - datetime.timedelta(seconds=1)
+    db.session.query(ProcessingJob).update({"lease_expires_at": past})
+    db.session.commit()
+
+
+# Waiting emails get exactly one job, however often emailCheck runs
+def test_enqueue_waiting_emails(app, waiting_emails):
+    with app.app_context():
+        assert sorted(enqueue_waiting_emails()) == ["1", "2"]
+        assert enqueue_waiting_emails() == []
+        assert ProcessingJob.query.count() == 2
+
+
+# A leased job isn't claimed a second time, also not by concurrent workers
+def test_claim_is_exclusive(app, waiting_emails):
+    with app.app_context():
+        enqueue_waiting_emails()
+    claimed = []
+
+    def claim(owner):
+        with app.app_context():
+            claimed.extend(claim_jobs(owner, 2, 60, 3))
+
+    threads = [threading.Thread(target=claim, args=(f"worker-{i}",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(email_id for email_id, _ in claimed) == ["1", "2"]
+    with app.app_context():
+        assert claim_jobs("late", 2, 60, 3) == []
+
+
+# Manual jobs are claimed before scheduled ones
+def test_claim_orders_by_priority(app, waiting_emails):
+    with app.app_context():
+        enqueue_waiting_emails()
+        assert requeue_job("2", priority=0)
+        assert [email_id for email_id, _ in claim_jobs("a", 1, 60, 3)] == ["2"]
+
+
+# The job of a dead worker is claimed again once its lease expired
+def test_expired_lease_is_reclaimed(app, database, waiting_emails):
+    with app.app_context():
+        enqueue_waiting_emails()
+        claim_jobs("dead", 2, 60, 3)
+        assert renew_lease("1", "dead", 60, JOB_TRANSCRIBING)
+        Email.query.filter_by(id="1").first().status = "abfertigung"
+        database.session.commit()
+        expire_leases(database)
+
+        changed = reclaim_expired_jobs(3)
+        assert [email.id for email in changed] == ["1"]
+        assert Email.query.filter_by(id="1").first().status == "processed"
+        assert sorted(email_id for email_id, _ in claim_jobs("alive", 2, 60, 3)) == ["1", "2"]
+        # The dead worker can't continue with a job it lost
+        assert not renew_lease("1", "dead", 60)
+        assert ProcessingJob.query.filter_by(email_id="1").first().attempts == 2
+
+
+# A job which keeps losing its lease fails after max_attempts
+def test_job_fails_after_max_attempts(app, database, waiting_emails):
+    with app.app_context():
+        enqueue_waiting_emails()
+        for _ in range(2):
+            claim_jobs("w", 2, 60, 2)
+            expire_leases(database)
+        assert claim_jobs("w", 2, 60, 2) == []
+        reclaim_expired_jobs(2)
+        assert ProcessingJob.query.filter_by(email_id="1").first().stage == JOB_FAILED
+        assert Email.query.filter_by(id="1").first().status == "fehlgeschlagen"
+
+
+# Finished jobs stay closed until they are requeued, a leased job can't be requeued
+def test_finish_release_and_requeue(app, waiting_emails):
+    with app.app_context():
+        enqueue_waiting_emails()
+        claim_jobs("w", 2, 60, 3)
+        assert not requeue_job("1")
+        finish_job("1", "w")
+        release_job("2", "w")
+        assert ProcessingJob.query.filter_by(email_id="1").first().stage == JOB_DONE
+        assert ProcessingJob.query.filter_by(email_id="2").first().attempts == 0
+        assert [email_id for email_id, _ in claim_jobs("w", 2, 60, 3)] == ["2"]
+        assert requeue_job("1")
+        assert ProcessingJob.query.filter_by(email_id="1").first().stage == JOB_QUEUED
+        assert requeue_job("3")
+        assert ProcessingJob.query.count() == 3
@@ -0,0 +1,115 @@
+import datetime
+import pytest
+from backend.database import Email
+
+
+@pytest.fixture()
+def many_emails(app, database):
+    db = database
+    start = datetime.datetime(2025, 1, 1, 8, 0)
+    with app.app_context():
+        for i in range(25):
+            db.session.add(
+                Email(
+                    id=f"mail-{i:02d}",
+                    absender="voicemail@praxis.de",
+                    subject="subject",
+                    status="unbearbeitet" if i % 2 else "bearbeitet",
+                    # two emails per timestamp to exercise the id tie-breaker
+                    empfangsdatum=start + datetime.timedelta(hours=i // 2),
+                    anfragetyp="Rezept" if i % 3 else "Überweisung",
+                    fileName=f"audio_{i}.mp3",
+                    dauer=float(i),
+                    transkript=f"transkript {i}",
+                    rating=i % 5,
+                )
+            )
+        db.session.commit()
+    yield
+    with app.app_context():
+        db.session.query(Email).delete()
+        db.session.commit()
+
+
+def fetch_all_pages(client, **params):
+    ids = []
+    cursor = None
+    while True:
+        query = dict(params)
+        if cursor:
+            query["cursor"] = cursor
+        page = client.get("/all", query_string=query).get_json()
+        ids += [item["id"] for item in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return ids
+
+
+# Without parameters /all still returns the complete array
+def test_all_without_parameters(client, many_emails):
+    emails = client.get("/all").get_json()
+    assert len(emails) == 25
+    assert emails[0]["transkript"].startswith("transkript")
+
+
+# Walking the pages returns every email exactly once, newest first
+def test_keyset_pages(client, many_emails):
+    ids = fetch_all_pages(client, limit=4)
+    assert len(ids) == 25 and len(set(ids)) == 25
+    assert ids[:3] == ["mail-24", "mail-23", "mail-22"]
+
+
+def test_ascending_sort(client, many_emails):
+    ids = fetch_all_pages(client, limit=7, sort="empfangsdatum")
+    assert ids == [f"mail-{i:02d}" for i in range(25)]
+
+
+# Emails without a date sort before all others, the cursor can point at one of them
+@pytest.mark.parametrize("sort", ["-empfangsdatum", "empfangsdatum"])
+def test_pages_with_missing_dates(app, database, client, many_emails, sort):
+    with app.app_context():
+        for i in (3, 4, 10):
+            database.session.get(Email, f"mail-{i:02d}").empfangsdatum = None
+        database.session.commit()
+    ids = fetch_all_pages(client, limit=2, sort=sort)
+    undated = ["mail-03", "mail-04", "mail-10"]
+    dated = [f"mail-{i:02d}" for i in range(25) if f"mail-{i:02d}" not in undated]
+    expected = undated + dated
+    assert ids == (expected if sort == "empfangsdatum" else expected[::-1])
+
+
+def test_sort_by_other_column(client, many_emails):
+    ids = fetch_all_pages(client, limit=3, sort="-dauer")
+    assert ids == [f"mail-{i:02d}" for i in reversed(range(25))]
+
+
+def test_filters(client, many_emails):
+    page = client.get(
+        "/all",
+        query_string={"status": "unbearbeitet", "anfragetyp": "Rezept", "limit": 100},
+    ).get_json()
+    assert page["items"]
+    assert all(
+        item["status"] == "unbearbeitet" and item["anfragetyp"] == "Rezept"
+        for item in page["items"]
+    )
+
+    page = client.get(
+        "/all", query_string={"from": "2025-01-01T10:00", "to": "2025-01-01T11:00"}
+    ).get_json()
+    assert sorted(item["id"] for item in page["items"]) == ["mail-04", "mail-05"]
+
+
+# The transkript is only sent when requested
+def test_projection(client, many_emails):
+    page = client.get("/all", query_string={"limit": 1}).get_json()
+    assert "transkript" not in page["items"][0]
+    page = client.get("/all", query_string={"limit": 1, "fields": "transkript"}).get_json()
+    assert set(page["items"][0]) == {"id", "transkript"}
+
+
+def test_invalid_parameters(client, many_emails):
+    assert client.get("/all", query_string={"fields": "password"}).status_code == 400
+    assert client.get("/all", query_string={"sort": "transkript"}).status_code == 400
+    assert client.get("/all", query_string={"cursor": "garbage"}).status_code == 400
+    assert client.get("/all", query_string={"limit": 0}).status_code == 400
@@ -0,0 +1,73 @@
+import pytest
+from backend.llm import run_llm
+from backend.llm_client import (
+    FallbackClient,
+    LLMClientError,
+    LLMUnavailableError,
+    OllamaHTTPClient,
+)
+from .fake_ollama import FakeOllamaServer, DEFAULT_RESPONSE
+
+
+class StaticClient:
+    def __init__(self, text):
+        self.text = text
+        self.calls = 0
+
+    def generate(self, prompt, timeout=None):
+        self.calls += 1
+        return self.text
+
+    def close(self):
+        pass
+
+
+# The extracted JSON of the stand-in server is returned as dict
+def test_run_llm_over_http():
+    with FakeOllamaServer() as server:
+        client = OllamaHTTPClient(base_url=server.url, keep_alive="10m")
+        result = run_llm("Hallo, hier ist Josef Müller", client=client)
+        assert result == DEFAULT_RESPONSE
+        request = server.requests[0]
+        assert request["keep_alive"] == "10m"
+        assert request["stream"] is False
+        assert "Josef Müller" in request["prompt"]
+
+
+# Several requests reuse the same pooled connection
+def test_connection_is_reused():
+    with FakeOllamaServer() as server:
+        client = OllamaHTTPClient(base_url=server.url)
+        for _ in range(5):
+            run_llm("Transkription", client=client)
+        assert len(server.requests) == 5
+        assert len(server.client_ports) == 1
+
+
+# A slow server runs into the per-request timeout, the overloaded server doesn't get the prompt again
+def test_timeout_does_not_use_fallback():
+    with FakeOllamaServer(latency=0.5) as server:
+        fallback = StaticClient('{"vorname": "Fallback"}')
+        client = FallbackClient(OllamaHTTPClient(base_url=server.url), fallback)
+        assert run_llm("Transkription", client=client, timeout=0.1) is None
+        assert fallback.calls == 0
+
+
+# Only a refused connection is answered by the fallback client
+def test_refused_connection_uses_fallback():
+    fallback = StaticClient('{"vorname": "Fallback"}')
+    client = FallbackClient(OllamaHTTPClient(base_url="http://127.0.0.1:9"), fallback)
+    assert run_llm("Transkription", client=client, timeout=1) == {"vorname": "Fallback"}
+    assert fallback.calls == 1
+
+
+def test_unreachable_server_raises():
+    client = OllamaHTTPClient(base_url="http://127.0.0.1:9")
+    with pytest.raises(LLMUnavailableError):
+        client.generate("prompt", timeout=1)
+
+
+def test_invalid_json_returns_none():
+    with FakeOllamaServer(response="Das ist kein JSON") as server:
+        client = OllamaHTTPClient(base_url=server.url)
+        assert run_llm("Transkription", client=client) is None
@@ -0,0 +1,165 @@
+import email
+import hashlib
+import pytest
+from email.mime.message import MIMEMessage
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from backend.database import Email, SeenMessage, ingest_emails
+from backend.emailLoader import MailLoader
+from .fake_pop3 import FakePOP3Server, build_voicemail
+
+
+@pytest.fixture()
+def sync_cleanup(app, database):
+    db = database
+    yield
+    with app.app_context():
+        db.session.query(SeenMessage).delete()
+        db.session.query(Email).delete()
+        db.session.commit()
+
+
+def load(server, tmp_path, store=True, **options):
+    """Sync like emailCheck: store the emails, then remember the UIDs."""
+    loader = MailLoader(mail_config={**server.mail_config(), **options}, savedir=str(tmp_path))
+    emails, seen = loader.load_emails()
+    if store:
+        ingest_emails(emails)
+    loader.save_seen(seen)
+    return loader, emails
+
+
+# Only messages which weren't retrieved before get downloaded
+def test_incremental_sync(app, tmp_path, sync_cleanup):
+    messages = [("uid-1", build_voicemail("m1")), ("uid-2", build_voicemail("m2"))]
+    with FakePOP3Server(messages) as server, app.app_context():
+        _, emails = load(server, tmp_path)
+        assert sorted(mail.id for mail in emails) == ["m1@praxis.de", "m2@praxis.de"]
+        assert server.count("RETR") == 2
+        assert (tmp_path / "audio_m1@praxis.de.mp3").exists()
+
+        _, emails = load(server, tmp_path)
+        assert emails == []
+        assert server.count("RETR") == 2
+
+        server.messages.append(("uid-3", build_voicemail("m3")))
+        loader, emails = load(server, tmp_path)
+        assert [mail.id for mail in emails] == ["m3@praxis.de"]
+        assert server.count("RETR") == 3
+        assert loader.stats["total"] == 3 and loader.stats["new"] == 1
+
+
+# Stored messages are removed from the mailbox on the next sync
+def test_delete_after_ingest(app, database, tmp_path, sync_cleanup):
+    with FakePOP3Server([("uid-1", build_voicemail("m1"))]) as server, app.app_context():
+        load(server, tmp_path, DELETE_AFTER_INGEST="true")
+        assert server.count("DELE") == 0
+
+        loader, _ = load(server, tmp_path, DELETE_AFTER_INGEST="true")
+        assert loader.stats["deleted"] == 1
+        assert server.messages == []
+
+        # The uid of the deleted message is forgotten on the following sync
+        load(server, tmp_path, DELETE_AFTER_INGEST="true")
+        assert database.session.query(SeenMessage).count() == 0
+
+
+# Messages which were never stored stay in the mailbox and are retrieved again
+def test_delete_keeps_unstored_messages(app, tmp_path, sync_cleanup):
+    with FakePOP3Server([("uid-1", build_voicemail("m1"))]) as server, app.app_context():
+        load(server, tmp_path, store=False, DELETE_AFTER_INGEST="true")
+        load(server, tmp_path, store=False, DELETE_AFTER_INGEST="true")
+        assert server.count("DELE") == 0
+        assert len(server.messages) == 1
+        assert server.count("RETR") == 2
+
+
+# A failed insert doesn't mark the messages as seen, the next sync downloads them again
+def test_failed_ingest_keeps_messages_unseen(app, database, tmp_path, sync_cleanup, monkeypatch):
+    monkeypatch.setattr(database.session, "execute", fail_execute(database.session.execute))
+    with FakePOP3Server([("uid-1", build_voicemail("m1"))]) as server, app.app_context():
+        load(server, tmp_path)
+        assert database.session.query(SeenMessage).count() == 0
+        monkeypatch.undo()
+        _, emails = load(server, tmp_path)
+        assert [mail.id for mail in emails] == ["m1@praxis.de"]
+        assert server.count("RETR") == 2
+        assert database.session.query(Email).count() == 1
+        assert database.session.query(SeenMessage).count() == 1
+
+
+def fail_execute(execute):
+    def run(statement, *args, **kwargs):
+        if getattr(statement, "is_insert", False) and statement.table.name == "email":
+            raise RuntimeError("disk full")
+        return execute(statement, *args, **kwargs)
+
+    return run
+
+
+# Servers without UIDL still work, every message is retrieved
+def test_without_uidl(app, tmp_path, sync_cleanup):
+    with FakePOP3Server([("uid-1", build_voicemail("m1"))], support_uidl=False) as server, app.app_context():
+        load(server, tmp_path)
+        _, emails = load(server, tmp_path)
+        assert [mail.id for mail in emails] == ["m1@praxis.de"]
+        assert server.count("RETR") == 2
+
+
+# Messages failing the allow-lists are never retrieved and counted as skipped
+def test_header_prefilter(app, tmp_path, sync_cleanup):
+    messages = [
+        ("uid-1", build_voicemail("m1")),
+        ("uid-2", build_voicemail("m2", sender="Newsletter <news@shop.de>")),
+        ("uid-3", build_voicemail("m3", subject="Rechnung")),
+    ]
+    with FakePOP3Server(messages) as server, app.app_context():
+        options = {"ALLOWED_SENDERS": "@praxis.de", "ALLOWED_SUBJECTS": "Sprachnachricht"}
+        loader, emails = load(server, tmp_path, **options)
+        assert [mail.id for mail in emails] == ["m1@praxis.de"]
+        assert server.commands.count("RETR 1") == 1
+        assert server.count("RETR") == 1
+        assert server.count("TOP") == 3
+        assert loader.stats["skipped"] == 2
+
+        # Skipped messages aren't checked again
+        load(server, tmp_path, **options)
+        assert server.count("TOP") == 3
+
+
+def mp3_frames(count):
+    # MPEG 1 Layer III, 128 kbps, 44.1 kHz frames of 417 bytes
+    return b"".join(b"\xff\xfb\x90\x00" + bytes([i % 256]) * 413 for i in range(count))
+
+
+# The attachment is decoded into the file, hash and duration are computed on the way
+def test_streamed_attachment(app, tmp_path, sync_cleanup):
+    audio = mp3_frames(200)
+    with FakePOP3Server([("uid-1", build_voicemail("m1", audio=audio))]) as server, app.app_context():
+        loader, emails = load(server, tmp_path)
+        saved = (tmp_path / "audio_m1@praxis.de.mp3").read_bytes()
+        assert saved == audio
+        info = loader.attachments["m1@praxis.de"]
+        assert info["sha256"] == hashlib.sha256(audio).hexdigest()
+        assert info["size"] == len(audio)
+        assert info["duration"] == pytest.approx(200 * 1152 / 44100)
+        assert emails[0].dauer == pytest.approx(info["duration"])
+        assert emails[0].telefonnummer == "01771234567"
+        assert not list(tmp_path.glob("*.part"))
+
+
+# Attachments inside a forwarded message are found as well
+def test_forwarded_attachment(app, tmp_path, sync_cleanup):
+    audio = mp3_frames(10)
+    inner = email.message_from_bytes(build_voicemail("inner", audio=audio))
+    outer = MIMEMultipart()
+    outer["From"] = "Praxis <praxis@praxis.de>"
+    outer["Subject"] = "WG: Neue Sprachnachricht"
+    outer["Date"] = inner["Date"]
+    outer["Message-ID"] = "<fwd@praxis.de>"
+    outer.attach(MIMEText("Weitergeleitet"))
+    outer.attach(MIMEMessage(inner))
+    with FakePOP3Server([("uid-1", outer.as_bytes())]) as server, app.app_context():
+        _, emails = load(server, tmp_path)
+        assert emails[0].fileName == "audio_fwd@praxis.de.mp3"
+        assert (tmp_path / "audio_fwd@praxis.de.mp3").read_bytes() == audio
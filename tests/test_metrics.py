@@ -0,0 +1,43 @@
+import pytest
+from backend.metrics import Counter, Histogram, Registry
+
+
+def test_histogram_exposition():
+    registry = Registry()
+    histogram = registry.register(Histogram("job_seconds", "Job time.", ["stage"], buckets=(0.1, 1)))
+    histogram.observe(0.05, stage="llm")
+    histogram.observe(0.1, stage="llm")
+    histogram.observe(5, stage="llm")
+    lines = registry.expose().splitlines()
+    assert lines[:2] == ["# HELP job_seconds Job time.", "# TYPE job_seconds histogram"]
+    assert 'job_seconds_bucket{stage="llm",le="0.1"} 2' in lines
+    assert 'job_seconds_bucket{stage="llm",le="1.0"} 2' in lines
+    assert 'job_seconds_bucket{stage="llm",le="+Inf"} 3' in lines
+    assert 'job_seconds_sum{stage="llm"} 5.15' in lines
+    assert 'job_seconds_count{stage="llm"} 3' in lines
+
+
+def test_counter_and_labels():
+    registry = Registry()
+    counter = registry.register(Counter("failures_total", "Failures.", ["reason"]))
+    counter.inc(reason='bad "json"')
+    counter.inc(2, reason='bad "json"')
+    assert counter.value(reason='bad "json"') == 3
+    assert 'failures_total{reason="bad \\"json\\""} 3' in registry.expose()
+    with pytest.raises(ValueError):
+        counter.inc(other="x")
+    with pytest.raises(ValueError):
+        registry.register(Counter("failures_total", "Again."))
+
+
+# The endpoint serves the stage metrics, including the latency of the requests themselves
+def test_metrics_endpoint(client):
+    client.get("/queue-status")
+    response = client.get("/metrics")
+    text = response.data.decode()
+    assert response.status_code == 200
+    assert response.content_type.startswith("text/plain; version=0.0.4")
+    assert "# TYPE praxis_transcription_real_time_factor histogram" in text
+    assert "# TYPE praxis_llm_json_parse_failures_total counter" in text
+    assert 'praxis_http_request_seconds_count{endpoint="get_queue_status",method="GET",status="200"}' in text
+    assert "# TYPE praxis_db_commit_seconds histogram" in text
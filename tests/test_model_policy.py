@@ -0,0 +1,44 @@
+import pytest
+from backend.model_policy import AdaptiveModelSelector, DEFAULT_RTF
+
+
+# Without a backlog the primary model is used
+def test_idle_uses_primary():
+    selector = AdaptiveModelSelector("small", target_latency=60)
+    assert selector.candidates() == ["small", "base", "tiny"]
+    assert selector.choose(30, queue_depth=0)[0] == "small"
+
+
+# A growing backlog steps down the ladder, the fastest model is the last resort
+def test_backlog_drops_to_faster_models():
+    selector = AdaptiveModelSelector("small", target_latency=60)
+    # 30s of audio: small needs 18s, base 6s and tiny 3s per voicemail
+    assert selector.drain_time("small", 30, queue_depth=3) == pytest.approx(72)
+    assert selector.choose(30, queue_depth=3)[0] == "base"
+    assert selector.choose(30, queue_depth=12)[0] == "tiny"
+    model, reason = selector.choose(30, queue_depth=100)
+    assert model == "tiny" and reason.startswith("behind")
+
+
+# More workers share the backlog
+def test_workers_share_backlog():
+    selector = AdaptiveModelSelector("small", target_latency=60, workers=4)
+    assert selector.choose(30, queue_depth=3)[0] == "small"
+
+
+# Observed real-time factors replace the defaults
+def test_observed_rtf_changes_the_choice():
+    selector = AdaptiveModelSelector("small", target_latency=60)
+    assert selector.observe("small", 30, 3) == 0.1
+    assert selector.real_time_factor("small") == 0.1
+    assert selector.real_time_factor("base") == DEFAULT_RTF["base"]
+    assert selector.choose(30, queue_depth=10)[0] == "small"
+    selector.observe("small", 30, 60)
+    assert 0.1 < selector.real_time_factor("small") < 2
+    assert selector.observe("small", 0, 1) is None
+
+
+# Variants rank like their family, the primary model is never exceeded
+def test_model_variants():
+    assert AdaptiveModelSelector("large-v3").candidates() == ["large-v3", "medium", "small", "base", "tiny"]
+    assert AdaptiveModelSelector("tiny").candidates() == ["tiny"]
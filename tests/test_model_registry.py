@@ -0,0 +1,129 @@
+import threading
+import time
+from backend.model_registry import ModelRegistry
+
+
+class FakeModel:
+    def __init__(self, name):
+        self.name = name
+
+
+def counting_loader(calls, delay=0.0):
+    def load(name):
+        calls.append(name)
+        time.sleep(delay)
+        return FakeModel(name)
+
+    return load
+
+
+# A model is only loaded once and then shared
+def test_model_loaded_once():
+    calls = []
+    registry = ModelRegistry(loader=counting_loader(calls))
+    first = registry.get("tiny")
+    second = registry.get("tiny")
+    assert first is second
+    assert calls == ["tiny"]
+
+
+# Concurrent threads asking for the same model wait for a single load
+def test_concurrent_get_loads_once():
+    calls = []
+    registry = ModelRegistry(loader=counting_loader(calls, delay=0.05))
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(registry.get("base")))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert calls == ["base"]
+    assert all(model is results[0] for model in results)
+
+
+# The least recently used model gets evicted when the memory budget is exceeded
+def test_lru_eviction_under_budget():
+    calls = []
+    registry = ModelRegistry(loader=counting_loader(calls), memory_budget_mb=250)
+    registry.get("tiny")
+    registry.get("base")
+    registry.get("tiny")
+    registry.get("base")
+    assert calls == ["tiny", "base"]
+    registry.get("tiny")
+    registry.get("small")
+    assert registry.loaded_models() == ["small"]
+
+
+# Models unused for longer than the TTL are dropped
+def test_idle_ttl_eviction():
+    registry = ModelRegistry(loader=counting_loader([]), idle_ttl=0.05)
+    registry.get("tiny")
+    time.sleep(0.1)
+    registry.evict_idle()
+    assert registry.loaded_models() == []
+
+
+def test_warm_loads_in_background():
+    calls = []
+    registry = ModelRegistry(loader=counting_loader(calls))
+    registry.warm("small").join()
+    assert registry.loaded_models() == ["small"]
+    registry.get("small")
+    assert calls == ["small"]
+
+
+# Switching the model in the tests must not start loading it
+def test_set_model_route_does_not_warm_under_test(monkeypatch):
+    from backend.app import return_app, llm_manager
+
+    warmed = []
+    monkeypatch.setattr(llm_manager.model_registry, "warm", warmed.append)
+    previous = llm_manager.get_transcription_model()
+    client = return_app().test_client()
+    assert client.post("/set-whisper-model", query_string={"model": "large"}).status_code == 200
+    assert warmed == []
+    llm_manager.set_transcription_models(previous, "tiny", warm=False)
+
+
+class HookedModel:
+    """Like Whisper, fails if two transcriptions run on the instance at once (shared kv-cache hooks)."""
+
+    def __init__(self, name):
+        self.name = name
+        self.running = 0
+        self.lock = threading.Lock()
+
+    def transcribe(self, source, **options):
+        with self.lock:
+            self.running += 1
+            overlapping = self.running > 1
+        time.sleep(0.05)
+        with self.lock:
+            self.running -= 1
+        if overlapping:
+            raise RuntimeError("kv cache of another transcription")
+        return {"text": source}
+
+
+# Transcriptions on the same model take turns, each one gets the model alone
+def test_concurrent_transcriptions_use_model_alone():
+    from backend.transcribe import transcribe_audio
+
+    registry = ModelRegistry(loader=HookedModel)
+    results = []
+
+    def run(name):
+        results.append(transcribe_audio(name, "small", None, use_model=registry.use, audio=name))
+
+    threads = [threading.Thread(target=run, args=(f"voicemail-{i}",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(results) == 4 and all(result["success"] for result in results)
+    assert all(result["dauer"] < 0.2 for result in results)
+    assert sorted(result["transcription"] for result in results) == [f"voicemail-{i}" for i in range(4)]
@@ -0,0 +1,103 @@
+import datetime
+import os
+import pytest
+from backend.app import app as flask_app
+from opus_storage import OpusStorage
+from pcm_cache import pcm_cache_path
+
+from backend.database import Email
+
+
+def fake_transcode(audio_path, target_path, bitrate):
+    with open(target_path, "wb") as file:
+        # An eighth of the size, like 16 kbit/s Opus next to a 128 kbit/s mp3
+        file.write(b"OggS" + b" " * (os.path.getsize(audio_path) // 8 - 4))
+
+
+@pytest.fixture()
+def voicemails(app, database, tmp_path):
+    db = database
+    with app.app_context():
+        for id, status in (("1", "unbearbeitet"), ("2", "bearbeitet"), ("3", "processed"), ("4", "fehlgeschlagen")):
+            db.session.add(
+                Email(
+                    id=id,
+                    absender="voicemail@praxis.de",
+                    subject="subject",
+                    status=status,
+                    empfangsdatum=datetime.datetime.now(),
+                    fileName=f"audio_{id}.mp3",
+                    rating=0,
+                )
+            )
+            (tmp_path / f"audio_{id}.mp3").write_bytes(b"ID3 mp3 " * 100)
+        db.session.commit()
+    yield tmp_path
+    with app.app_context():
+        db.session.query(Email).delete()
+        db.session.commit()
+
+
+# Only finished voicemails get a copy, the originals are kept by default
+def test_compact_transcodes_finished_voicemails(app, voicemails):
+    storage = OpusStorage(str(voicemails), transcode=fake_transcode)
+    with app.app_context():
+        assert storage.compact() == {"transcoded": 2, "uncached": 0, "failed": 0}
+        assert storage.compact() == {"transcoded": 0, "uncached": 0, "failed": 0}
+    assert sorted(path.name for path in voicemails.glob("*.opus")) == ["audio_1.opus", "audio_2.opus"]
+    assert len(list(voicemails.glob("*.mp3"))) == 4
+
+
+def test_compact_batch_size(app, voicemails):
+    storage = OpusStorage(str(voicemails), batch_size=1, transcode=fake_transcode)
+    with app.app_context():
+        assert storage.compact()["transcoded"] == 1
+        assert storage.compact()["transcoded"] == 1
+
+
+def disk_bytes(folder):
+    return sum(path.stat().st_size for path in folder.iterdir())
+
+
+# Compaction removes the PCM caches of finished voicemails and keeps every mp3 for transcription,
+# the upload folder ends up at the mp3s plus their small Opus copies
+def test_compact_bounds_disk_use(app, voicemails):
+    mp3_bytes = disk_bytes(voicemails)
+    for id in ("1", "2", "3"):
+        # The int16 cache takes about 5.3 times the space of a 128 kbit/s mp3
+        with open(pcm_cache_path(str(voicemails / f"audio_{id}.mp3")), "wb") as file:
+            file.write(b"\0" * int(os.path.getsize(voicemails / f"audio_{id}.mp3") * 5.3))
+    before = disk_bytes(voicemails)
+    storage = OpusStorage(str(voicemails), transcode=fake_transcode)
+    with app.app_context():
+        assert storage.compact() == {"transcoded": 2, "uncached": 2, "failed": 0}
+    after = disk_bytes(voicemails)
+    assert after < before / 2
+    # Only the cache of the voicemail still waiting for its transcription is left
+    size = mp3_bytes // 4
+    assert after == 4 * size + 2 * (size // 8) + int(size * 5.3)
+    assert len(list(voicemails.glob("*.mp3"))) == 4
+    assert [path.name for path in voicemails.glob("*.pcm.npy")] == ["audio_3.mp3.pcm.npy"]
+
+
+def test_audio_negotiates_opus(app, voicemails, monkeypatch):
+    monkeypatch.setitem(flask_app.config, "UPLOAD_FOLDER", str(voicemails))
+    with app.app_context():
+        OpusStorage(str(voicemails), transcode=fake_transcode).compact()
+    client = flask_app.test_client()
+
+    firefox = client.get("/audio", query_string={"fileName": "1"}, headers={"Accept": "audio/webm,audio/ogg,audio/*;q=0.9"})
+    assert firefox.mimetype == "audio/ogg" and firefox.data.startswith(b"OggS")
+    assert "Accept" in firefox.vary
+    any_type = client.get("/audio", query_string={"fileName": "1"}, headers={"Accept": "*/*"})
+    assert any_type.mimetype == "audio/mpeg"
+    # The negotiated answer changes once the tier runs, so it is revalidated instead of kept
+    assert firefox.cache_control.no_cache and not firefox.cache_control.immutable
+    opus = client.get("/audio", query_string={"fileName": "1", "format": "opus"})
+    assert opus.mimetype == "audio/ogg" and opus.cache_control.immutable
+    # An explicit format is never substituted, the next <source> of the player is tried
+    assert client.get("/audio", query_string={"fileName": "3", "format": "opus"}).status_code == 404
+    os.remove(voicemails / "audio_2.mp3")
+    assert client.get("/audio", query_string={"fileName": "2", "format": "mp3"}).status_code == 404
+    assert client.get("/audio", query_string={"fileName": "2"}).mimetype == "audio/ogg"
+    assert client.get("/audio", query_string={"fileName": "1", "format": "flac"}).status_code == 400
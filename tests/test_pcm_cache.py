@@ -0,0 +1,69 @@
+import os
+import numpy as np
+import pytest
+from backend.pcm_cache import (
+    SAMPLE_RATE,
+    ensure_pcm_cache,
+    is_fresh,
+    load_pcm,
+    pcm_cache_path,
+    remove_pcm_cache,
+)
+
+
+@pytest.fixture()
+def audio(tmp_path):
+    path = tmp_path / "audio_1.mp3"
+    path.write_bytes(b"not really an mp3")
+    return str(path)
+
+
+class FakeDecoder:
+    """Counts the decodes and returns a second of a sine wave."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, path):
+        self.calls += 1
+        t = np.arange(SAMPLE_RATE, dtype=np.float32) / SAMPLE_RATE
+        return 0.5 * np.sin(2 * np.pi * 440 * t)
+
+
+# The audio is decoded once, later loads read the memory-mapped cache
+@pytest.mark.parametrize("dtype", ["int16", "float16", "float32"])
+def test_decodes_once(audio, dtype):
+    decode = FakeDecoder()
+    first = load_pcm(audio, dtype, decode=decode)
+    second = load_pcm(audio, dtype, decode=decode)
+    assert decode.calls == 1
+    assert first.dtype == np.float32 and len(first) == SAMPLE_RATE
+    np.testing.assert_allclose(first, decode(audio), atol=1e-3)
+    np.testing.assert_array_equal(first, second)
+    assert np.load(pcm_cache_path(audio)).dtype == np.dtype(dtype)
+
+
+# A float32 cache needs no conversion, the memory map itself is returned
+def test_float32_cache_is_memory_mapped(audio):
+    samples = load_pcm(audio, "float32", decode=FakeDecoder())
+    assert isinstance(samples, np.memmap) and not samples.flags.writeable
+    assert not isinstance(load_pcm(audio + ".int16", "int16", decode=FakeDecoder()), np.memmap)
+
+
+# Replacing the source file invalidates the cache
+def test_changed_source_is_decoded_again(audio):
+    decode = FakeDecoder()
+    ensure_pcm_cache(audio, decode=decode)
+    assert is_fresh(audio)
+    cache_mtime = os.stat(pcm_cache_path(audio)).st_mtime_ns
+    os.utime(audio, ns=(cache_mtime + 10**9, cache_mtime + 10**9))
+    assert not is_fresh(audio)
+    ensure_pcm_cache(audio, decode=decode)
+    assert decode.calls == 2
+
+
+def test_remove_pcm_cache(audio):
+    ensure_pcm_cache(audio, decode=FakeDecoder())
+    remove_pcm_cache(audio)
+    remove_pcm_cache(audio)
+    assert not os.path.exists(pcm_cache_path(audio))
@@ -1,6 +1,7 @@
 from email import message
 import re
 import time
+import datetime
 from .emailSender import send_mail
 import ast
 import pytest
@@ -146,3 +147,81 @@ def test_debug(app, client, db_setup):
     print(message)
     
     assert response.status_code == 200
+
+
+def test_queue_status(client):
+    response = client.get("/queue-status")
+    stats = response.get_json()
+
+    assert response.status_code == 200
+    assert "queued" in stats["transcription"] and "in_flight" in stats["llm"]
+
+
+def make_loaded_email(id):
+    return Email(
+        id=id,
+        absender="voicemail@praxis.de",
+        subject="Neue Sprachnachricht",
+        status="unbearbeitet",
+        empfangsdatum=datetime.datetime.now(),
+        anfragetyp="None",
+        fileName=f"audio_{id}.mp3",
+        dauer=1.0,
+        telefonnummer="0",
+        transkript="None",
+        rating=0,
+    )
+
+
+class FakeMailLoader:
+    loaded = []
+
+    def load_emails(self):
+        return list(FakeMailLoader.loaded), {}
+
+    def save_seen(self, newly_seen):
+        pass
+
+
+# Loading the same mails twice stores every mail once
+def test_email_deduplicates(app, client, database, email_cleanup, monkeypatch):
+    monkeypatch.setattr("backend.app.MailLoader", FakeMailLoader)
+    FakeMailLoader.loaded = [make_loaded_email("a"), make_loaded_email("b"), make_loaded_email("a")]
+    client.get("/email")
+    FakeMailLoader.loaded = [make_loaded_email("b"), make_loaded_email("c")]
+    response = client.get("/email")
+    assert b"success" in response.data
+    with app.app_context():
+        ids = sorted(row.id for row in database.session.query(Email).all())
+    assert ids == ["a", "b", "c"]
+
+
+# The scheduler stores new mails as "processed" and creates one job per mail
+def test_email_check_ingests_batch(app, database, email_cleanup, monkeypatch):
+    import backend.app
+    from backend.database import ProcessingJob
+
+    dispatched = []
+    monkeypatch.setattr("backend.app.MailLoader", FakeMailLoader)
+    monkeypatch.setattr(backend.app.llm_manager, "dispatch_jobs", lambda: dispatched.append(1))
+    FakeMailLoader.loaded = [make_loaded_email("a"), make_loaded_email("b")]
+    backend.app.emailCheck()
+    backend.app.emailCheck()
+    with app.app_context():
+        rows = database.session.query(Email).all()
+        assert sorted((row.id, row.status) for row in rows) == [("a", "processed"), ("b", "processed")]
+        jobs = database.session.query(ProcessingJob).all()
+        assert sorted((job.email_id, job.stage) for job in jobs) == [("a", "queued"), ("b", "queued")]
+        database.session.query(ProcessingJob).delete()
+        database.session.commit()
+    assert len(dispatched) == 2
+
+
+# SQLite runs in WAL mode and waits for locks instead of failing
+def test_sqlite_pragmas(app, database):
+    from sqlalchemy import text
+
+    with app.app_context():
+        assert database.session.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert database.session.execute(text("PRAGMA busy_timeout")).scalar() > 0
+        assert database.session.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
@@ -0,0 +1,112 @@
+import datetime
+import pytest
+from sqlalchemy import text
+
+from backend.database import Email, update_column, delete
+
+
+@pytest.fixture()
+def patients(app, database):
+    db = database
+    calls = [
+        ("1", "Josef", "Müller", "Ibuprofen", None, "Ich bräuchte ein neues Rezept für Ibuprofen."),
+        ("2", "Maria", "Schmidt", None, "Orthopäde", "Ich brauche eine Überweisung wegen Rückenschmerzen."),
+        ("3", "Ida", "Müllerová", "Insulin", None, "Hier ist Frau Müllerová, das Insulin ist alle."),
+        ("4", "Leon", "Becker", None, "HNO", "Herr Müller hat mich an den HNO verwiesen."),
+    ]
+    with app.app_context():
+        for id, vorname, nachname, medikament, fach, transkript in calls:
+            db.session.add(
+                Email(
+                    id=id,
+                    absender="voicemail@praxis.de",
+                    subject="subject",
+                    status="bearbeitet",
+                    empfangsdatum=datetime.datetime(2025, 1, int(id)),
+                    anfragetyp="Rezept" if medikament else "Überweisung",
+                    fileName=f"audio_{id}.mp3",
+                    vorname=vorname,
+                    nachname=nachname,
+                    nameMedikament=medikament,
+                    fachrichtung=fach,
+                    transkript=transkript,
+                    rating=0,
+                )
+            )
+        db.session.commit()
+    yield
+    with app.app_context():
+        db.session.query(Email).delete()
+        db.session.commit()
+
+
+def search(client, **params):
+    response = client.get("/search", query_string=params)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+# Words match as prefixes and without umlauts, a hit in the name ranks above one in the transcript
+def test_ranked_hits_with_snippets(client, patients):
+    page = search(client, q="muller")
+    ids = [item["id"] for item in page["items"]]
+    assert set(ids) == {"1", "3", "4"}
+    assert ids[-1] == "4"
+    assert page["items"][0]["score"] >= page["items"][-1]["score"]
+    assert "<mark>" in page["items"][0]["snippet"]
+    assert "transkript" not in page["items"][0]
+
+
+# All words must match, quotes search for a phrase
+def test_words_and_phrases(client, patients):
+    assert [item["id"] for item in search(client, q="Müller Ibu")["items"]] == ["1"]
+    assert [item["id"] for item in search(client, q='"neues Rezept"')["items"]] == ["1"]
+    assert search(client, q='"Rezept neues"')["items"] == []
+    # FTS5 syntax is treated as text
+    assert search(client, q="Müller OR NEAR(")["items"] == []
+
+
+# Pages continue at next_offset
+def test_pagination(client, patients):
+    first = search(client, q="Müller", limit=2)
+    assert len(first["items"]) == 2 and first["next_offset"] == 2
+    second = search(client, q="Müller", limit=2, offset=first["next_offset"])
+    assert second["next_offset"] is None
+    ids = [item["id"] for item in first["items"] + second["items"]]
+    assert sorted(ids) == ["1", "3", "4"]
+
+
+# Updates and deletions of emails reach the index through the triggers
+def test_index_follows_changes(app, client, patients):
+    with app.app_context():
+        update_column("2", "nameMedikament", "Metformin")
+        update_column("1", "transkript", "Bitte rufen Sie zurück.")
+        delete("3")
+    assert [item["id"] for item in search(client, q="metformin")["items"]] == ["2"]
+    assert [item["id"] for item in search(client, q="Ibuprofen")["items"]] == ["1"]
+    assert search(client, q='"neues Rezept"')["items"] == []
+    assert [item["id"] for item in search(client, q="Insulin")["items"]] == []
+    assert [item["id"] for item in search(client, q="rufen")["items"]] == ["1"]
+
+
+def test_invalid_parameters(client, patients):
+    assert client.get("/search").status_code == 400
+    assert client.get("/search", query_string={"q": "?!"}).status_code == 400
+    assert client.get("/search", query_string={"q": "Müller", "limit": 500}).status_code == 400
+
+
+# VACUUM and restored dumps may renumber the rowids of the email table, the index doesn't depend on them
+def test_index_survives_renumbered_rowids(app, database, client, patients):
+    with app.app_context():
+        delete("1")
+        database.session.execute(text("UPDATE email SET rowid = rowid + 100"))
+        database.session.commit()
+        with database.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            connection.execute(text("VACUUM"))
+    assert [item["id"] for item in search(client, q="HNO")["items"]] == ["4"]
+    insulin = search(client, q="Insulin")["items"]
+    assert [item["id"] for item in insulin] == ["3"]
+    assert "<mark>Insulin</mark>" in insulin[0]["snippet"]
+    with app.app_context():
+        update_column("3", "nameMedikament", "Metformin")
+    assert [item["id"] for item in search(client, q="metformin")["items"]] == ["3"]
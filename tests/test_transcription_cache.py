@@ -0,0 +1,48 @@
+from backend.transcription_cache import TranscriptionCache, hash_file
+
+OPTIONS = {"language": "de", "fp16": False}
+
+
+def test_hash_file(tmp_path):
+    audio = tmp_path / "audio.mp3"
+    audio.write_bytes(b"ID3 audio bytes")
+    other = tmp_path / "copy.mp3"
+    other.write_bytes(b"ID3 audio bytes")
+    assert hash_file(str(audio)) == hash_file(str(other))
+
+
+# A stored transcription is found again, with different models or options it's a miss
+def test_hit_and_miss(tmp_path):
+    cache = TranscriptionCache(str(tmp_path / "cache.db"))
+    key = TranscriptionCache.make_key("abc", "small", OPTIONS)
+    assert cache.get(key) is None
+    cache.put(key, "Hallo Praxis", 2.5, "small")
+    assert cache.get(key) == {
+        "transcription": "Hallo Praxis",
+        "dauer": 2.5,
+        "model_used": "small",
+    }
+    assert cache.get(TranscriptionCache.make_key("abc", "tiny", OPTIONS)) is None
+    assert cache.get(TranscriptionCache.make_key("abc", "small", {"language": "en"})) is None
+    assert cache.stats() == {"hits": 1, "misses": 3, "saved_seconds": 2.5}
+
+
+# The cache survives a restart
+def test_persistent(tmp_path):
+    path = str(tmp_path / "cache.db")
+    key = TranscriptionCache.make_key("abc", "small", OPTIONS)
+    TranscriptionCache(path).put(key, "Hallo Praxis", 1.0, "small")
+    assert TranscriptionCache(path).get(key)["transcription"] == "Hallo Praxis"
+
+
+# The least recently used entries are evicted when the size limit is reached
+def test_size_eviction(tmp_path):
+    cache = TranscriptionCache(str(tmp_path / "cache.db"), max_bytes=300)
+    keys = [TranscriptionCache.make_key(str(i), "small", OPTIONS) for i in range(3)]
+    cache.put(keys[0], "a" * 100, 1.0, "small")
+    cache.put(keys[1], "b" * 100, 1.0, "small")
+    cache.get(keys[0])
+    cache.put(keys[2], "c" * 100, 1.0, "small")
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[2]) is not None
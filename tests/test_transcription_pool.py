@@ -0,0 +1,91 @@
+import os
+import subprocess
+import sys
+import uuid
+from concurrent.futures import Future
+import numpy as np
+import pytest
+from backend.transcription_pool import TranscriptionProcessPool
+from backend.app import llm_manager
+from .fake_whisper import load_fake_model
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = TranscriptionProcessPool(2, 1, preload=["tiny"], loader=load_fake_model)
+    yield pool
+    pool.shutdown()
+
+
+# Transcriptions run in other processes with the torch thread budget, the results come back as futures
+def test_transcribes_in_worker_processes(pool):
+    futures = [pool.submit("voicemail.mp3", "small", "tiny", audio=np.zeros(16000 * i, dtype=np.float32)) for i in (1, 2, 3)]
+    results = [future.result(timeout=120) for future in futures]
+    assert all(result["success"] for result in results)
+    for seconds, result in zip((1, 2, 3), results):
+        model, samples, pid, threads = result["transcription"].split(":")
+        assert (model, int(samples), int(threads)) == ("small", 16000 * seconds, 1)
+        assert int(pid) != os.getpid()
+
+
+# The fallback model of transcribe_audio also works in the workers
+def test_fallback_in_worker(pool):
+    result = pool.submit("voicemail.mp3", "broken", "tiny", audio=np.zeros(100, dtype=np.float32)).result(timeout=120)
+    assert result["success"] and result["model_used"] == "tiny"
+
+
+class ImmediatePool:
+    """Resolves the futures right away, or fails them with error."""
+
+    def __init__(self, error=None):
+        self.error = error
+        self.calls = []
+
+    def submit(self, audio_file, model_size, retry_model, audio=None):
+        self.calls.append(model_size)
+        future = Future()
+        if self.error:
+            future.set_exception(self.error)
+        else:
+            future.set_result({"transcription": "Hallo", "dauer": 0.5, "model_used": model_size, "success": True, "error": None})
+        return future
+
+
+# In process mode the manager hands the samples to the pool and waits for the future
+def test_manager_uses_process_pool(monkeypatch):
+    pool = ImmediatePool()
+    monkeypatch.setattr(llm_manager, "transcription_processes", pool)
+    monkeypatch.setattr("llm_manager.load_pcm", lambda path, dtype: np.full(16000 * 3, 0.3, dtype=np.float32))
+    monkeypatch.setattr(llm_manager, "vad_options", None)
+    result = llm_manager.transcribe_audio("voicemail.mp3", audio_hash=uuid.uuid4().hex)
+    assert result["transcription"] == "Hallo" and len(pool.calls) == 1
+
+
+# A worker which died fails the transcription, the job is retried later
+def test_manager_handles_broken_worker(monkeypatch):
+    monkeypatch.setattr(llm_manager, "transcription_processes", ImmediatePool(RuntimeError("worker died")))
+    monkeypatch.setattr("llm_manager.load_pcm", lambda path, dtype: np.full(16000 * 3, 0.3, dtype=np.float32))
+    monkeypatch.setattr(llm_manager, "vad_options", None)
+    assert llm_manager.transcribe_audio("voicemail.mp3", audio_hash=uuid.uuid4().hex) is None
+
+
+# A spawned worker imports the started script again as __mp_main__, for "python app.py" that is
+# app.py itself: it must neither create a manager (with its own pool) nor start the scheduler
+def test_app_imported_by_spawned_worker(tmp_path):
+    backend = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+    script = (
+        "import runpy, threading\n"
+        f"module = runpy.run_path({os.path.join(backend, 'app.py')!r}, run_name='__mp_main__')\n"
+        "print(module['llm_manager'], 'scheduler' in module, threading.active_count())\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=tmp_path,
+        env={**os.environ, "PYTHONPATH": backend},
+        capture_output=True,
+        text=True,
+        timeout=300,
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split()[-3:] == ["None", "False", "1"]
+    assert not os.listdir(tmp_path)
@@ -0,0 +1,59 @@
+import uuid
+import numpy as np
+from backend.vad import SAMPLE_RATE, speech_segments, trim_silence
+from backend.app import llm_manager
+
+rng = np.random.default_rng(0)
+
+
+def silence(seconds):
+    return rng.normal(0, 0.001, int(seconds * SAMPLE_RATE)).astype(np.float32)
+
+
+def speech(seconds):
+    # Amplitude modulated noise, loud enough and with the ups and downs of syllables
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    envelope = 0.6 + 0.4 * np.sin(2 * np.pi * 4 * t)
+    return (rng.normal(0, 0.2, len(t)) * envelope).astype(np.float32)
+
+
+# Leading, trailing and long pauses are cut, the speech is kept
+def test_trims_to_speech_segments():
+    samples = np.concatenate([silence(2), speech(1), silence(3), speech(1.5), silence(4)])
+    trimmed, segments = trim_silence(samples)
+    assert len(segments) == 2
+    first, second = segments
+    assert first[0] <= 2 * SAMPLE_RATE <= first[1] and first[1] >= 3 * SAMPLE_RATE
+    assert second[0] <= 6 * SAMPLE_RATE and second[1] >= 7.5 * SAMPLE_RATE
+    assert 2.5 * SAMPLE_RATE <= len(trimmed) <= 4.5 * SAMPLE_RATE
+
+
+# Short pauses between words don't split the speech
+def test_short_pauses_are_kept():
+    samples = np.concatenate([speech(1), silence(0.3), speech(1)])
+    assert speech_segments(samples) == [(0, len(samples))]
+
+
+# Silence and single clicks contain no speech
+def test_silence_has_no_speech():
+    samples = silence(5)
+    samples[SAMPLE_RATE : SAMPLE_RATE + 160] = 0.9
+    trimmed, segments = trim_silence(samples)
+    assert segments == [] and len(trimmed) == 0
+
+
+# The manager passes only the speech to Whisper and reports both durations
+def test_manager_records_trimmed_duration(monkeypatch):
+    samples = np.concatenate([silence(3), speech(2), silence(5)])
+    seen = []
+
+    def fake_transcribe(path, model_size, retry_model, load_model=None, audio=None, use_model=None):
+        seen.append(len(audio))
+        return {"transcription": "Hallo", "dauer": 0.1, "model_used": model_size, "success": True, "error": None}
+
+    monkeypatch.setattr("llm_manager.load_pcm", lambda path, dtype: samples)
+    monkeypatch.setattr("llm_manager.transcribe_audio", fake_transcribe)
+    result = llm_manager.transcribe_audio("voicemail.mp3", audio_hash=uuid.uuid4().hex)
+    assert result["dauerOriginal"] == 10
+    assert 2 <= result["dauerGetrimmt"] < 3
+    assert seen == [int(result["dauerGetrimmt"] * SAMPLE_RATE)]
@@ -0,0 +1,78 @@
+import queue
+import threading
+import time
+import pytest
+from backend.worker_pool import ProcessingPool, PRIORITY_MANUAL, PRIORITY_SCHEDULED
+
+
+def make_pool(gate, transcribed, extracted, **kwargs):
+    def transcribe(key):
+        gate.wait()
+        transcribed.append(key)
+        return f"text {key}"
+
+    def extract(key, result):
+        extracted.append((key, result))
+
+    return ProcessingPool(transcribe, extract, **kwargs)
+
+
+# Jobs pass through both stages
+def test_jobs_run_through_both_stages():
+    gate = threading.Event()
+    gate.set()
+    transcribed, extracted = [], []
+    pool = make_pool(gate, transcribed, extracted)
+    assert pool.submit("a")
+    assert pool.submit("b")
+    pool.shutdown()
+    assert sorted(extracted) == [("a", "text a"), ("b", "text b")]
+    assert pool.stats()["active"] == 0
+
+
+# An email which is queued or in flight isn't accepted a second time
+def test_duplicate_submit_is_rejected():
+    gate = threading.Event()
+    transcribed, extracted = [], []
+    pool = make_pool(gate, transcribed, extracted)
+    assert pool.submit("a")
+    assert not pool.submit("a")
+    assert pool.is_active("a")
+    gate.set()
+    pool.shutdown()
+    assert transcribed == ["a"]
+    assert not pool.is_active("a")
+
+
+# A full queue pushes back instead of growing
+def test_full_queue_raises():
+    gate = threading.Event()
+    pool = make_pool(gate, [], [], max_queue_size=1)
+    pool.submit("running")
+    # wait until the worker picked up the first job
+    while pool.stats()["transcription"]["in_flight"] == 0:
+        time.sleep(0.01)
+    pool.submit("queued")
+    with pytest.raises(queue.Full):
+        pool.submit("overflow", block=False)
+    assert not pool.is_active("overflow")
+    stats = pool.stats()
+    assert stats["transcription"]["queued"] == 1
+    assert stats["transcription"]["in_flight"] == 1
+    gate.set()
+    pool.shutdown()
+
+
+# Manual jobs overtake scheduled ones
+def test_priority_order():
+    gate = threading.Event()
+    transcribed = []
+    pool = make_pool(gate, transcribed, [])
+    pool.submit("blocker")
+    while pool.stats()["transcription"]["in_flight"] == 0:
+        time.sleep(0.01)
+    pool.submit("scheduled", priority=PRIORITY_SCHEDULED)
+    pool.submit("manual", priority=PRIORITY_MANUAL)
+    gate.set()
+    pool.shutdown()
+    assert transcribed == ["blocker", "manual", "scheduled"]